@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import ActivityEvent
+
+@admin.register(ActivityEvent)
+class ActivityEventAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'user', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('kind', 'user__username')
+    raw_id_fields = ('user',)
+    date_hierarchy = 'created_at'
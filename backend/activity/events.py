@@ -0,0 +1,180 @@
+"""
+Structured activity events: who marked, unmarked or imported what.
+
+    emit('location.marked', user, name='Pune', level=2, parent='Maharashtra')
+
+emit() doesn't write anything. The event is queued once the surrounding
+transaction commits (straight away outside one; dropped with a
+rollback) into a bounded in-memory buffer. A daemon thread drains that
+buffer every ACTIVITY_FLUSH_INTERVAL seconds, or as soon as a full batch
+is waiting, and hands each batch to every sink in settings.ACTIVITY_SINKS
+(activity/sinks.py). A request pays for a dict and a lock, not for a
+write to stdout or an INSERT.
+
+Backpressure: when the sinks fall behind and the buffer is full, new
+events are dropped and counted rather than slowing requests down;
+stats() has the counters and the flusher logs a warning about every
+drop. Events are best effort. Anything that must not be lost belongs in
+the transaction itself, like MapChange.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    def __init__(self, sinks, capacity=10000, batch_size=500, interval=1.0):
+        self.sinks = sinks
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = deque()
+        self.lock = threading.Lock()  # guards buffer and counters
+        self.flushing = threading.Lock()  # one drain at a time, so batches stay in order
+        self.wake = threading.Event()
+        self.thread = None
+        self.counters = {'emitted': 0, 'dropped': 0, 'written': 0, 'failed': 0, 'batches': 0}
+        self.reported_drops = 0
+
+    def put(self, event):
+        """Queue `event` without blocking. False if the buffer was full and it was dropped"""
+        with self.lock:
+            full = len(self.buffer) >= self.capacity
+            if full:
+                self.counters['dropped'] += 1
+            else:
+                self.buffer.append(event)
+                self.counters['emitted'] += 1
+                full_batch = len(self.buffer) >= self.batch_size
+        if full:
+            get_metrics().inc('activity_events_total', (('outcome', 'dropped'),))
+            return False
+        if self.thread is None:
+            self.start()
+        if full_batch:
+            self.wake.set()
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='activity-flusher', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Activity flush failed")
+
+    def flush(self):
+        """Write out everything buffered so far, in batches"""
+        with self.flushing:
+            while True:
+                with self.lock:
+                    batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                    dropped = self.counters['dropped']
+                if dropped > self.reported_drops:
+                    logger.warning(
+                        "Activity buffer full: dropped %d events (%d in total)", dropped - self.reported_drops, dropped
+                    )
+                    self.reported_drops = dropped
+                if not batch:
+                    return
+                self.write(batch)
+
+    def write(self, batch):
+        failed = False
+        for sink in self.sinks:
+            try:
+                sink.write(batch)
+            except Exception:
+                failed = True
+                logger.exception("Activity sink %s failed on %d events", type(sink).__name__, len(batch))
+        outcome = 'failed' if failed else 'written'
+        with self.lock:
+            self.counters['batches'] += 1
+            self.counters[outcome] += len(batch)
+        get_metrics().inc('activity_events_total', (('outcome', outcome),), len(batch))
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'buffered': len(self.buffer), 'capacity': self.capacity}
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """This process's pipeline, or None when no sinks are configured"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None and settings.ACTIVITY_SINKS:
+                _pipeline = Pipeline(
+                    [import_string(path)() for path in settings.ACTIVITY_SINKS],
+                    capacity=settings.ACTIVITY_BUFFER_SIZE,
+                    batch_size=settings.ACTIVITY_BATCH_SIZE,
+                    interval=settings.ACTIVITY_FLUSH_INTERVAL,
+                )
+    return _pipeline
+
+
+def _forget_pipeline():
+    # A forked child (gunicorn worker, job process) has none of the parent's
+    # threads, and the parent still owns whatever is buffered: start afresh
+    global _pipeline, _pipeline_lock
+    _pipeline = None
+    _pipeline_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pipeline)
+
+
+def emit(kind, user=None, **data):
+    """
+    Record activity `kind` by `user` (a user, a user id or None) once the
+    current transaction commits. `data` must be JSON-serializable.
+    """
+    pipeline = get_pipeline()
+    if pipeline is None:
+        return
+    event = {
+        'kind': kind,
+        'at': timezone.now(),
+        'user_id': getattr(user, 'pk', user),
+        'username': getattr(user, 'username', None),
+        'data': data,
+    }
+    transaction.on_commit(lambda: pipeline.put(event))
+
+
+def flush():
+    """Write out this process's buffered events now (before exiting, in tests)"""
+    if _pipeline is not None:
+        _pipeline.flush()
+
+
+def stats():
+    """Counters for this process: emitted, dropped, written, failed, batches, buffered"""
+    pipeline = get_pipeline()
+    return pipeline.stats() if pipeline is not None else {}
+
+
+atexit.register(flush)
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import models
+
+
+class ActivityEvent(models.Model):
+    """
+    One structured activity event ('location.marked', ...), bulk-inserted
+    by activity.sinks.DatabaseSink. `data` holds the kind's fields.
+    """
+    kind = models.CharField(max_length=64)
+    # No FK constraint: a batch written after its user was deleted must not fail
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True,
+        db_constraint=False, related_name='activity_events',
+    )
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField()  # when it happened, not when it was written
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='activity_user_recent'),
+            models.Index(fields=['kind', '-created_at'], name='activity_kind_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} by user {self.user_id} at {self.created_at:%Y-%m-%d %H:%M:%S}"
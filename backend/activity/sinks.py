@@ -0,0 +1,55 @@
+"""
+Where activity events end up. settings.ACTIVITY_SINKS lists the classes;
+the flusher (activity/events.py) hands each one batches of event dicts:
+
+    {'kind': 'location.marked', 'at': datetime, 'user_id': 7,
+     'username': 'alice', 'data': {...}}
+
+Sinks run on the flusher thread, never in a request.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class Sink:
+    """Backend interface"""
+
+    def write(self, events):
+        """Persist a batch of events. Raising fails the whole batch"""
+        raise NotImplementedError
+
+
+class DatabaseSink(Sink):
+    """One bulk INSERT per batch into ActivityEvent"""
+
+    def write(self, events):
+        from .models import ActivityEvent
+
+        # The flusher thread is long-lived: apply CONN_MAX_AGE / health checks like a request would
+        close_old_connections()
+        ActivityEvent.objects.bulk_create(
+            [
+                ActivityEvent(kind=event['kind'], user_id=event['user_id'], data=event['data'], created_at=event['at'])
+                for event in events
+            ]
+        )
+
+
+class JSONLinesSink(Sink):
+    """Appends one JSON object per line to settings.ACTIVITY_LOG_PATH"""
+
+    def __init__(self, path=None):
+        self.path = os.fspath(path or settings.ACTIVITY_LOG_PATH)
+
+    def write(self, events):
+        lines = ''.join(
+            json.dumps({**event, 'at': event['at'].isoformat()}, default=str, ensure_ascii=False) + '\n'
+            for event in events
+        )
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # One append per batch, so several processes can share the file
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import metrics
+
+from . import events
+from .events import Pipeline, emit
+from .models import ActivityEvent
+from .sinks import DatabaseSink, JSONLinesSink
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+
+    def write(self, batch):
+        self.batches.append([event['n'] for event in batch])
+
+
+class BrokenSink:
+    def write(self, batch):
+        raise OSError('disk full')
+
+
+class PipelineTestCase(SimpleTestCase):
+    def setUp(self):
+        # Flushed by hand: no flusher thread
+        self.enterContext(mock.patch.object(Pipeline, 'start'))
+        self.enterContext(mock.patch.object(metrics, '_metrics', metrics.LocalMetrics()))
+
+
+class PipelineTests(PipelineTestCase):
+    def test_batches_in_order(self):
+        sink = ListSink()
+        pipeline = Pipeline([sink], batch_size=2)
+        for n in range(5):
+            self.assertTrue(pipeline.put({'n': n}))
+        self.assertTrue(pipeline.wake.is_set())  # a full batch is waiting
+        pipeline.flush()
+        self.assertEqual(sink.batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual(pipeline.stats(), {
+            'emitted': 5, 'dropped': 0, 'written': 5, 'failed': 0, 'batches': 3, 'buffered': 0, 'capacity': 10000,
+        })
+
+    def test_full_buffer_drops_new_events(self):
+        sink = ListSink()
+        pipeline = Pipeline([sink], capacity=2)
+        self.assertEqual([pipeline.put({'n': n}) for n in range(4)], [True, True, False, False])
+        with self.assertLogs('activity.events', 'WARNING') as logs:
+            pipeline.flush()
+        self.assertIn('dropped 2 events (2 in total)', logs.output[0])
+        self.assertEqual(sink.batches, [[0, 1]])
+        self.assertEqual(pipeline.stats()['dropped'], 2)
+        self.assertEqual(metrics.get_metrics().collect()[('activity_events_total', (('outcome', 'dropped'),))], 2)
+
+    def test_failing_sink_does_not_stop_the_others(self):
+        sink = ListSink()
+        pipeline = Pipeline([BrokenSink(), sink])
+        pipeline.put({'n': 1})
+        with self.assertLogs('activity.events', 'ERROR'):
+            pipeline.flush()
+        self.assertEqual(sink.batches, [[1]])
+        self.assertEqual((pipeline.stats()['failed'], pipeline.stats()['written']), (1, 0))
+
+
+class SinkTests(TestCase):
+    def event(self, user_id=None, **data):
+        return {'kind': 'location.marked', 'at': timezone.now(), 'user_id': user_id, 'username': None, 'data': data}
+
+    def test_database_sink(self):
+        user = get_user_model().objects.create_user(username='traveller', password='x')
+        # Meant for the flusher thread's own connection: it would close the test's
+        with mock.patch('activity.sinks.close_old_connections'):
+            DatabaseSink().write([self.event(user.pk, name='Goa'), self.event(user.pk + 100, name='Pune')])
+        self.assertEqual(
+            list(ActivityEvent.objects.order_by('id').values_list('user_id', 'data')),
+            [(user.pk, {'name': 'Goa'}), (user.pk + 100, {'name': 'Pune'})],
+        )
+
+    def test_json_lines_sink(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'logs', 'activity.jsonl')
+            sink = JSONLinesSink(path)
+            first = self.event(7, name='Goa')
+            sink.write([first])
+            sink.write([self.event(8, name='Pune')])
+            with open(path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([line['data']['name'] for line in lines], ['Goa', 'Pune'])
+        self.assertEqual(lines[0]['at'], first['at'].isoformat())
+
+
+class EmitTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.object(Pipeline, 'start'))
+        self.enterContext(mock.patch.object(metrics, '_metrics', metrics.LocalMetrics()))
+        self.pipeline = Pipeline([])
+        self.enterContext(mock.patch.object(events, '_pipeline', self.pipeline))
+        self.user = get_user_model().objects.create_user(username='traveller', password='x')
+
+    def buffered(self):
+        return [(event['kind'], event['user_id'], event['data']) for event in self.pipeline.buffer]
+
+    def test_queued_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            emit('location.marked', self.user, name='Goa')
+            self.assertEqual(self.buffered(), [])
+        self.assertEqual(self.buffered(), [('location.marked', self.user.pk, {'name': 'Goa'})])
+        self.assertEqual(self.pipeline.buffer[0]['username'], 'traveller')
+
+    def test_dropped_with_a_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    emit('location.marked', self.user, name='Goa')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.buffered(), [])
+
+    def test_marking_emits_events(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/locations/mark/', {'name': 'Goa', 'level': 1, 'parent': 'India'}, format='json')
+            client.post('/api/locations/mark/', {'name': 'Goa', 'level': 1, 'parent': 'India'}, format='json')
+        self.assertEqual([(kind, data['name']) for kind, _, data in self.buffered()], [
+            ('location.marked', 'Goa'), ('location.marked', 'India'), ('location.already_visited', 'Goa'),
+        ])
+        self.assertEqual([data.get('auto') for _, _, data in self.buffered()][:2], [False, True])
+
+    @override_settings(ACTIVITY_SINKS=[])
+    def test_no_sinks(self):
+        with mock.patch.object(events, '_pipeline', None):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                emit('location.marked', self.user, name='Goa')
+        self.assertEqual(callbacks, [])
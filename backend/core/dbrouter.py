@@ -0,0 +1,117 @@
+"""
+Read replicas for read-only views, with read-your-writes.
+
+Reads go to the primary unless the code runs under `replica_reads`, which
+the read-only views (my-map, coverage stats, leaderboards, the photo
+gallery and counts) wrap their GET handlers in. There, the first query
+picks one of settings.DB_REPLICAS for the rest of the request.
+
+Replicas lag. A user who just wrote is pinned to the primary for
+DB_REPLICA_PIN_SECONDS: PrimaryPinMiddleware pins after any successful
+unsafe request, and the job queue pins a job's user when it finishes.
+The pin lives in the default cache, which must therefore be shared by
+every worker and job process (Redis; settings refuse DB_REPLICAS without
+REDIS_URL, PrimaryPinMiddleware a per-process cache backend). It is only
+looked up when a scoped request actually queries.
+
+Everything else (writes, reads in write views, transactions, workers)
+uses the primary. Without replicas configured the router does nothing.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_scope = ContextVar('replica_scope', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def check_pin_cache():
+    """Refuse a cache that keeps pins from other processes: their users would read stale replicas"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f'DB_REPLICAS needs a cache shared by every process, not {type(backend).__name__} (set REDIS_URL)'
+        )
+
+
+def pin_to_primary(user_id):
+    """Keep `user_id`'s reads on the primary until replicas have caught up with their write"""
+    if user_id is not None and settings.DB_REPLICAS:
+        cache.set(_pin_key(user_id), 1, settings.DB_REPLICA_PIN_SECONDS)
+
+
+class ReplicaScope:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.alias = None
+
+    def database(self):
+        if self.alias is None:
+            replicas = replica_aliases()
+            pinned = self.user_id is not None and cache.get(_pin_key(self.user_id))
+            self.alias = DEFAULT_DB_ALIAS if pinned or not replicas else random.choice(replicas)
+        return self.alias
+
+
+def _user_id(request):
+    user = getattr(request, 'token_user', None) or getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def replica_reads(method):
+    """Decorate a read-only view handler (sync or async) so its queries may use a replica"""
+    if iscoroutinefunction(method):
+        @wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            token = _scope.set(ReplicaScope(_user_id(request)))
+            try:
+                return await method(self, request, *args, **kwargs)
+            finally:
+                _scope.reset(token)
+    else:
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            token = _scope.set(ReplicaScope(_user_id(request)))
+            try:
+                return method(self, request, *args, **kwargs)
+            finally:
+                _scope.reset(token)
+    return wrapper
+
+
+def using_replica():
+    """True when reads right now would be routed to a replica"""
+    return ReplicaRouter().db_for_read(None) not in (None, DEFAULT_DB_ALIAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return scope.database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
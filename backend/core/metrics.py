@@ -0,0 +1,233 @@
+"""
+Request metrics in the Prometheus text format, served on /metrics.
+
+core.middleware.MetricsMiddleware records, per view:
+
+    http_requests_total               {view, method, status}
+    http_request_duration_seconds     {view, method}   histogram
+    http_response_size_bytes          {view}           histogram
+    db_queries_per_request            {view}           histogram
+    db_query_duration_seconds_total   {view}
+    http_slow_requests_total          {view}
+
+plus activity_events_total {outcome} from the activity pipeline.
+
+Everything is a float counter keyed by (sample name, labels); a histogram
+observation bumps one bucket, its _sum and its _count, and buckets are
+only made cumulative when rendered. Two interchangeable backends, chosen
+by settings.METRICS_BACKEND:
+
+  LocalMetrics  this process's counters. Fine for one worker or
+                development; with several, each scrape sees one of them.
+  RedisMetrics  counts locally too, and a daemon thread adds the deltas to
+                one Redis hash every METRICS_FLUSH_INTERVAL seconds
+                (HINCRBYFLOAT). /metrics renders that hash, i.e. the sum
+                over every worker, up to one interval behind.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, buckets)
+FAMILIES = {
+    'http_requests_total': ('counter', "Requests by view, method and status", None),
+    'http_request_duration_seconds': ('histogram', "Time spent in the Django stack per request", LATENCY_BUCKETS),
+    'http_response_size_bytes': ('histogram', "Response body size", SIZE_BUCKETS),
+    'db_queries_per_request': ('histogram', "SQL queries run by one request", QUERY_BUCKETS),
+    'db_query_duration_seconds_total': ('counter', "Time spent executing SQL", None),
+    'http_slow_requests_total': ('counter', "Requests slower than SLOW_REQUEST_MS", None),
+    'activity_events_total': ('counter', "Activity events by outcome: written, failed or dropped", None),
+}
+
+
+class Metrics:
+    """Backend interface: in-process counters plus a way to read the totals"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def inc(self, name, labels=(), value=1.0):
+        with self.lock:
+            self.values[(name, labels)] += value
+
+    def observe(self, name, value, labels=()):
+        buckets = FAMILIES[name][2]
+        i = bisect_left(buckets, value)
+        le = format_value(buckets[i]) if i < len(buckets) else '+Inf'
+        with self.lock:
+            self.values[(f'{name}_bucket', labels + (('le', le),))] += 1
+            self.values[(f'{name}_sum', labels)] += value
+            self.values[(f'{name}_count', labels)] += 1
+
+    def collect(self):
+        """{(sample name, labels): value} for everything recorded so far"""
+        raise NotImplementedError
+
+
+class LocalMetrics(Metrics):
+    def collect(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class RedisMetrics(Metrics):
+    def __init__(self, url=None, key='metrics', interval=None):
+        super().__init__()
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured("RedisMetrics needs the 'redis' package") from exc
+        url = url or settings.REDIS_URL
+        if not url:
+            raise ImproperlyConfigured("RedisMetrics needs REDIS_URL")
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.interval = interval or settings.METRICS_FLUSH_INTERVAL
+        self.thread = None
+
+    def inc(self, name, labels=(), value=1.0):
+        super().inc(name, labels, value)
+        if self.thread is None:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='metrics-flusher', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Pushing metrics to Redis failed")
+
+    def flush(self):
+        """Add what was counted since the last flush to the shared hash"""
+        with self.lock:
+            deltas, self.values = self.values, defaultdict(float)
+        if not deltas:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for (name, labels), value in deltas.items():
+                pipe.hincrbyfloat(self.key, json.dumps([name, labels]), value)
+            pipe.execute()
+        except Exception:
+            # Keep the counts for the next attempt
+            with self.lock:
+                for sample, value in deltas.items():
+                    self.values[sample] += value
+            raise
+
+    def collect(self):
+        return {
+            (name, tuple(tuple(pair) for pair in labels)): float(value)
+            for name, labels, value in (
+                (*json.loads(field), value) for field, value in self.client.hgetall(self.key).items()
+            )
+        }
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = import_string(settings.METRICS_BACKEND)()
+    return _metrics
+
+
+def _forget_metrics():
+    # Counts (and the flusher thread) belong to the parent: a forked worker starts at zero
+    global _metrics, _metrics_lock
+    _metrics = None
+    _metrics_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_metrics)
+
+
+@atexit.register
+def _flush_at_exit():
+    if isinstance(_metrics, RedisMetrics):
+        try:
+            _metrics.flush()
+        except Exception:
+            pass  # Redis gone at shutdown: nothing left to report to
+
+
+# ----------------------------------------------------------------------
+# Exposition
+# ----------------------------------------------------------------------
+
+def format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def render(values):
+    """Prometheus text exposition (format 0.0.4) of collect() output"""
+    samples = defaultdict(dict)  # family -> {(sample name, labels): value}
+    for (name, labels), value in values.items():
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+                family = name[:-len(suffix)]
+        samples[family][(name, labels)] = value
+
+    lines = []
+    for family in sorted(samples):
+        kind, help_text, buckets = FAMILIES.get(family, ('untyped', '', None))
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        family_samples = samples[family]
+        if kind != 'histogram':
+            for (name, labels), value in sorted(family_samples.items()):
+                lines.append(f'{name}{_labels(labels)} {format_value(value)}')
+            continue
+
+        # Stored buckets hold the observations that landed in each; Prometheus wants them cumulative
+        series = sorted({labels for name, labels in family_samples if not name.endswith('_bucket')})
+        for labels in series:
+            total = 0
+            for le in [format_value(b) for b in buckets] + ['+Inf']:
+                total += family_samples.get((f'{family}_bucket', labels + (('le', le),)), 0)
+                lines.append(f'{family}_bucket{_labels(labels + (("le", le),))} {format_value(total)}')
+            for suffix in ('_sum', '_count'):
+                value = family_samples.get((f'{family}{suffix}', labels), 0)
+                lines.append(f'{family}{suffix}{_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
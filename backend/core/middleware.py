@@ -0,0 +1,207 @@
+"""
+MetricsMiddleware: per-request instrumentation (latency, SQL queries and
+time, response size, see core/metrics.py), and a warning with the slowest
+queries for any request over settings.SLOW_REQUEST_MS.
+
+Queries are counted by an execute wrapper installed on every database
+connection as it is created. The wrapper reports to the current request
+through a context variable, so queries run by async views in
+sync_to_async threads are counted for the request that caused them.
+
+PrimaryPinMiddleware: read-your-writes for the replica router.
+"""
+import heapq
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .dbrouter import check_pin_cache, pin_to_primary
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+TOP_QUERIES = 5
+
+_current = ContextVar('request_queries', default=None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []  # min-heap of (seconds, n, sql), at most TOP_QUERIES
+
+    def add(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = (seconds, self.count, sql)
+        if len(self.slowest) < TOP_QUERIES:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - start)
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """Goes first in MIDDLEWARE, so the timing covers the rest of the stack"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = settings.SLOW_REQUEST_MS / 1000
+        self.metrics_path = '/' + settings.METRICS_PATH.lstrip('/')
+        # Connections opened before this middleware was loaded missed connection_created
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path == self.metrics_path:
+            return self.get_response(request)
+        stats = QueryStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if request.path == self.metrics_path:
+            return await self.get_response(request)
+        stats = QueryStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, seconds):
+        metrics = get_metrics()
+        view = _view_name(request)
+        metrics.inc(
+            'http_requests_total', (('view', view), ('method', request.method), ('status', str(response.status_code)))
+        )
+        metrics.observe('http_request_duration_seconds', seconds, (('view', view), ('method', request.method)))
+        metrics.observe('db_queries_per_request', stats.count, (('view', view),))
+        metrics.inc('db_query_duration_seconds_total', (('view', view),), stats.seconds)
+        self.record_size(response, metrics, (('view', view),))
+
+        if seconds >= self.slow_seconds:
+            metrics.inc('http_slow_requests_total', (('view', view),))
+            top = '\n'.join(
+                f'    {elapsed * 1000:8.1f} ms  {sql[:500]}'
+                for elapsed, _, sql in sorted(stats.slowest, reverse=True)
+            )
+            logger.warning(
+                "Slow request: %s %s (%s) %d in %.0f ms, %d queries in %.0f ms%s",
+                request.method, request.get_full_path(), view, response.status_code, seconds * 1000,
+                stats.count, stats.seconds * 1000, f'; slowest:\n{top}' if top else '',
+            )
+
+    def record_size(self, response, metrics, labels):
+        if not response.streaming:
+            metrics.observe('http_response_size_bytes', len(response.content), labels)
+            return
+        if response.has_header('Content-Length'):
+            # Files: keep the stream untouched (the server may sendfile() it)
+            metrics.observe('http_response_size_bytes', int(response['Content-Length']), labels)
+            return
+        # Streamed bodies (my-map, exports): count the bytes as they go out, record at the end
+        if response.is_async:
+            async def counted(chunks):
+                size = 0
+                async for chunk in chunks:
+                    size += len(chunk)
+                    yield chunk
+                metrics.observe('http_response_size_bytes', size, labels)
+        else:
+            def counted(chunks):
+                size = 0
+                for chunk in chunks:
+                    size += len(chunk)
+                    yield chunk
+                metrics.observe('http_response_size_bytes', size, labels)
+        response.streaming_content = counted(response.streaming_content)
+
+
+class PrimaryPinMiddleware:
+    """
+    After a successful write (any unsafe method), keep the user's reads on
+    the primary for a few seconds, so replica lag never hides their own
+    change from them (core/dbrouter.py). Off without replicas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DB_REPLICAS:
+            raise MiddlewareNotUsed
+        check_pin_cache()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self.pin)(request, response)
+        return response
+
+    def pin(self, request, response):
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+            return
+        # Set by DRF's authentication, or by the async views
+        user = getattr(request, 'token_user', None) or getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
@@ -1,6 +1,9 @@
 from pathlib import Path
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -27,10 +30,13 @@ INSTALLED_APPS = [
     'users',
     'locations',
     'photos',
+    'jobs',
+    'activity',
 ]
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware', # Must be top
+    'core.middleware.MetricsMiddleware',  # First, so its timings cover everything below
+    'corsheaders.middleware.CorsMiddleware', # Must be top (after metrics)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PrimaryPinMiddleware',  # Read-your-writes with DB_REPLICAS
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -60,17 +67,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
-# Database
-DATABASES = {
-    'default': {
+# Serving profile (gunicorn.conf.py): 'wsgi' (threaded workers) or 'asgi' (uvicorn event loops)
+SERVER_PROFILE = os.environ.get('SERVER_PROFILE', 'wsgi')
+# Route the hot endpoints (my-map, mark) to their async views; only worth it under ASGI
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', str(SERVER_PROFILE == 'asgi')).lower() in ('1', 'true', 'yes')
+
+# Database: a primary, plus optional read replicas for read-only views (core/dbrouter.py)
+#   DB_REPLICAS=host:port,host:port   same name / user / password as the primary
+DB_REPLICAS = [r for r in os.environ.get('DB_REPLICAS', '').split(',') if r]
+# Seconds a user's reads stay on the primary after they wrote: must exceed the replication lag
+DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+# Pooled connections (psycopg 3 with psycopg_pool), used when installed unless DB_POOL=0
+DB_POOL = os.environ.get('DB_POOL', 'auto').lower()
+DB_POOL = importlib.util.find_spec('psycopg_pool') is not None if DB_POOL == 'auto' else DB_POOL in ('1', 'true', 'yes')
+
+
+def database(host, port, **extra):
+    db = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'mapped_db',
-        'USER': 'mapped_user',
-        'PASSWORD': 'password',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'mapped_db'),
+        'USER': os.environ.get('DB_USER', 'mapped_user'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
+        'HOST': host,
+        'PORT': port,
+        **extra,
     }
+    if DB_POOL:
+        # Each worker process keeps a pool that request threads borrow from and return to at
+        # the end of the request, so nothing reconnects per request (WSGI or ASGI). Django
+        # requires CONN_MAX_AGE 0 with a pool
+        db['CONN_MAX_AGE'] = 0
+        db['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+                'timeout': 10,  # seconds to wait for a free connection
+                'max_idle': 5 * 60,
+                'max_lifetime': 30 * 60,
+            },
+        }
+    else:
+        # Threaded WSGI workers keep a connection per thread across requests. Under
+        # ASGI each request runs its sync code on a fresh thread, where a persistent
+        # connection would only leak: close at the end of every request instead
+        db['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0 if SERVER_PROFILE == 'asgi' else 60))
+    # Persistent: ping a reused connection first. Pooled: the pool checks one before lending it
+    db['CONN_HEALTH_CHECKS'] = True
+    return db
+
+
+DATABASES = {
+    'default': database(os.environ.get('DB_HOST', 'localhost'), os.environ.get('DB_PORT', '5432')),
 }
+for _n, _replica in enumerate(DB_REPLICAS):
+    _host, _, _port = _replica.partition(':')
+    # Tests run against the primary alone
+    DATABASES[f'replica_{_n}'] = database(_host, _port or '5432', TEST={'MIRROR': 'default'})
+DATABASE_ROUTERS = ['core.dbrouter.ReplicaRouter']
 
 # User Model
 AUTH_USER_MODEL = 'users.User'
@@ -81,6 +134,15 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
 ]
 
+# Signup password hashing (users/passwords.py): concurrent hashes per process, and how
+# many more may wait before signups get a 503. A waiting signup holds its request thread,
+# so together they stay below the worker's threads (gunicorn.conf.py WEB_THREADS): one
+# is always left for everything else
+SIGNUP_HASH_WORKERS = int(os.environ.get('SIGNUP_HASH_WORKERS', 2))
+SIGNUP_HASH_BACKLOG = int(os.environ.get(
+    'SIGNUP_HASH_BACKLOG', max(int(os.environ.get('WEB_THREADS', 4)) - SIGNUP_HASH_WORKERS - 1, 0),
+))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -90,6 +152,83 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
+# Normalized GeoJSON layers (scripts/normalize_gadm.py), source of the Region gazetteer
+GEOJSON_DIR = Path(os.environ.get('GEOJSON_DIR', BASE_DIR.parent / 'frontend' / 'public' / 'geojson'))
+
+# Vector tiles (built by scripts/build_tiles.py)
+TILES_MBTILES_PATH = os.environ.get('TILES_MBTILES_PATH', BASE_DIR / 'data' / 'mapped.mbtiles')
+TILES_CACHE_MAX_AGE = 60 * 60 * 24 * 30  # 30 days
+
+# Caches: local memory by default; set REDIS_URL to share them across workers
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    _cache_backend = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}
+else:
+    _cache_backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+CACHES = {
+    'default': _cache_backend,
+    # Serialized my-map payloads, keyed by user and map version (and, if shared, the current versions)
+    'maps': {**_cache_backend, 'KEY_PREFIX': 'maps', 'TIMEOUT': 60 * 60 * 24},
+}
+if not REDIS_URL:
+    CACHES['maps']['LOCATION'] = 'maps'
+if DB_REPLICAS and not REDIS_URL:
+    # Read-your-writes pins (core/dbrouter.py) live in the cache: every worker and job process must see them
+    raise ImproperlyConfigured('DB_REPLICAS needs REDIS_URL: a per-process cache loses the primary pins')
+
+# Background jobs (manage.py run_worker): max running jobs per queue, across all workers
+JOB_QUEUES = {
+    'default': 4,
+    'imports': 1,
+    'photos': 2,
+}
+# Loaded once by each worker before it forks job processes, which then share it
+JOB_WORKER_PRELOAD = ['locations.geocoder.get_geocoder']
+# Loaded once by the gunicorn master (gunicorn.conf.py) before it forks the web workers, likewise
+WEB_PRELOAD = ['locations.geocoder.get_geocoder']
+# Uploads waiting for a worker (must be shared with the workers)
+JOB_UPLOAD_DIR = Path(os.environ.get('JOB_UPLOAD_DIR', BASE_DIR / 'data' / 'uploads'))
+
+# Photos: files under MEDIA_ROOT by default, Cloudinary when CLOUDINARY_URL is set
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'data' / 'media'))
+PHOTO_STORAGE_BACKEND = os.environ.get(
+    'PHOTO_STORAGE_BACKEND',
+    'photos.storage.CloudinaryStorage' if os.environ.get('CLOUDINARY_URL') else 'photos.storage.LocalStorage',
+)
+PHOTO_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+PHOTO_MAX_BATCH = 500
+# Django's own cap on files per request; above the batch size so oversized batches get a clear 400
+DATA_UPLOAD_MAX_NUMBER_FILES = PHOTO_MAX_BATCH + 100
+
+# Activity events (activity/events.py): buffered in memory, written in batches by a background thread
+ACTIVITY_SINKS = [
+    path for path in os.environ.get(
+        'ACTIVITY_SINKS', 'activity.sinks.DatabaseSink,activity.sinks.JSONLinesSink'
+    ).split(',') if path
+]
+ACTIVITY_LOG_PATH = Path(os.environ.get('ACTIVITY_LOG_PATH', BASE_DIR / 'data' / 'activity.jsonl'))
+ACTIVITY_BUFFER_SIZE = 10000  # events held per process before new ones are dropped
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_FLUSH_INTERVAL = 1.0  # seconds
+
+# Request metrics (core/metrics.py): per process by default, summed over every worker with Redis
+METRICS_BACKEND = os.environ.get(
+    'METRICS_BACKEND', 'core.metrics.RedisMetrics' if REDIS_URL else 'core.metrics.LocalMetrics'
+)
+METRICS_FLUSH_INTERVAL = 5.0  # seconds between pushes to Redis
+METRICS_PATH = '/metrics'
+# Bearer token for scrapers; without one /metrics is closed (under DEBUG: open to private addresses)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Requests slower than this are logged with their slowest queries
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+
+# Leaderboards: per-process snapshots of the database by default, shared sorted sets with Redis
+LEADERBOARD_BACKEND = os.environ.get(
+    'LEADERBOARD_BACKEND',
+    'locations.leaderboard.RedisLeaderboard' if REDIS_URL else 'locations.leaderboard.LocalLeaderboard',
+)
+
 # CORS (Allow Next.js)
 CORS_ALLOW_ALL_ORIGINS = True
 
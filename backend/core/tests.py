@@ -0,0 +1,203 @@
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import dbrouter, metrics
+from . import settings as project_settings
+from .metrics import LocalMetrics, render
+from .middleware import PrimaryPinMiddleware
+
+
+class RenderTests(SimpleTestCase):
+    def test_counters(self):
+        m = LocalMetrics()
+        m.inc('http_requests_total', (('view', 'my-map'), ('status', '200')))
+        m.inc('http_requests_total', (('view', 'my-map'), ('status', '200')))
+        m.inc('db_query_duration_seconds_total', (('view', 'say "hi"\n'),), 0.25)
+        text = render(m.collect())
+        self.assertIn('# TYPE http_requests_total counter\n', text)
+        self.assertIn('http_requests_total{view="my-map",status="200"} 2\n', text)
+        self.assertIn('db_query_duration_seconds_total{view="say \\"hi\\"\\n"} 0.25\n', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        m = LocalMetrics()
+        for queries in (0, 3, 3, 500):
+            m.observe('db_queries_per_request', queries, (('view', 'v'),))
+        lines = render(m.collect()).splitlines()
+        self.assertIn('db_queries_per_request_bucket{view="v",le="0"} 1', lines)
+        self.assertIn('db_queries_per_request_bucket{view="v",le="2"} 1', lines)
+        self.assertIn('db_queries_per_request_bucket{view="v",le="3"} 3', lines)
+        self.assertIn('db_queries_per_request_bucket{view="v",le="200"} 3', lines)
+        self.assertIn('db_queries_per_request_bucket{view="v",le="+Inf"} 4', lines)
+        self.assertIn('db_queries_per_request_sum{view="v"} 506', lines)
+        self.assertIn('db_queries_per_request_count{view="v"} 4', lines)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.metrics = LocalMetrics()
+        self.enterContext(mock.patch.object(metrics, '_metrics', self.metrics))
+
+
+class MetricsMiddlewareTests(MetricsTestCase):
+    def test_request_is_recorded(self):
+        response = self.client.get('/api/jobs/1/')
+        self.assertEqual(response.status_code, 401)
+        values = self.metrics.collect()
+        view, get = ('view', 'job-status'), ('method', 'GET')
+        self.assertEqual(values[('http_requests_total', (view, get, ('status', '401')))], 1)
+        self.assertEqual(values[('http_request_duration_seconds_count', (view, get))], 1)
+        self.assertEqual(values[('http_response_size_bytes_sum', (view,))], len(response.content))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrapes_are_not_recorded(self):
+        self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(self.metrics.collect(), {})
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            Client().get('/api/jobs/1/')
+        self.assertIn('Slow request: GET /api/jobs/1/ (job-status) 401', logs.output[0])
+        self.assertEqual(self.metrics.collect()[('http_slow_requests_total', (('view', 'job-status'),))], 1)
+
+
+class MetricsViewTests(MetricsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics.inc('http_requests_total', (('view', 'my-map'), ('method', 'GET'), ('status', '200')))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret', REMOTE_ADDR='8.8.8.8')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'http_requests_total{view="my-map",method="GET",status="200"} 1\n', response.content)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_closed_without_token(self):
+        # Behind a reverse proxy every request comes from loopback
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_private_addresses_under_debug(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='8.8.8.8').status_code, 403)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.object(dbrouter, 'replica_aliases', return_value=['replica_0', 'replica_1']))
+        self.enterContext(override_settings(DB_REPLICAS=['replica-0:5432', 'replica-1:5432']))
+        self.router = dbrouter.ReplicaRouter()
+
+    def read_in_view(self, user_id=None, reads=3):
+        user = SimpleNamespace(pk=user_id, is_authenticated=user_id is not None)
+        request = SimpleNamespace(user=user)
+
+        class View:
+            @dbrouter.replica_reads
+            def get(view, request):
+                return [self.router.db_for_read(None) for _ in range(reads)]
+
+        return View().get(request)
+
+    def test_reads_outside_read_only_views_use_the_primary(self):
+        self.assertIsNone(self.router.db_for_read(None))
+        self.assertEqual(self.router.db_for_write(None), 'default')
+        self.assertFalse(dbrouter.using_replica())
+        self.assertEqual([self.router.allow_migrate(db, 'users') for db in ('default', 'replica_0')], [True, False])
+
+    def test_one_replica_per_request(self):
+        with mock.patch('core.dbrouter.random.choice', side_effect=['replica_1', 'replica_0']) as choice:
+            self.assertEqual(self.read_in_view(), ['replica_1'] * 3)
+            self.assertEqual(self.read_in_view(), ['replica_0'] * 3)
+        self.assertEqual(choice.call_count, 2)
+        self.assertIsNone(self.router.db_for_read(None))  # the scope ends with the handler
+
+    def test_async_handler(self):
+        class View:
+            @dbrouter.replica_reads
+            async def get(view, request):
+                return dbrouter.using_replica()
+
+        request = SimpleNamespace(token_user=SimpleNamespace(pk=7, is_authenticated=True))
+        self.assertTrue(async_to_sync(View().get)(request))
+
+    def test_writer_is_pinned_to_the_primary(self):
+        dbrouter.pin_to_primary(7)
+        self.assertEqual(self.read_in_view(user_id=7), ['default'] * 3)
+        self.assertTrue(self.read_in_view(user_id=8)[0].startswith('replica_'))
+
+    def test_transactions_stay_on_the_primary(self):
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.read_in_view(), [None] * 3)
+
+    def test_no_replicas(self):
+        with mock.patch.object(dbrouter, 'replica_aliases', return_value=[]), override_settings(DB_REPLICAS=[]):
+            dbrouter.pin_to_primary(7)
+            self.assertIsNone(cache.get('db-pin:7'))
+            self.assertEqual(self.read_in_view(), ['default'] * 3)
+
+
+class PrimaryPinMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        # Shared by every process on the host, unlike the test settings' LocMemCache
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp.name},
+        }))
+
+    def pinned(self, method, status):
+        response = HttpResponse(status=status)
+        middleware = PrimaryPinMiddleware(lambda request: response)
+        request = RequestFactory().generic(method, '/api/locations/mark/')
+        request.user = SimpleNamespace(pk=7, is_authenticated=True)
+        middleware(request)
+        return cache.get('db-pin:7') is not None
+
+    @override_settings(DB_REPLICAS=['replica-0:5432'])
+    def test_pins_after_successful_writes(self):
+        self.assertFalse(self.pinned('GET', 200))
+        self.assertFalse(self.pinned('POST', 400))
+        self.assertTrue(self.pinned('POST', 200))
+
+    @override_settings(DB_REPLICAS=['replica-0:5432'])
+    def test_refuses_a_per_process_cache(self):
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            with override_settings(CACHES={'default': {'BACKEND': f'django.core.cache.backends.{backend}'}}):
+                with self.assertRaisesMessage(ImproperlyConfigured, 'a cache shared by every process'):
+                    PrimaryPinMiddleware(lambda request: HttpResponse())
+
+    @override_settings(DB_REPLICAS=[])
+    def test_unused_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            PrimaryPinMiddleware(lambda request: HttpResponse())
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_pooled(self):
+        with mock.patch.object(project_settings, 'DB_POOL', True):
+            db = project_settings.database('db.internal', '6432')
+        self.assertEqual((db['HOST'], db['PORT'], db['CONN_MAX_AGE']), ('db.internal', '6432', 0))
+        self.assertEqual(set(db['OPTIONS']['pool']), {'min_size', 'max_size', 'timeout', 'max_idle', 'max_lifetime'})
+
+    def test_persistent(self):
+        with mock.patch.object(project_settings, 'DB_POOL', False):
+            db = project_settings.database('db.internal', '5432', TEST={'MIRROR': 'default'})
+        self.assertNotIn('OPTIONS', db)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertEqual(db['TEST'], {'MIRROR': 'default'})
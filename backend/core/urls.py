@@ -1,8 +1,12 @@
  #============================================
 # 5. backend/core/urls.py (UPDATE)
 # ============================================
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from locations.views import TileView
+from .views import MetricsView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -12,8 +16,18 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/locations/', include('locations.urls')),
     path('api/auth/', include('users.urls')),  # NEW LINE
+    path('api/jobs/', include('jobs.urls')),
+    path('api/photos/', include('photos.urls')),
+    path('api/tiles/<int:z>/<int:x>/<int:y>.pbf', TileView.as_view(), name='tile'),
     
     # 🔐 AUTH ENDPOINTS
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+
+    # 📈 Prometheus scrape target (core/metrics.py)
+    path(settings.METRICS_PATH.lstrip('/'), MetricsView.as_view(), name='metrics'),
 ]
+
+# Photos stored by LocalStorage (in production the web server serves MEDIA_ROOT)
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,35 @@
+import ipaddress
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views import View
+
+from .metrics import get_metrics, render
+
+
+class MetricsView(View):
+    """
+    Prometheus scrape target. Scrapers send METRICS_TOKEN as a bearer token.
+    Without a token it is closed, except under DEBUG to private / loopback
+    addresses: behind a reverse proxy every request comes from one of those.
+    """
+
+    def allowed(self, request):
+        if settings.METRICS_TOKEN:
+            return constant_time_compare(
+                request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+            )
+        if not settings.DEBUG:
+            return False
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        return address.is_private or address.is_loopback
+
+    def get(self, request):
+        if not self.allowed(request):
+            return HttpResponseForbidden()
+        body = render(get_metrics().collect())
+        return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
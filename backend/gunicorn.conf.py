@@ -0,0 +1,60 @@
+"""
+Gunicorn deployment profiles, picked by SERVER_PROFILE. From backend/:
+
+    gunicorn core.wsgi:application                      # 'wsgi': threaded sync workers
+    SERVER_PROFILE=asgi gunicorn core.asgi:application  # 'asgi': uvicorn event-loop workers
+
+The ASGI profile also switches my-map and mark to their async views
+(settings.ASYNC_API_VIEWS) and, without a connection pool (DB_POOL), closes
+DB connections per request (settings CONN_MAX_AGE). Needs `pip install gunicorn` (+ `uvicorn` for asgi).
+
+WEB_CONCURRENCY / WEB_THREADS / BIND override the defaults below.
+
+The master builds what settings.WEB_PRELOAD names (the geocoder's R-tree)
+before forking, so no worker pays for it on its first request and all of
+them share the one copy.
+"""
+import multiprocessing
+import os
+import time
+
+# Settings read SERVER_PROFILE too; workers inherit it from this process
+profile = os.environ.setdefault('SERVER_PROFILE', 'wsgi')
+cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+if profile == 'asgi':
+    # One event loop per core; concurrency comes from awaiting, not from threads
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus))
+else:
+    # Each thread holds one request (and one DB connection) until it completes
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpus * 2 + 1))
+    threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Behind a proxy that keeps connections open
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# Recycle workers now and then to bound slow leaks; jitter so they don't all restart at once
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = '-'
+
+
+def on_starting(server):
+    # Nothing here opens a connection or starts a thread, so it is safe to fork after
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+
+    for path in settings.WEB_PRELOAD:
+        begin = time.monotonic()
+        import_string(path)()
+        server.log.info("Preloaded %s in %.1fs", path, time.monotonic() - begin)
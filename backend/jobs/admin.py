@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'status', 'attempts', 'user', 'created_at', 'finished_at')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'user__username')
+    raw_id_fields = ('user',)
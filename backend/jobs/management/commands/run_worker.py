@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queues', default=None,
+            help="Comma-separated queues, in priority order (default: all in settings.JOB_QUEUES)"
+        )
+        parser.add_argument('--concurrency', type=int, default=2, help="Jobs run at once by this worker")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between polls when idle")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queues are empty")
+
+    def handle(self, *args, **options):
+        queues = options['queues'].split(',') if options['queues'] else list(settings.JOB_QUEUES)
+        worker = Worker(
+            queues, options['concurrency'], options['poll'], log=self.stdout.write,
+            preload=settings.JOB_WORKER_PRELOAD,
+        )
+        self.stdout.write(f"👷 Worker {worker.owner} on {', '.join(queues)} (concurrency {options['concurrency']})")
+        worker.run(burst=options['burst'])
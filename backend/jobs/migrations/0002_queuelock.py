@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueLock',
+            fields=[
+                ('queue', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
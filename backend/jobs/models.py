@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    One unit of background work, claimed and run by `manage.py run_worker`.
+    The table is the queue: no broker needed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)  # registered task name
+    queue = models.CharField(max_length=64, default='default')
+    payload = models.JSONField(default=dict)  # {'args': [...], 'kwargs': {...}}
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs'
+    )
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    timeout = models.IntegerField(default=300)  # seconds per attempt
+    run_after = models.DateTimeField()
+
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    progress = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query: next due job per queue
+            models.Index(fields=['status', 'queue', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class QueueLock(models.Model):
+    """
+    One row per queue with a concurrency limit. A claim on that queue locks
+    its row first (queue.claim), so counting the queue's running jobs and
+    claiming the next one happen as one step across all workers.
+    """
+    queue = models.CharField(max_length=64, primary_key=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.queue
@@ -0,0 +1,224 @@
+"""
+Database-backed task queue.
+
+Register a function with @task, enqueue it with .delay(...) (or enqueue()),
+and `manage.py run_worker` runs it in a child process:
+
+    @task(queue='imports', timeout=1800, bind=True)
+    def import_file(job, path):
+        ...
+        set_progress(job, {'done': 10})
+
+    job = import_file.delay(path, user=request.user)
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED on Postgres. SQLite has
+no row locks, so every claim is also a conditional UPDATE (status still
+queued), and only the worker whose UPDATE hit the row runs it. On a queue
+with a concurrency limit, a claim first locks the queue's QueueLock row,
+then counts and claims under that lock.
+
+Failed attempts are retried with exponential backoff up to max_attempts.
+Jobs whose worker vanished are failed (and retried) by reap() once their
+timeout plus REAP_GRACE has passed. A task's on_failure hook runs once its
+job has failed for good, however the last attempt ended (an exception, a
+timeout, a lost worker), so it can clean up what the task would have:
+
+    @import_file.on_failure
+    def remove_file(job, path):
+        os.remove(path)
+
+Per-queue concurrency limits (settings.JOB_QUEUES) apply across all workers.
+"""
+import logging
+import os
+import socket
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.dbrouter import pin_to_primary
+
+from .models import Job, QueueLock
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE = 10  # seconds; attempt n waits RETRY_BASE * 2 ** (n - 1)
+REAP_GRACE = 60  # seconds past a job's timeout before it's presumed lost
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, fn, name, queue, max_attempts, timeout, bind):
+        self.fn = fn
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.bind = bind
+        self.failure_hook = None
+
+    def on_failure(self, fn):
+        """Register fn(job, *args, **kwargs), called when a job of this task fails for good"""
+        self.failure_hook = fn
+        return fn
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def delay(self, *args, user=None, **kwargs):
+        return enqueue(self, *args, user=user, **kwargs)
+
+
+def task(name=None, queue='default', max_attempts=3, timeout=300, bind=False):
+    """Register a function as a task. With bind=True it receives its Job first"""
+    def register(fn):
+        t = Task(fn, name or f'{fn.__module__}.{fn.__qualname__}', queue, max_attempts, timeout, bind)
+        _registry[t.name] = t
+        return t
+    return register
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"No task registered as {name!r}") from None
+
+
+def enqueue(task, *args, user=None, run_after=None, **kwargs):
+    """Queue a run of `task` (a Task or its name). Arguments must be JSON-serializable"""
+    if isinstance(task, str):
+        task = get_task(task)
+    return Job.objects.create(
+        name=task.name,
+        queue=task.queue,
+        payload={'args': list(args), 'kwargs': kwargs},
+        user=user,
+        max_attempts=task.max_attempts,
+        timeout=task.timeout,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def queue_limit(queue):
+    return settings.JOB_QUEUES.get(queue)
+
+
+def _lock_queue(queue, now):
+    """
+    Hold `queue`'s QueueLock row until the transaction ends. A row lock on
+    Postgres; on SQLite the write takes the database's write lock, so the
+    transaction never has to upgrade a read lock later.
+    """
+    if not QueueLock.objects.filter(pk=queue).update(claimed_at=now):
+        QueueLock.objects.bulk_create([QueueLock(queue=queue)], ignore_conflicts=True)
+        QueueLock.objects.filter(pk=queue).update(claimed_at=now)
+
+
+def claim(owner, queues):
+    """Lock the next due job from `queues` for `owner`; None if there is nothing to run"""
+    now = timezone.now()
+    for queue in queues:
+        limit = queue_limit(queue)
+        # Without row locks a transaction only hurts, unless it starts with a write:
+        # SQLite can't upgrade its read to the write
+        locked = limit is not None or connection.features.has_select_for_update
+        with transaction.atomic() if locked else nullcontext():
+            if limit is not None:
+                # Under the queue's lock, so two workers can't both take its last free slot
+                _lock_queue(queue, now)
+                if Job.objects.filter(queue=queue, status=Job.RUNNING).count() >= limit:
+                    continue
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.QUEUED, queue=queue, run_after__lte=now)
+                .order_by('run_after', 'id')
+                .first()
+            )
+            if job is None:
+                continue
+            claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_by=owner, locked_at=now, attempts=F('attempts') + 1,
+            )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _owned(job):
+    # Only the worker that claimed this attempt may settle it
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by, attempts=job.attempts)
+
+
+def finish(job, result):
+    return _owned(job).update(
+        status=Job.SUCCEEDED, result=result, error='', finished_at=timezone.now(), locked_by='', locked_at=None,
+    )
+
+
+def fail(job, error):
+    """Record a failed attempt: back to the queue with backoff, or failed for good"""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = RETRY_BASE * 2 ** (job.attempts - 1)
+        return _owned(job).update(
+            status=Job.QUEUED, error=error, run_after=now + timedelta(seconds=delay), locked_by='', locked_at=None,
+        )
+    failed = _owned(job).update(status=Job.FAILED, error=error, finished_at=now, locked_by='', locked_at=None)
+    if failed:
+        _run_failure_hook(job)
+    return failed
+
+
+def _run_failure_hook(job):
+    try:
+        hook = get_task(job.name).failure_hook
+        if hook is not None:
+            hook(job, *job.payload.get('args', []), **job.payload.get('kwargs', {}))
+    except Exception:
+        # The job is failed either way; a broken hook mustn't take the worker down
+        logger.exception("on_failure hook of %s #%s failed", job.name, job.pk)
+
+
+def set_progress(job, progress):
+    Job.objects.filter(pk=job.pk).update(progress=progress)
+
+
+def execute(job):
+    """Run one claimed job in this process and settle it"""
+    try:
+        t = get_task(job.name)
+        args = job.payload.get('args', [])
+        kwargs = job.payload.get('kwargs', {})
+        result = t.fn(job, *args, **kwargs) if t.bind else t.fn(*args, **kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    # Before settling: once the user sees the job done, their next reads must see its writes
+    pin_to_primary(job.user_id)
+    if error is not None:
+        fail(job, error)
+        return False
+    finish(job, result)
+    return True
+
+
+def reap():
+    """Fail (and so retry) running jobs whose worker stopped reporting back. Returns how many"""
+    now = timezone.now()
+    reaped = 0
+    for job in Job.objects.filter(status=Job.RUNNING, locked_at__isnull=False):
+        if job.locked_at + timedelta(seconds=job.timeout + REAP_GRACE) < now:
+            reaped += fail(job, f"Worker {job.locked_by} lost the job (no result after {job.timeout}s)")
+    return reaped
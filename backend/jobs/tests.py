@@ -0,0 +1,176 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import queue
+from .models import Job
+
+calls = []
+
+
+@queue.task(name='tests.add', queue='fast')
+def add(a, b):
+    return a + b
+
+
+@queue.task(name='tests.explode', queue='fast', max_attempts=2, bind=True)
+def explode(job, path):
+    raise RuntimeError(f'boom #{job.attempts}')
+
+
+@explode.on_failure
+def explode_failed(job, path):
+    calls.append((job.pk, path))
+
+
+@override_settings(JOB_QUEUES={'fast': None, 'slow': 1})
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_runs_due_jobs_in_order(self):
+        later = add.delay(1, 2)
+        first = queue.enqueue('tests.add', 3, 4, run_after=timezone.now() - timedelta(minutes=1))
+        queue.enqueue(add, 5, 6, run_after=timezone.now() + timedelta(hours=1))
+
+        job = queue.claim('worker', ['fast'])
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual((job.status, job.locked_by, job.attempts), (Job.RUNNING, 'worker', 1))
+        self.assertEqual(queue.claim('worker', ['fast']).pk, later.pk)
+        self.assertIsNone(queue.claim('worker', ['fast']))  # the last one isn't due
+
+    def test_execute(self):
+        add.delay(1, 2)
+        job = queue.claim('worker', ['fast'])
+        self.assertTrue(queue.execute(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.locked_by), (Job.SUCCEEDED, 3, ''))
+
+    @override_settings(DB_REPLICAS=['replica-0:5432'])
+    def test_execute_pins_the_user_to_the_primary(self):
+        user = get_user_model().objects.create_user(username='owner', password='x')
+        cache.delete(f'db-pin:{user.pk}')
+        add.delay(1, 2, user=user)
+        queue.execute(queue.claim('worker', ['fast']))
+        # Their next reads must see what the job wrote
+        self.assertIsNotNone(cache.get(f'db-pin:{user.pk}'))
+
+    def test_queue_limit(self):
+        Job.objects.bulk_create([
+            Job(name='tests.add', queue='slow', payload={'args': [1, 1]}, run_after=timezone.now()) for _ in range(3)
+        ])
+        running = queue.claim('a', ['slow'])
+        self.assertIsNotNone(running)
+        self.assertIsNone(queue.claim('b', ['slow', 'fast']))
+        queue.finish(running, 2)
+        self.assertIsNotNone(queue.claim('b', ['slow']))
+
+    def test_retry_with_backoff_then_fail(self):
+        job = explode.delay('/tmp/upload')
+        before = timezone.now()
+        self.assertFalse(queue.execute(queue.claim('worker', ['fast'])))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('boom #1', job.error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=queue.RETRY_BASE))
+        self.assertEqual(calls, [])
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertFalse(queue.execute(queue.claim('worker', ['fast'])))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(calls, [(job.pk, '/tmp/upload')])
+
+    def test_failure_hook_errors_are_contained(self):
+        explode.delay('/tmp/upload')
+        with mock.patch.object(explode, 'failure_hook', side_effect=OSError('disk gone')):
+            job = queue.claim('worker', ['fast'])
+            Job.objects.filter(pk=job.pk).update(attempts=2)
+            job.refresh_from_db()
+            with self.assertLogs('jobs.queue', 'ERROR'):
+                self.assertEqual(queue.fail(job, 'boom'), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.FAILED)
+
+    def test_stale_attempt_cannot_settle(self):
+        add.delay(1, 2)
+        job = queue.claim('worker', ['fast'])
+        # Reaped and claimed again meanwhile
+        Job.objects.filter(pk=job.pk).update(locked_by='other', attempts=2)
+        self.assertEqual(queue.finish(job, 3), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+    def test_reap_lost_jobs(self):
+        explode.delay('/tmp/upload')
+        job = queue.claim('gone', ['fast'])
+        self.assertEqual(queue.reap(), 0)
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=job.timeout + queue.REAP_GRACE + 1),
+        )
+        self.assertEqual(queue.reap(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('gone lost the job', job.error)
+
+    def test_unknown_task(self):
+        with self.assertRaises(LookupError):
+            queue.enqueue('tests.missing')
+
+
+class JobStatusViewTests(TestCase):
+    def test_own_jobs_only(self):
+        owner = get_user_model().objects.create_user(username='owner', password='x')
+        other = get_user_model().objects.create_user(username='other', password='x')
+        job = add.delay(1, 2, user=owner)
+        client = APIClient()
+
+        client.force_authenticate(owner)
+        response = client.get(f'/api/jobs/{job.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+
+        client.force_authenticate(other)
+        self.assertEqual(client.get(f'/api/jobs/{job.pk}/').status_code, 404)
+
+
+@override_settings(JOB_QUEUES={'slow': 1})
+class ClaimRaceTests(TransactionTestCase):
+    WORKERS = 8
+
+    def test_limit_holds_across_concurrent_claims(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads need a database file (shared-cache memory databases fail fast on locks)')
+        Job.objects.bulk_create([
+            Job(name='tests.add', queue='slow', payload={'args': [1, 1]}, run_after=timezone.now())
+            for _ in range(self.WORKERS)
+        ])
+        barrier = threading.Barrier(self.WORKERS)
+        claimed, errors = [], []
+
+        def work(n):
+            try:
+                barrier.wait()
+                job = queue.claim(f'worker-{n}', ['slow'])
+                if job is not None:
+                    claimed.append(job.pk)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 1)
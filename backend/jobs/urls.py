@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import JobStatusView
+
+urlpatterns = [
+    path('<int:pk>/', JobStatusView.as_view(), name='job-status'),
+]
@@ -0,0 +1,36 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from .models import Job
+
+
+def job_status(job):
+    return {
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'progress': job.progress,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def accepted(job, **extra):
+    """202 response for work handed to the queue; poll Location for the outcome"""
+    response = Response({**job_status(job), **extra}, status=202)
+    response['Location'] = f'/api/jobs/{job.pk}/'
+    return response
+
+
+class JobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = Job.objects.filter(pk=pk, user=request.user).first()
+        if job is None:
+            return Response({'error': 'Not found'}, status=404)
+        return Response(job_status(job))
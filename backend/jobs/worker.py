@@ -0,0 +1,140 @@
+"""
+The process behind `manage.py run_worker`.
+
+Each claimed job runs in its own child process, so a job that overruns
+its timeout can be terminated outright, and a crash (segfault, OOM kill)
+only loses that attempt. The parent only claims, watches and settles.
+"""
+import multiprocessing
+import signal
+import time
+
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from activity import events as activity
+
+from . import queue
+from .models import Job
+
+REAP_EVERY = 30  # seconds
+
+
+def _context():
+    # fork keeps startup cheap; spawn where fork isn't available
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+
+
+# The parent's connection pools, as inherited by a child (see _leave_parent_pools)
+_parent_pools = []
+
+
+def _leave_parent_pools():
+    # With DB_POOL, close_all() before forking hands the parent's connections back to
+    # its pool, still open, and the child inherits them. Using, closing or even garbage
+    # collecting those would talk over the parent's sockets: park them, start afresh
+    for connection in connections.all():
+        pools = getattr(type(connection), '_connection_pools', None)
+        if pools:
+            _parent_pools.extend(pools.values())
+            pools.clear()
+
+
+def _run_child(job_id):
+    # Forked children inherit the parent's handlers: SIGTERM must kill, and
+    # Ctrl-C (sent to the whole group) is for the parent to handle gracefully
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _leave_parent_pools()
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    job = Job.objects.get(pk=job_id)
+    ok = queue.execute(job)
+    # multiprocessing ends the child with os._exit: no atexit handlers
+    activity.flush()
+    connections.close_all()
+    raise SystemExit(0 if ok else 1)
+
+
+class Worker:
+    def __init__(self, queues, concurrency=2, poll_interval=1.0, log=print, preload=()):
+        self.queues = queues
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.log = log
+        self.owner = queue.worker_id()
+        self.running = {}  # pid -> (process, job, started)
+        self.stopping = False
+        self.ctx = _context()
+        self.preload = preload
+
+    def stop(self, *args):
+        if not self.stopping:
+            self.log("Stopping: no new jobs, waiting for running ones")
+        self.stopping = True
+
+    def run(self, burst=False):
+        """Work until stopped; with burst, until the queues are empty"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Forked children inherit whatever is loaded now (copy-on-write)
+        for path in self.preload:
+            begin = time.monotonic()
+            import_string(path)()
+            self.log(f"Preloaded {path} in {time.monotonic() - begin:.1f}s")
+        last_reap = 0
+        while True:
+            now = time.monotonic()
+            if now - last_reap > REAP_EVERY:
+                reaped = queue.reap()
+                if reaped:
+                    self.log(f"Reaped {reaped} lost jobs")
+                last_reap = now
+
+            self.collect()
+            started = 0
+            while not self.stopping and len(self.running) < self.concurrency:
+                job = queue.claim(self.owner, self.queues)
+                if job is None:
+                    break
+                self.start(job)
+                started += 1
+
+            if not self.running and (self.stopping or (burst and not started)):
+                return
+            if not started:
+                time.sleep(self.poll_interval)
+
+    def start(self, job):
+        # Children must not share the parent's DB connection
+        connections.close_all()
+        process = self.ctx.Process(target=_run_child, args=(job.pk,), daemon=True)
+        process.start()
+        self.running[process.pid] = (process, job, time.monotonic())
+        self.log(f"▶ {job.name} #{job.pk} (attempt {job.attempts}/{job.max_attempts})")
+
+    def collect(self):
+        """Settle finished children and terminate the ones past their timeout"""
+        for pid, (process, job, started) in list(self.running.items()):
+            if process.is_alive():
+                if time.monotonic() - started <= job.timeout:
+                    continue
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                queue.fail(job, f"Timed out after {job.timeout}s")
+                self.log(f"⏱ {job.name} #{job.pk} timed out")
+            else:
+                process.join()
+                job.refresh_from_db()
+                if job.status == Job.RUNNING and job.locked_by == self.owner:
+                    # Died before settling its own row (killed, crashed)
+                    queue.fail(job, f"Worker process exited with code {process.exitcode}")
+                    job.refresh_from_db()
+                self.log(f"{'✅' if job.status == Job.SUCCEEDED else '❌'} {job.name} #{job.pk} {job.status}")
+            del self.running[pid]
@@ -1,8 +1,16 @@
 from django.contrib import admin
-from .models import VisitedLocation
+from .models import Region, VisitedLocation
 
 @admin.register(VisitedLocation)
 class VisitedLocationAdmin(admin.ModelAdmin):
     list_display = ('user', 'name', 'level', 'parent', 'marked_at')
     list_filter = ('level', 'user')
-    search_fields = ('name', 'user__username')
\ No newline at end of file
+    search_fields = ('name', 'user__username')
+
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'level', 'gid', 'parent')
+    list_filter = ('level',)
+    search_fields = ('name', 'gid')
+    list_select_related = ('parent',)
+    raw_id_fields = ('parent',)
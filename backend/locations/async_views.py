@@ -0,0 +1,115 @@
+"""
+Async variants of the hottest endpoints, served in place of the sync ones
+when settings.ASYNC_API_VIEWS is on (the ASGI profile, see gunicorn.conf.py).
+
+Under an ASGI server a request waiting on the cache or the database
+yields the event loop instead of holding a worker thread, so one process
+keeps many map fetches in flight. Reads use Django's async cache and ORM
+APIs. Writes still need transactions and row locks, which the async ORM
+doesn't offer, so mark / unmark run the shared sync service code in a
+worker thread (sync_to_async).
+
+Plain Django views: DRF's APIView has no async support. Authentication is
+the same as UserMapDataView's: the JWT's claims, plus the cached check
+that the account is still active.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from core.dbrouter import replica_reads
+from users.authentication import ais_active
+
+from .changelog import changes_since
+from .mapcache import aget_map, aget_version, etag_for
+from .regionindex import get_index
+from .views import map_params, mark_one, unmark_one
+
+
+class AsyncAPIView(View):
+    """Bearer-token auth and JSON in/out for async views"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token auth, no cookies: exempt from CSRF like DRF's APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def token_user(self, request):
+        """The TokenUser for the request's JWT, or None (account not checked yet)"""
+        try:
+            authenticated = JWTStatelessUserAuthentication().authenticate(request)
+        except APIException:
+            return None
+        return authenticated[0] if authenticated else None
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.token_user = self.token_user(request)
+        if request.token_user is None or not await ais_active(request.token_user.id):
+            return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def json_body(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+class AsyncUserMapDataView(AsyncAPIView):
+    """UserMapDataView on the async cache / ORM: same parameters, same responses"""
+
+    @replica_reads
+    async def get(self, request):
+        user_id = request.token_user.id
+        encoding, since, error = map_params(request.GET)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        version = await aget_version(user_id)
+
+        if since is not None:
+            delta = await sync_to_async(changes_since)(user_id, since, version)
+            if delta is not None:
+                return JsonResponse({'cursor': version, 'full': False, **delta})
+
+        index = await sync_to_async(get_index)() if encoding == 'bitmap' else None
+        etag = etag_for(user_id, version, encoding, index)
+        if since is None and request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            version, payload = await aget_map(user_id, encoding)
+            etag = etag_for(user_id, version, encoding, index)
+            response = JsonResponse({'cursor': version, 'full': True, 'encoding': encoding, **payload})
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class AsyncMarkLocationView(AsyncAPIView):
+    """MarkLocationView: the user row is read on the async ORM, the write runs in a thread"""
+
+    async def user(self, request):
+        return await get_user_model().objects.filter(pk=request.token_user.id, is_active=True).afirst()
+
+    async def change(self, request, operation):
+        data = self.json_body(request)
+        if data is None:
+            return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+        user = await self.user(request)
+        if user is None:
+            return JsonResponse({'detail': 'User not found'}, status=401)
+        body, status = await sync_to_async(operation)(user, data)
+        return JsonResponse(body, status=status)
+
+    async def post(self, request):
+        return await self.change(request, mark_one)
+
+    async def delete(self, request):
+        return await self.change(request, unmark_one)
@@ -0,0 +1,122 @@
+"""
+Compact encodings of a set of dense region indices (see regionindex.py).
+
+Two codecs; encode() picks whichever is smaller for the given set:
+
+  'rle'   alternating run lengths - unset, set, unset, set, ... - starting
+          with an unset run (possibly 0), each as an unsigned LEB128 varint.
+          Tiny for sparse or clustered sets (a whole state's districts are
+          adjacent in the index).
+  'bits'  plain little-endian bitset, bit i = byte i >> 3, mask 1 << (i & 7).
+          Wins for large scattered sets.
+
+Either way the bytes go out base64 encoded:
+{'codec': 'rle' | 'bits', 'size': <bits>, 'count': <set bits>, 'data': <base64>}
+"""
+import base64
+
+CODECS = ('rle', 'bits')
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(data):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+    if shift:
+        raise ValueError('Truncated varint')
+
+
+def encode_rle(indices):
+    """`indices` sorted and unique"""
+    out = bytearray()
+    pos = 0
+    run_start = None
+    prev = None
+    for i in indices:
+        if run_start is None:
+            run_start = prev = i
+        elif i == prev + 1:
+            prev = i
+        else:
+            _varint(run_start - pos, out)
+            _varint(prev - run_start + 1, out)
+            pos = prev + 1
+            run_start = prev = i
+    if run_start is not None:
+        _varint(run_start - pos, out)
+        _varint(prev - run_start + 1, out)
+    return bytes(out)
+
+
+def decode_rle(data):
+    indices = []
+    pos = 0
+    runs = _read_varints(data)
+    for gap in runs:
+        length = next(runs, None)
+        if length is None:
+            raise ValueError('Unpaired run length')
+        start = pos + gap
+        indices.extend(range(start, start + length))
+        pos = start + length
+    return indices
+
+
+def encode_bits(indices, size):
+    out = bytearray((size + 7) // 8)
+    for i in indices:
+        out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+# Set bit positions of every byte value, for decoding a byte at a time
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def decode_bits(data):
+    indices = []
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset << 3
+            indices.extend(base + bit for bit in _BYTE_BITS[byte])
+    return indices
+
+
+def encode(indices, size):
+    """Encode a set of indices in [0, size) with the smaller codec"""
+    indices = sorted(set(indices))
+    if indices and not (0 <= indices[0] and indices[-1] < size):
+        raise ValueError('Index out of range')
+    rle = encode_rle(indices)
+    if len(rle) <= (size + 7) // 8:
+        codec, data = 'rle', rle
+    else:
+        codec, data = 'bits', encode_bits(indices, size)
+    return {
+        'codec': codec,
+        'size': size,
+        'count': len(indices),
+        'data': base64.b64encode(data).decode('ascii'),
+    }
+
+
+def decode(payload):
+    """Sorted list of indices from an encode() payload"""
+    data = base64.b64decode(payload['data'])
+    if payload['codec'] == 'rle':
+        return decode_rle(data)
+    if payload['codec'] == 'bits':
+        return decode_bits(data)
+    raise ValueError(f"Unknown codec {payload['codec']!r}")
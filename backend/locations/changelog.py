@@ -0,0 +1,77 @@
+"""
+Per-user change log behind the delta-sync mode of /locations/my-map/.
+
+A client holding the map at version `since` asks for what changed after
+it. Changes are coalesced per (name, level) - only the last operation
+counts - so the reply is O(changes), not O(visited set). Versions are
+contiguous, so a gap (log rows from before this table existed) is
+detected and answered with the full map instead.
+"""
+from .models import MapChange, VisitedLocation
+
+LEVEL_KEYS = {0: 'countries', 1: 'states', 2: 'districts'}
+
+
+def record(user_id, seq, op, rows):
+    """Log (name, level, parent, grandparent) rows as one change set"""
+    MapChange.objects.bulk_create([
+        MapChange(user_id=user_id, seq=seq, op=op, name=name, level=level, parent=parent, grandparent=grandparent)
+        for name, level, parent, grandparent in rows
+    ])
+
+
+def record_sql(source):
+    """
+    INSERT ... SELECT logging every row of CTE `source` (name, level, parent,
+    grandparent) as removed. Params: user_id, seq.
+    """
+    return (
+        f'INSERT INTO {MapChange._meta.db_table} '
+        f'(user_id, seq, op, name, level, parent, grandparent, created_at) '
+        f"SELECT %s, %s, '{MapChange.REMOVE}', name, level, parent, grandparent, NOW() FROM {source}"
+    )
+
+
+def changes_since(user_id, since, version):
+    """
+    Delta from version `since` to `version`:
+    {'added': {level_key: [names]}, 'removed': {level_key: [names]}}.
+    Returns None when the log can't bridge the gap and the full map is needed.
+    """
+    empty = {key: [] for key in ('districts', 'states', 'countries')}
+    delta = {'added': {k: list(v) for k, v in empty.items()}, 'removed': {k: list(v) for k, v in empty.items()}}
+    if since == version:
+        return delta
+    if since <= 0 or since > version:
+        return None
+
+    changes = list(
+        MapChange.objects.filter(user_id=user_id, seq__gt=since, seq__lte=version)
+        .order_by('seq', 'id').values_list('seq', 'op', 'name', 'level')
+    )
+    # Sequence numbers are contiguous: a log missing any of since + 1 ..
+    # version is incomplete (pruned, a gap in the middle, or read from a
+    # replica that is behind)
+    if len({seq for seq, *_ in changes}) != version - since:
+        return None
+
+    last = {}
+    for _, op, name, level in changes:
+        last[(name, level)] = op
+
+    # The client keeps names per level, so a name only goes away when no row
+    # with it is left (two same-named districts in different states)
+    removed = [key for key, op in last.items() if op == MapChange.REMOVE]
+    still_visited = set()
+    if removed:
+        still_visited = set(
+            VisitedLocation.objects.filter(user_id=user_id, name__in={name for name, _ in removed})
+            .values_list('name', 'level')
+        )
+
+    for (name, level), op in last.items():
+        if op == MapChange.ADD:
+            delta['added'][LEVEL_KEYS[level]].append(name)
+        elif (name, level) not in still_visited:
+            delta['removed'][LEVEL_KEYS[level]].append(name)
+    return delta
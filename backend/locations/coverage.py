@@ -0,0 +1,62 @@
+"""
+Per-user, per-parent coverage ("12 of 36 states in India").
+
+Mark / unmark pass the parent region of every row they add or remove to
+apply(), inside their own transaction; the user's MapVersion row lock
+(mapcache.lock_version) already serializes writers, so a read-modify-write
+here is safe. Rows not linked to the gazetteer don't count. Totals come
+from the region index and are refreshed by rebuild().
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import regionindex
+from .models import Coverage, VisitedLocation
+
+
+def apply(user_id, deltas):
+    """deltas: {parent region id or None: +/- visited}"""
+    deltas = {parent: n for parent, n in deltas.items() if n}
+    if not deltas:
+        return
+    totals = regionindex.get_index().child_counts
+
+    parents = [parent for parent in deltas if parent is not None]
+    match = Q(region_id__in=parents)
+    if None in deltas:
+        match |= Q(region__isnull=True)
+    rows = {row.region_id: row for row in Coverage.objects.filter(match, user_id=user_id)}
+    changed, created = [], []
+    for parent, n in deltas.items():
+        row = rows.get(parent)
+        if row is None:
+            created.append(Coverage(user_id=user_id, region_id=parent, visited=max(n, 0), total=totals.get(parent, 0)))
+        else:
+            row.visited = max(row.visited + n, 0)
+            changed.append(row)
+    Coverage.objects.bulk_update(changed, ['visited'])
+    Coverage.objects.bulk_create(created)
+
+
+def rebuild(user_ids=None):
+    """
+    Recompute coverage from VisitedLocation with one GROUP BY, replacing the
+    stored rows. Returns the number of rows written.
+    """
+    totals = regionindex.get_index().child_counts
+    visits = VisitedLocation.objects.filter(region__isnull=False)
+    if user_ids is not None:
+        visits = visits.filter(user_id__in=user_ids)
+    grouped = visits.values_list('user_id', 'region__parent_id').annotate(n=Count('id')).order_by()
+
+    rows = [
+        Coverage(user_id=user_id, region_id=parent, visited=n, total=totals.get(parent, 0))
+        for user_id, parent, n in grouped
+    ]
+    with transaction.atomic():
+        stale = Coverage.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        Coverage.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
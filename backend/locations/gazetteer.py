@@ -0,0 +1,209 @@
+"""
+Region lookups and bulk (re)loading of the gazetteer.
+
+The map still identifies places by name/parent/grandparent, so every
+lookup here accepts either a GID (exact) or that name triple.
+"""
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import regionindex
+from .models import Region, VisitedLocation
+from .streamjson import iter_array
+
+BATCH_SIZE = 2000
+
+# Normalized layers, loaded in this order so parents always exist first
+DEFAULT_FILES = [
+    'world-countries.json',
+    'india-states.json',
+    'india-districts.json',
+]
+
+
+def resolve_regions(items):
+    """
+    Match a batch of mark requests (dicts with name/level/parent/grandparent
+    and optional gid) to Regions in a single query. Returns a list aligned
+    with `items`, holding a Region or None where the gazetteer has no match.
+    """
+    gids = {i['gid'] for i in items if i.get('gid')}
+    names = {i['name'] for i in items if i.get('name') is not None}
+    if not gids and not names:
+        return [None] * len(items)
+
+    candidates = Region.objects.select_related('parent__parent').filter(Q(gid__in=gids) | Q(name__in=names))
+    by_gid, by_name = {}, {}
+    for region in candidates:
+        by_gid[region.gid] = region
+        by_name.setdefault((region.name, region.level), []).append(region)
+
+    resolved = []
+    for item in items:
+        region = by_gid.get(item.get('gid'))
+        if region is None and item.get('name') is not None and item.get('level') is not None:
+            parent, grandparent = item.get('parent'), item.get('grandparent')
+            for candidate in by_name.get((item['name'], int(item['level'])), []):
+                p = candidate.parent
+                if parent and candidate.level >= 1 and (p is None or p.name != parent):
+                    continue
+                if grandparent and candidate.level == 2 and (p is None or p.parent is None or p.parent.name != grandparent):
+                    continue
+                region = candidate
+                break
+        resolved.append(region)
+    return resolved
+
+
+def resolve_region(name, level, parent=None, grandparent=None, gid=None):
+    """Find the Region a mark request refers to, or None if it isn't in the gazetteer"""
+    item = {'name': name, 'level': level, 'parent': parent, 'grandparent': grandparent, 'gid': gid}
+    return resolve_regions([item])[0]
+
+
+# ----------------------------------------------------------------------
+# Loading
+# ----------------------------------------------------------------------
+
+def _country_gid(props):
+    # Natural Earth uses -99 for a handful of countries without an ISO code
+    for key in ('gid', 'iso_a3', 'country_code'):
+        value = props.get(key)
+        if value and value != '-99':
+            return value
+    return f"NE.{props['name']}"
+
+
+def feature_gid(props):
+    """The Region gid of a normalized feature"""
+    if props['level'] == 0:
+        return _country_gid(props)
+    return props.get('gid') or f"{props['country']}.{props.get('region')}.{props['name']}"
+
+
+def read_regions(path):
+    """Yield (gid, name, level, country, state) from a normalized GeoJSON layer"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for feature in iter_array(f, 'features'):
+            props = feature['properties']
+            yield feature_gid(props), props['name'], props['level'], props.get('country'), props.get('region')
+
+
+def _copy_upsert(rows):
+    """Postgres: COPY rows into a temp table, then upsert them in one statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE region_load (gid varchar(64), name varchar(255), level integer, parent_id bigint)'
+        )
+        sql = 'COPY region_load (gid, name, level, parent_id) FROM STDIN'
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):  # psycopg 3
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:  # psycopg2
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            raw.copy_expert(sql + " WITH (FORMAT csv)", buf)
+
+        table = Region._meta.db_table
+        cursor.execute(
+            f'INSERT INTO {table} (gid, name, level, parent_id) '
+            f'SELECT DISTINCT ON (gid) gid, name, level, parent_id FROM region_load '
+            f'ON CONFLICT (gid) DO UPDATE SET '
+            f'name = EXCLUDED.name, level = EXCLUDED.level, parent_id = EXCLUDED.parent_id'
+        )
+        cursor.execute('DROP TABLE region_load')
+
+
+def _bulk_upsert(rows):
+    if connection.vendor == 'postgresql':
+        _copy_upsert(rows)
+        return
+    Region.objects.bulk_create(
+        [Region(gid=gid, name=name, level=level, parent_id=parent_id) for gid, name, level, parent_id in rows],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['gid'],
+        update_fields=['name', 'level', 'parent'],
+    )
+
+
+def load_regions(paths, stdout=None):
+    """
+    Upsert every feature of the given layers into Region. Levels are loaded
+    top-down, so parents get their IDs before children reference them.
+    Returns {level: count}.
+    """
+    by_level = {0: [], 1: [], 2: []}
+    for path in paths:
+        for row in read_regions(path):
+            by_level[row[2]].append(row)
+
+    counts = {}
+    with transaction.atomic():
+        countries, states = {}, {}
+        for level in (0, 1, 2):
+            rows = []
+            for gid, name, _, country, state in by_level[level]:
+                if level == 0:
+                    parent_id = None
+                elif level == 1:
+                    parent_id = countries.get(country)
+                else:
+                    parent_id = states.get((country, state))
+                rows.append((gid, name, level, parent_id))
+
+            _bulk_upsert(rows)
+            counts[level] = len(rows)
+            if stdout:
+                stdout.write(f"  level {level}: {len(rows)} regions")
+
+            # IDs for the next level down, in one query
+            if level == 0:
+                countries = dict(Region.objects.filter(level=0).values_list('name', 'id'))
+            elif level == 1:
+                states = {
+                    (country, name): pk for name, country, pk in
+                    Region.objects.filter(level=1).values_list('name', 'parent__name', 'id')
+                }
+        regionindex.invalidate()
+    return counts
+
+
+def link_visits():
+    """Point VisitedLocation rows that predate the gazetteer at their Region. Returns rows linked"""
+    linked = 0
+    pending = VisitedLocation.objects.filter(region__isnull=True)
+    for level in (0, 1, 2):
+        regions = Region.objects.filter(level=level).values_list('id', 'name', 'parent__name', 'parent__parent__name')
+        lookup = {}
+        for pk, name, parent, grandparent in regions:
+            lookup[(name, parent if level else None, grandparent if level == 2 else None)] = pk
+
+        updates = []
+        taken = set(
+            VisitedLocation.objects.filter(region__isnull=False, level=level).values_list('user_id', 'region_id')
+        )
+        for visit in pending.filter(level=level).only('id', 'user_id', 'name', 'parent', 'grandparent'):
+            key = (visit.name, visit.parent if level else None, visit.grandparent if level == 2 else None)
+            pk = lookup.get(key)
+            # One row per (user, region): leave legacy duplicates unlinked
+            if pk and (visit.user_id, pk) not in taken:
+                taken.add((visit.user_id, pk))
+                visit.region_id = pk
+                updates.append(visit)
+        VisitedLocation.objects.bulk_update(updates, ['region'], batch_size=BATCH_SIZE)
+        linked += len(updates)
+    return linked
+
+
+def default_paths():
+    base = settings.GEOJSON_DIR
+    return [os.path.join(base, name) for name in DEFAULT_FILES if os.path.exists(os.path.join(base, name))]
@@ -0,0 +1,280 @@
+"""
+Reverse geocoding: which country / state / district is a lat/lon in?
+
+The normalized boundary layers are loaded once per process into one
+STR-packed R-tree per level (Sort-Tile-Recursive bulk loading: sort by x,
+cut into vertical slices, sort each slice by y, pack runs of NODE_CAPACITY
+boxes into a node, repeat a level up).
+
+Queries run a whole batch of points at once, with numpy throughout:
+1. bounding-box prefilter - (point, node) pairs are expanded level by level
+   down the tree, keeping only boxes that contain the point;
+2. ray casting - candidates are grouped by feature, then by horizontal
+   band of that feature, and tested in one points x edges array operation
+   against only the edges spanning their band (a detailed country outline
+   has tens of thousands of edges; a band holds a few dozen). Rings are
+   combined even-odd, which covers holes and multipolygons alike.
+"""
+import threading
+
+import numpy as np
+
+from .gazetteer import default_paths, feature_gid
+from .streamjson import iter_array
+
+NODE_CAPACITY = 16
+MAX_CELLS = 2_000_000  # points x edges per ray-casting chunk
+MAX_GEOCODE_POINTS = 10000  # per batch request
+EDGES_PER_BAND = 16
+MAX_BANDS = 1024  # per feature
+
+LEVEL_KEYS = {0: 'country', 1: 'state', 2: 'district'}
+
+
+class STRTree:
+    """Static R-tree over (N, 4) boxes [minx, miny, maxx, maxy]"""
+
+    def __init__(self, boxes, capacity=NODE_CAPACITY):
+        self.capacity = capacity
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        # Built leaves up: each level is (boxes, first child, end child) into the level below
+        order = self._str_order(boxes)
+        self.items = order
+        self.levels = [(boxes[order], None, None)]
+        while len(self.levels[-1][0]) > 1:
+            child_boxes = self.levels[-1][0]
+            starts = np.arange(0, len(child_boxes), capacity)
+            ends = np.minimum(starts + capacity, len(child_boxes))
+            parent = np.column_stack([
+                np.minimum.reduceat(child_boxes[:, 0], starts),
+                np.minimum.reduceat(child_boxes[:, 1], starts),
+                np.maximum.reduceat(child_boxes[:, 2], starts),
+                np.maximum.reduceat(child_boxes[:, 3], starts),
+            ])
+            # STR-sort the new level; children ranges move with their node
+            order = self._str_order(parent)
+            self.levels.append((parent[order], starts[order], ends[order]))
+        self.levels.reverse()  # root first
+
+    def _str_order(self, boxes):
+        n = len(boxes)
+        if n <= self.capacity:
+            return np.arange(n)
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        nodes = -(-n // self.capacity)
+        slice_size = self.capacity * int(np.ceil(np.sqrt(nodes)))
+        by_x = np.argsort(cx, kind='stable')
+        order = []
+        for start in range(0, n, slice_size):
+            part = by_x[start:start + slice_size]
+            order.append(part[np.argsort(cy[part], kind='stable')])
+        return np.concatenate(order)
+
+    def query_points(self, xs, ys):
+        """(point index, item index) pairs for every item box containing a point"""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        points = np.arange(len(xs))
+        nodes = np.zeros(len(xs), dtype=np.int64)
+
+        for depth, (boxes, _, _) in enumerate(self.levels):
+            b = boxes[nodes]
+            px, py = xs[points], ys[points]
+            hit = (b[:, 0] <= px) & (px <= b[:, 2]) & (b[:, 1] <= py) & (py <= b[:, 3])
+            points, nodes = points[hit], nodes[hit]
+            if depth == len(self.levels) - 1:
+                break
+            # Expand each surviving (point, node) into (point, child) pairs
+            _, starts, ends = self.levels[depth]
+            counts = ends[nodes] - starts[nodes]
+            points = np.repeat(points, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            nodes = np.repeat(starts[nodes], counts) + offsets
+
+        return points, self.items[nodes]
+
+
+class Layer:
+    """One boundary level: features, their edges and an STR tree of their bboxes"""
+
+    def __init__(self, features):
+        self.info = []
+        edges, offsets, boxes = [], [0], []
+        for feature in features:
+            rings = list(_rings(feature['geometry']))
+            if not rings:
+                continue
+            stacked = np.concatenate(rings)
+            boxes.append([stacked[:, 0].min(), stacked[:, 1].min(), stacked[:, 0].max(), stacked[:, 1].max()])
+            # Edge i runs from vertex i to i + 1 of the same ring
+            for ring in rings:
+                edges.append(np.column_stack([ring[:-1], ring[1:]]))
+            offsets.append(offsets[-1] + sum(len(ring) - 1 for ring in rings))
+            self.info.append(_feature_info(feature['properties']))
+
+        self.edges = np.concatenate(edges) if edges else np.zeros((0, 4))
+        self.offsets = np.asarray(offsets)
+        x1, y1, x2, y2 = self.edges.T
+        dy = y2 - y1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Horizontal edges never cross the ray; their slope is never used
+            self.slope = np.where(dy != 0, (x2 - x1) / np.where(dy != 0, dy, 1), 0.0)
+        self.tree = STRTree(boxes) if boxes else None
+        self._build_bands(np.asarray(boxes).reshape(-1, 4))
+
+    def _build_bands(self, boxes):
+        """
+        Bucket every feature's edges by horizontal band: band b of a feature
+        covers y in [ymin + b * height, ymin + (b + 1) * height] and lists
+        the edges whose y-range overlaps it.
+        """
+        n = len(self.info)
+        self.band_count = np.ones(n, dtype=np.int64)
+        self.band_height = np.ones(n)
+        self.band_ymin = boxes[:, 1] if n else np.zeros(0)
+        self.band_base = np.zeros(n + 1, dtype=np.int64)
+        members, bands = [], []
+        for f in range(n):
+            lo, hi = self.offsets[f], self.offsets[f + 1]
+            ymin, ymax = boxes[f, 1], boxes[f, 3]
+            count = int(min(max((hi - lo) // EDGES_PER_BAND, 1), MAX_BANDS))
+            height = (ymax - ymin) / count or 1.0
+            self.band_count[f], self.band_height[f] = count, height
+            self.band_base[f + 1] = self.band_base[f] + count
+
+            y1, y2 = self.edges[lo:hi, 1], self.edges[lo:hi, 3]
+            first = np.clip(((np.minimum(y1, y2) - ymin) // height).astype(np.int64), 0, count - 1)
+            last = np.clip(((np.maximum(y1, y2) - ymin) // height).astype(np.int64), 0, count - 1)
+            spans = last - first + 1
+            edge_ids = np.repeat(np.arange(lo, hi), spans)
+            offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+            members.append(edge_ids)
+            bands.append(self.band_base[f] + np.repeat(first, spans) + offsets)
+
+        bands = np.concatenate(bands) if bands else np.zeros(0, dtype=np.int64)
+        members = np.concatenate(members) if members else np.zeros(0, dtype=np.int64)
+        order = np.argsort(bands, kind='stable')
+        self.band_edges = members[order]
+        # Edges of global band g: band_edges[band_start[g]:band_start[g + 1]]
+        self.band_start = np.searchsorted(bands[order], np.arange(self.band_base[-1] + 1))
+
+    def __len__(self):
+        return len(self.info)
+
+    def locate(self, xs, ys):
+        """Feature index per point, -1 where no feature contains it"""
+        result = np.full(len(xs), -1, dtype=np.int64)
+        if self.tree is None or not len(xs):
+            return result
+        points, features = self.tree.query_points(xs, ys)
+        if not len(points):
+            return result
+
+        order = np.argsort(features, kind='stable')
+        points, features = points[order], features[order]
+        bounds = np.flatnonzero(np.diff(features)) + 1
+        for group in np.split(np.arange(len(points)), bounds):
+            feature = features[group[0]]
+            candidates = points[group]
+            # Earlier features win where bad data makes boundaries overlap
+            candidates = candidates[result[candidates] == -1]
+            if len(candidates):
+                inside = self._contains(feature, xs[candidates], ys[candidates])
+                result[candidates[inside]] = feature
+        return result
+
+    def _contains(self, feature, px, py):
+        count, height = self.band_count[feature], self.band_height[feature]
+        band = np.clip(((py - self.band_ymin[feature]) // height).astype(np.int64), 0, count - 1)
+        inside = np.zeros(len(px), dtype=bool)
+
+        order = np.argsort(band, kind='stable')
+        splits = np.flatnonzero(np.diff(band[order])) + 1
+        for group in np.split(order, splits):
+            g = self.band_base[feature] + band[group[0]]
+            edges = self.band_edges[self.band_start[g]:self.band_start[g + 1]]
+            if not len(edges):
+                continue
+            x1, y1, y2, slope = self.edges[edges, 0], self.edges[edges, 1], self.edges[edges, 3], self.slope[edges]
+            step = max(1, MAX_CELLS // len(edges))
+            for start in range(0, len(group), step):
+                chunk = group[start:start + step]
+                cx, cy = px[chunk, None], py[chunk, None]
+                crosses = (y1 > cy) != (y2 > cy)
+                left = cx < x1 + (cy - y1) * slope
+                inside[chunk] = np.count_nonzero(crosses & left, axis=1) % 2 == 1
+        return inside
+
+
+def _rings(geometry):
+    if not geometry:
+        return
+    polygons = geometry['coordinates']
+    if geometry['type'] == 'Polygon':
+        polygons = [polygons]
+    elif geometry['type'] != 'MultiPolygon':
+        return
+    for polygon in polygons:
+        for ring in polygon:
+            points = np.asarray(ring, dtype=np.float64)[:, :2]
+            if len(points) < 3:
+                continue
+            if not np.array_equal(points[0], points[-1]):
+                points = np.vstack([points, points[:1]])
+            yield points
+
+
+def _feature_info(props):
+    """The region as a mark request would name it"""
+    level = props['level']
+    return {
+        'name': props['name'],
+        'level': level,
+        'parent': props.get('region') if level == 2 else props.get('country') if level == 1 else None,
+        'grandparent': props.get('country') if level == 2 else None,
+        'gid': feature_gid(props),
+    }
+
+
+class ReverseGeocoder:
+    def __init__(self, paths):
+        by_level = {0: [], 1: [], 2: []}
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for feature in iter_array(f, 'features'):
+                    by_level[feature['properties']['level']].append(feature)
+        self.layers = {level: Layer(features) for level, features in by_level.items()}
+
+    def lookup(self, points):
+        """
+        points: sequence of (lat, lon). Returns one dict per point:
+        {'lat', 'lon', 'country', 'state', 'district'}, each level the region
+        info (ready to post to /mark/) or None.
+        """
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        lats, lons = coords[:, 0], coords[:, 1]
+        located = {level: layer.locate(lons, lats) for level, layer in self.layers.items()}
+
+        results = []
+        for i in range(len(coords)):
+            row = {'lat': float(lats[i]), 'lon': float(lons[i])}
+            for level, key in LEVEL_KEYS.items():
+                feature = located[level][i]
+                row[key] = self.layers[level].info[feature] if feature >= 0 else None
+            results.append(row)
+        return results
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """The process-wide geocoder, built from settings.GEOJSON_DIR on first use"""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = ReverseGeocoder(default_paths())
+    return _geocoder
@@ -0,0 +1,183 @@
+"""
+Import GPS tracks and location history, marking every region they pass
+through.
+
+Supported inputs, all read as streams so memory stays bounded however
+large the file is:
+    gpx       <trkpt>, <rtept> and <wpt> elements (ElementTree.iterparse)
+    geojson   Point / MultiPoint / LineString / MultiLineString features
+    takeout   Google Takeout Records.json ({"locations": [{latitudeE7, ...}]})
+
+Points are snapped to a grid (PRECISION degrees, ~1 km by default) and
+only the first point per cell is kept, which both deduplicates and
+downsamples dense tracks; the set of seen cells is capped at
+MAX_SEEN_CELLS. Unique cells are reverse-geocoded in batches
+(geocoder.py) and the deepest region found per point is marked, with its
+ancestors, through services.mark_locations.
+"""
+import io
+import os
+import xml.etree.ElementTree as ET
+
+from .geocoder import get_geocoder
+from .services import MAX_BATCH, mark_locations
+from .streamjson import iter_array
+
+PRECISION = 0.01  # degrees
+GEOCODE_BATCH = 5000
+# Dedup is only an optimization: forget seen cells past this many to keep memory bounded
+MAX_SEEN_CELLS = 1_000_000
+FORMATS = ('gpx', 'geojson', 'takeout')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class _CountingReader(io.RawIOBase):
+    """Binary file wrapper that counts bytes read, for progress"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+
+def detect_format(name, head):
+    """Guess the format from the file name, then from its first bytes"""
+    ext = os.path.splitext(name or '')[1].lower()
+    if ext == '.gpx':
+        return 'gpx'
+    if ext == '.geojson':
+        return 'geojson'
+    text = head.lstrip()[:4096].decode('utf-8', 'ignore')
+    if text.startswith('<'):
+        return 'gpx'
+    if '"locations"' in text:
+        return 'takeout'
+    if '"features"' in text or '"FeatureCollection"' in text:
+        return 'geojson'
+    raise ImportFormatError('Unrecognized file: expected GPX, GeoJSON or Takeout location history')
+
+
+def iter_gpx(fp):
+    # Detach every point once read, so a huge <trkseg> never accumulates children
+    parents = []
+    for event, elem in ET.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag.rsplit('}', 1)[-1] in ('trkpt', 'rtept', 'wpt'):
+            try:
+                yield float(elem.get('lat')), float(elem.get('lon'))
+            except (TypeError, ValueError):
+                pass
+            if parents:
+                parents[-1].remove(elem)
+
+
+def _geometry_points(geometry):
+    kind, coords = geometry.get('type'), geometry.get('coordinates') or []
+    if kind == 'Point':
+        coords = [coords]
+    elif kind == 'MultiLineString':
+        coords = [point for line in coords for point in line]
+    elif kind not in ('MultiPoint', 'LineString'):
+        return
+    for point in coords:
+        if len(point) >= 2:
+            yield float(point[1]), float(point[0])
+
+
+def iter_geojson(fp):
+    for feature in iter_array(fp, 'features'):
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'GeometryCollection':
+            for part in geometry.get('geometries', []):
+                yield from _geometry_points(part)
+        else:
+            yield from _geometry_points(geometry)
+
+
+def iter_takeout(fp):
+    for record in iter_array(fp, 'locations'):
+        lat, lon = record.get('latitudeE7'), record.get('longitudeE7')
+        if lat is not None and lon is not None:
+            yield lat / 1e7, lon / 1e7
+
+
+def iter_points(fp, fmt):
+    """(lat, lon) from binary file `fp`"""
+    if fmt == 'gpx':
+        return iter_gpx(fp)
+    text = io.TextIOWrapper(fp, encoding='utf-8')
+    if fmt == 'geojson':
+        return iter_geojson(text)
+    if fmt == 'takeout':
+        return iter_takeout(text)
+    raise ImportFormatError(f'Unknown format {fmt!r}')
+
+
+def _deepest(row):
+    return row['district'] or row['state'] or row['country']
+
+
+def import_history(user, fp, name=None, fmt=None, precision=PRECISION, progress=None):
+    """
+    Mark every region the points in binary file `fp` fall in.
+    `progress(stats)` is called after every geocoded batch.
+    Returns stats: {'format', 'bytes', 'points', 'unique', 'matched', 'regions', 'marked'}.
+    """
+    reader = io.BufferedReader(_CountingReader(fp))
+    fmt = fmt or detect_format(name, reader.peek(4096))
+    geocoder = get_geocoder()
+
+    stats = {'format': fmt, 'bytes': 0, 'points': 0, 'unique': 0, 'matched': 0, 'regions': 0, 'marked': 0}
+    seen_cells = set()
+    row_width = round(360 / precision) + 1
+    regions = {}
+    batch = []
+
+    def flush():
+        for row in geocoder.lookup(batch):
+            region = _deepest(row)
+            if region:
+                stats['matched'] += 1
+                regions.setdefault(region['gid'], region)
+        batch.clear()
+        stats['bytes'] = reader.raw.bytes_read
+        stats['regions'] = len(regions)
+        if progress:
+            progress(dict(stats))
+
+    for lat, lon in iter_points(reader, fmt):
+        stats['points'] += 1
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            continue
+        cell = round((lat + 90) / precision) * row_width + round((lon + 180) / precision)
+        if cell in seen_cells:
+            continue
+        if len(seen_cells) >= MAX_SEEN_CELLS:
+            stats['unique'] += len(seen_cells)
+            seen_cells.clear()
+        seen_cells.add(cell)
+        batch.append((lat, lon))
+        if len(batch) >= GEOCODE_BATCH:
+            flush()
+    flush()
+    stats['unique'] += len(seen_cells)
+
+    items = list(regions.values())
+    for start in range(0, len(items), MAX_BATCH):
+        created, _ = mark_locations(user, items[start:start + MAX_BATCH])
+        stats['marked'] += len(created)
+    return stats
@@ -0,0 +1,318 @@
+"""
+Leaderboards: per-board sorted scores, updated incrementally from
+signals.visits_changed and queried for top-N, rank and percentile.
+
+Boards:
+    'countries', 'states', 'districts'   total rows per user at that level
+    'region:<id>'                         visited children of one region
+                                          (states of a country, districts of a state)
+
+Two interchangeable backends, chosen by settings.LEADERBOARD_BACKEND:
+
+  LocalLeaderboard  in-process; a Fenwick tree over integer scores per
+                    board, so rank / percentile are O(log max score). A
+                    snapshot of the database, rebuilt on the first read after
+                    any process changed a visited set (one aggregate over
+                    MapVersion per read tells), so every web worker and job
+                    process answers alike. Rebuilding is O(visited rows):
+                    fine for development and small deployments.
+  RedisLeaderboard  one sorted set per board (ZINCRBY / ZCOUNT / ZREVRANGE,
+                    all O(log n)); shared by every worker. Fill it once
+                    with manage.py rebuild_leaderboards.
+
+Only users with a positive score are on a board. Ties share a rank.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Sum
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Coverage, MapVersion, VisitedLocation
+from .signals import visits_changed
+
+logger = logging.getLogger(__name__)
+
+LEVEL_BOARDS = {0: 'countries', 1: 'states', 2: 'districts'}
+
+
+def region_board(region_id):
+    return f'region:{region_id}'
+
+
+class Leaderboard:
+    """Backend interface. Scores are non-negative ints; members are user ids"""
+
+    # Rebuilt from the database by refresh() rather than updated from signals
+    snapshot = False
+
+    def refresh(self):
+        """Catch up with changes made by other processes; called before every read"""
+
+    def incr(self, board, member, delta):
+        raise NotImplementedError
+
+    def replace(self, boards):
+        """Swap in {board: {member: score}} wholesale"""
+        raise NotImplementedError
+
+    def score(self, board, member):
+        raise NotImplementedError
+
+    def size(self, board):
+        raise NotImplementedError
+
+    def count_above(self, board, score):
+        raise NotImplementedError
+
+    def count_below(self, board, score):
+        raise NotImplementedError
+
+    def top(self, board, n):
+        """[(member, score)] best first"""
+        raise NotImplementedError
+
+    def standing(self, board, member):
+        """{'score', 'rank', 'percentile', 'size'}; rank None if the member isn't on the board"""
+        size = self.size(board)
+        score = self.score(board, member)
+        if not score:
+            return {'score': 0, 'rank': None, 'percentile': 0.0, 'size': size}
+        return {
+            'score': score,
+            'rank': self.count_above(board, score) + 1,
+            # "more than X% of users"
+            'percentile': round(100.0 * self.count_below(board, score) / size, 1),
+            'size': size,
+        }
+
+
+class _Board:
+    """Fenwick tree of member counts indexed by score, plus the members of each score"""
+
+    def __init__(self):
+        self.scores = {}
+        self.by_score = defaultdict(set)
+        self.capacity = 64
+        self.tree = [0] * (self.capacity + 1)
+
+    def _update(self, score, delta):
+        if score >= self.capacity:
+            self._grow(score)
+        i = score + 1
+        while i <= self.capacity:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _grow(self, score):
+        while self.capacity <= score:
+            self.capacity *= 2
+        self.tree = [0] * (self.capacity + 1)
+        for s, members in self.by_score.items():
+            i = s + 1
+            while i <= self.capacity:
+                self.tree[i] += len(members)
+                i += i & -i
+
+    def prefix(self, score):
+        """Members with a score <= `score`"""
+        i = min(score + 1, self.capacity)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def kth(self, k):
+        """The k-th smallest score (1-based)"""
+        pos = 0
+        step = 1 << self.capacity.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos  # tree index pos + 1 holds score pos
+
+    def set(self, member, score):
+        old = self.scores.pop(member, 0)
+        if old:
+            self.by_score[old].discard(member)
+            if not self.by_score[old]:
+                del self.by_score[old]
+            self._update(old, -1)
+        if score > 0:
+            # Tree first: growing it rebuilds from by_score, which mustn't hold the member yet
+            self._update(score, 1)
+            self.scores[member] = score
+            self.by_score[score].add(member)
+
+
+class LocalLeaderboard(Leaderboard):
+    snapshot = True
+
+    def __init__(self):
+        self._boards = defaultdict(_Board)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stamp = None
+
+    def refresh(self):
+        stamp = database_stamp()
+        if stamp == self._stamp:
+            return
+        with self._refresh_lock:
+            if stamp != self._stamp:
+                # Stamp read first: the scores collected after it are at least that new
+                self.replace(collect_scores())
+                self._stamp = stamp
+
+    def incr(self, board, member, delta):
+        with self._lock:
+            b = self._boards[board]
+            score = max(b.scores.get(member, 0) + delta, 0)
+            b.set(member, score)
+            return score
+
+    def replace(self, boards):
+        fresh = defaultdict(_Board)
+        for board, scores in boards.items():
+            for member, score in scores.items():
+                fresh[board].set(member, score)
+        with self._lock:
+            self._boards = fresh
+
+    def score(self, board, member):
+        return self._boards[board].scores.get(member, 0)
+
+    def size(self, board):
+        return len(self._boards[board].scores)
+
+    def count_above(self, board, score):
+        with self._lock:
+            b = self._boards[board]
+            return len(b.scores) - b.prefix(score)
+
+    def count_below(self, board, score):
+        with self._lock:
+            return self._boards[board].prefix(score - 1) if score > 0 else 0
+
+    def top(self, board, n):
+        with self._lock:
+            b = self._boards[board]
+            result = []
+            remaining = len(b.scores)
+            while remaining and len(result) < n:
+                score = b.kth(remaining)
+                members = sorted(b.by_score[score])
+                result.extend((member, score) for member in members[:n - len(result)])
+                remaining -= len(members)
+            return result
+
+
+class RedisLeaderboard(Leaderboard):
+    def __init__(self, url=None, prefix='leaderboard:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured("RedisLeaderboard needs the 'redis' package") from exc
+        url = url or settings.REDIS_URL
+        if not url:
+            raise ImproperlyConfigured("RedisLeaderboard needs REDIS_URL")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, board):
+        return f'{self.prefix}{board}'
+
+    def incr(self, board, member, delta):
+        key = self._key(board)
+        score = int(self.client.zincrby(key, delta, member))
+        if score <= 0:
+            self.client.zremrangebyscore(key, '-inf', 0)
+        return max(score, 0)
+
+    def replace(self, boards):
+        pipe = self.client.pipeline()
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            pipe.delete(key)
+        for board, scores in boards.items():
+            if scores:
+                pipe.zadd(self._key(board), scores)
+        pipe.execute()
+
+    def score(self, board, member):
+        score = self.client.zscore(self._key(board), member)
+        return int(score) if score else 0
+
+    def size(self, board):
+        return self.client.zcard(self._key(board))
+
+    def count_above(self, board, score):
+        return self.client.zcount(self._key(board), f'({score}', '+inf')
+
+    def count_below(self, board, score):
+        return self.client.zcount(self._key(board), '-inf', f'({score}')
+
+    def top(self, board, n):
+        rows = self.client.zrevrange(self._key(board), 0, n - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+
+def collect_scores():
+    """Every board's scores from the database: one GROUP BY plus the coverage table"""
+    boards = defaultdict(dict)
+    totals = VisitedLocation.objects.values_list('user_id', 'level').annotate(n=Count('id')).order_by()
+    for user_id, level, n in totals:
+        boards[LEVEL_BOARDS[level]][user_id] = n
+    for user_id, region_id, visited in Coverage.objects.filter(region__isnull=False, visited__gt=0).values_list(
+        'user_id', 'region_id', 'visited'
+    ):
+        boards[region_board(region_id)][user_id] = visited
+    return boards
+
+
+def database_stamp():
+    """
+    Changes with every committed change to any visited set: each one bumps
+    its user's MapVersion (deleting a user drops a row).
+    """
+    totals = MapVersion.objects.aggregate(users=Count('pk'), versions=Sum('version'))
+    return totals['users'], totals['versions']
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _load():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.LEADERBOARD_BACKEND)()
+    return _backend
+
+
+def get_leaderboard():
+    board = _load()
+    board.refresh()
+    return board
+
+
+@receiver(visits_changed)
+def update_leaderboards(sender, user_id, levels, parents, **kwargs):
+    board = _load()
+    if board.snapshot:
+        # Picks the change up from the database on its next read
+        return
+    for level, n in levels.items():
+        board.incr(LEVEL_BOARDS[level], user_id, n)
+    for parent, n in parents.items():
+        if parent is not None:
+            board.incr(region_board(parent), user_id, n)
@@ -0,0 +1,241 @@
+import json
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activity import events as activity
+from locations.models import VisitedLocation
+from locations.regionindex import get_index
+from locations.synthetic import Atlas, generate_users
+
+BASELINE_DIR = settings.BASE_DIR / 'benchmarks'
+MARK_URL = '/api/locations/mark/'
+MAP_URL = '/api/locations/my-map/'
+SCENARIOS = ('mark', 'unmark', 'my-map', 'my-map cached', 'my-map 304', 'my-map bitmap')
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Latency percentiles and queries per call for mark / unmark / my-map over synthetic users, "
+        "checked against a saved baseline (fails on a regression)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="Synthetic users to spread the calls over")
+        parser.add_argument('--calls', type=int, default=300, help="Timed calls per scenario")
+        parser.add_argument('--warmup', type=int, default=20, help="Untimed calls per scenario first")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='__bench__', help="Username prefix of the synthetic users")
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Only these (repeatable)")
+        parser.add_argument('--baseline', default=None, help="Baseline file (default: benchmarks/api-<vendor>.json)")
+        parser.add_argument('--save', action='store_true', help="Record the results as the new baseline")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help="Allowed latency growth over the baseline, as a fraction (default 0.5 = +50%%)",
+        )
+        parser.add_argument('--slack-ms', type=float, default=1.0, help="Absolute latency slack on top of --tolerance")
+        parser.add_argument('--json', default=None, help="Also write the results to this file")
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def population(self, options):
+        """[(user, token header, a state they haven't visited)], generating users as needed"""
+        atlas = Atlas()
+        created, _ = generate_users(options['users'], prefix=options['prefix'], seed=options['seed'], atlas=atlas)
+        if created:
+            self.stdout.write(f"Generated {created} synthetic users")
+
+        names = [f"{options['prefix']}_{n}" for n in range(options['users'])]
+        users = get_user_model().objects.in_bulk(names, field_name='username')
+        visited = set(
+            VisitedLocation.objects.filter(user__in=users.values(), level=1).values_list('user_id', 'name')
+        )
+        # Marks go to states of a country with states in the gazetteer, so they resolve to Regions
+        country = next(iter(atlas.states))
+        population = []
+        for name in names:
+            user = users[name]
+            state = next(s for s in atlas.states[country] if (user.pk, s['name']) not in visited)
+            population.append((user, f'Bearer {AccessToken.for_user(user)}', state))
+        return population
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def call(self, bucket, fn):
+        # The query log is a bounded deque: once full, captures come back empty
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = fn()
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError(f"{response.status_code} from the benchmark: {response.content[:200]!r}")
+        if bucket is not None:
+            bucket['ms'].append(elapsed * 1000)
+            bucket['queries'].append(len(ctx.captured_queries))
+        # Keep the activity flusher's writes out of the timed calls
+        activity.flush()
+        return response
+
+    def run(self, population, scenarios, options):
+        client = Client()
+        maps = caches['maps']
+        results = {name: {'ms': [], 'queries': []} for name in scenarios}
+        etags = {}
+        rng = random.Random(options['seed'])
+
+        if 'mark' in results or 'unmark' in results:
+            # The first mark / unmark of a country leaves its (zeroed) coverage row behind: start
+            # every user from that steady state so query counts don't depend on earlier runs
+            for user, auth, state in population:
+                for method in (client.post, client.delete):
+                    self.call(None, lambda: method(
+                        MARK_URL, state, content_type='application/json', headers={'Authorization': auth}
+                    ))
+
+        for i in range(options['warmup'] + options['calls']):
+            timed = i >= options['warmup']
+            user, auth, state = rng.choice(population)
+
+            def bucket(name):
+                return results[name] if timed and name in results else None
+
+            if 'mark' in results or 'unmark' in results:
+                # A state the user hasn't got, then gone again: the data is unchanged afterwards
+                self.call(bucket('mark'), lambda: client.post(
+                    MARK_URL, state, content_type='application/json', headers={'Authorization': auth}
+                ))
+                self.call(bucket('unmark'), lambda: client.delete(
+                    MARK_URL, state, content_type='application/json', headers={'Authorization': auth}
+                ))
+            if 'my-map' in results:
+                # Nothing cached for the user: version and payload come from the database
+                maps.clear()
+                get_index()  # ... but the shared region index isn't per-user state
+                self.call(bucket('my-map'), lambda: client.get(MAP_URL, headers={'Authorization': auth}))
+            if 'my-map cached' in results or 'my-map 304' in results:
+                response = self.call(None, lambda: client.get(MAP_URL, headers={'Authorization': auth}))
+                self.call(bucket('my-map cached'), lambda: client.get(MAP_URL, headers={'Authorization': auth}))
+                etags[user.pk] = response['ETag']
+                self.call(bucket('my-map 304'), lambda: client.get(
+                    MAP_URL, headers={'Authorization': auth, 'If-None-Match': etags[user.pk]}
+                ))
+            if 'my-map bitmap' in results:
+                self.call(bucket('my-map bitmap'), lambda: client.get(
+                    MAP_URL, {'encoding': 'bitmap'}, headers={'Authorization': auth}
+                ))
+
+        summary = {}
+        for name, result in results.items():
+            ms = sorted(result['ms'])
+            summary[name] = {
+                'p50_ms': round(percentile(ms, 0.50), 3),
+                'p90_ms': round(percentile(ms, 0.90), 3),
+                'p99_ms': round(percentile(ms, 0.99), 3),
+                'queries': max(result['queries']),
+                'queries_mean': round(sum(result['queries']) / len(result['queries']), 2),
+            }
+        return summary
+
+    # ------------------------------------------------------------------
+    # Baselines
+    # ------------------------------------------------------------------
+
+    def regressions(self, summary, baseline, options, same_params):
+        """
+        Human-readable failures against `baseline`. Mean queries per call
+        depend on which users were sampled, so they only count with the
+        baseline's --users / --calls / --seed.
+        """
+        failures = []
+        for name, now in summary.items():
+            then = baseline['results'].get(name)
+            if then is None:
+                continue
+            more_often = same_params and now['queries_mean'] > then['queries_mean'] + 0.01
+            if now['queries'] > then['queries'] or more_often:
+                failures.append(
+                    f"{name}: {now['queries']} queries per call (mean {now['queries_mean']}), "
+                    f"baseline {then['queries']} (mean {then['queries_mean']})"
+                )
+            # p99 is reported, not checked: over a few hundred calls it is a handful of outliers
+            for key in ('p50_ms', 'p90_ms'):
+                limit = then[key] * (1 + options['tolerance']) + options['slack_ms']
+                if now[key] > limit:
+                    failures.append(f"{name}: {key} {now[key]:.2f} > {limit:.2f} (baseline {then[key]:.2f})")
+        return failures
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or SCENARIOS
+        path = Path(options['baseline'] or BASELINE_DIR / f'api-{connection.vendor}.json')
+        params = {key: options[key] for key in ('users', 'calls', 'seed')}
+
+        population = self.population(options)
+        self.stdout.write(
+            f"{connection.vendor}: {options['calls']} calls per scenario over {options['users']} users "
+            f"(+{options['warmup']} warm-up), in-process through the full middleware stack"
+        )
+        summary = self.run(population, scenarios, options)
+
+        baseline = None
+        if not options['save']:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except FileNotFoundError:
+                self.stdout.write(self.style.WARNING(f"No baseline at {path}: run with --save to record one"))
+            if baseline and baseline['params'] != params:
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline was recorded with {baseline['params']}, this run used {params}"
+                ))
+
+        self.stdout.write(f"{'scenario':<16}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'queries':>9}  baseline p50 / p90 / queries")
+        for name, now in summary.items():
+            then = (baseline or {}).get('results', {}).get(name)
+            against = f"  {then['p50_ms']:.2f} / {then['p90_ms']:.2f} / {then['queries']}" if then else ''
+            self.stdout.write(
+                f"{name:<16}{now['p50_ms']:>9.2f}{now['p90_ms']:>9.2f}{now['p99_ms']:>9.2f}{now['queries']:>9}{against}"
+            )
+
+        record = {
+            'vendor': connection.vendor,
+            'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'params': params,
+            'results': summary,
+        }
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=2)
+        if options['save']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"✅ Saved baseline to {path}"))
+            return
+
+        if baseline:
+            failures = self.regressions(summary, baseline, options, baseline['params'] == params)
+            if failures:
+                for failure in failures:
+                    self.stderr.write(self.style.ERROR(f"❌ {failure}"))
+                raise CommandError(f"{len(failures)} regressions against {path}")
+            self.stdout.write(self.style.SUCCESS(f"✅ No regressions against {path}"))
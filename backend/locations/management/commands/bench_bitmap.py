@@ -0,0 +1,71 @@
+import gzip
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from locations import bitmap
+
+SIZES = (10, 1000, 50000)
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+class Command(BaseCommand):
+    help = "Compare the JSON name-list my-map payload with the bitmap encoding (size and encode/decode time)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--universe', type=int, default=100000, help="Regions in the synthetic gazetteer")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        universe = options['universe']
+        # Gazetteer-like names, roughly the length of real district names
+        names = [f"{rng.choice(['North ', 'South ', 'East ', 'West ', ''])}Region {i}" for i in range(universe)]
+
+        header = (
+            f"{'regions':>7} {'layout':<9} {'json B':>9} {'json gz':>8} {'bitmap B':>9} {'bm gz':>7} "
+            f"{'codec':<5} {'json enc/dec ms':>16} {'bitmap enc/dec ms':>18}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for size in SIZES:
+            if size > universe:
+                continue
+            start = rng.randrange(universe - size + 1)
+            layouts = {
+                # Whole states marked at once: neighbouring indices
+                'clustered': list(range(start, start + size)),
+                'random': rng.sample(range(universe), size),
+            }
+            for layout, indices in layouts.items():
+                self.compare(size, layout, indices, names, universe, options['repeat'])
+
+    def compare(self, size, layout, indices, names, universe, repeat):
+        # Same shape as the real payloads; all one level, which only flatters JSON
+        visited = [names[i] for i in indices]
+
+        json_body, json_enc = timed(lambda: json.dumps({'districts': visited, 'states': [], 'countries': []}), repeat)
+        _, json_dec = timed(lambda: set(json.loads(json_body)['districts']), repeat)
+
+        bm_body, bm_enc = timed(lambda: json.dumps({'bitmap': bitmap.encode(indices, universe)}), repeat)
+        decoded, bm_dec = timed(lambda: set(bitmap.decode(json.loads(bm_body)['bitmap'])), repeat)
+        assert decoded == set(indices)
+
+        self.stdout.write(
+            f"{size:>7} {layout:<9} {len(json_body):>9} {len(gzip.compress(json_body.encode())):>8} "
+            f"{len(bm_body):>9} {len(gzip.compress(bm_body.encode())):>7} "
+            f"{json.loads(bm_body)['bitmap']['codec']:<5} "
+            f"{json_enc:>7.2f} /{json_dec:>7.2f} {bm_enc:>8.2f} /{bm_dec:>8.2f}"
+        )
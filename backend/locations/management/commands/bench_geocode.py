@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from locations.geocoder import ReverseGeocoder
+from locations.gazetteer import default_paths
+
+BATCH_SIZES = (1, 100, 1000, 10000)
+
+
+class Command(BaseCommand):
+    help = "Reverse-geocoding throughput: index build time and points/s per batch size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Normalized GeoJSON layers (default: settings.GEOJSON_DIR)")
+        parser.add_argument('--points', type=int, default=20000, help="Points per batch size")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        geocoder = ReverseGeocoder(options['paths'] or default_paths())
+        layers = ', '.join(f"{len(layer)} L{level}" for level, layer in geocoder.layers.items())
+        self.stdout.write(f"Index built in {time.perf_counter() - start:.2f} s ({layers})")
+
+        rng = np.random.default_rng(options['seed'])
+        n = options['points']
+        scenarios = {
+            # Roughly where the users are: India (states present) and anywhere on land or sea
+            'india': np.column_stack([rng.uniform(8, 35, n), rng.uniform(68, 97, n)]),
+            'world': np.column_stack([rng.uniform(-60, 75, n), rng.uniform(-180, 180, n)]),
+        }
+        for name, points in scenarios.items():
+            for batch in BATCH_SIZES:
+                total = min(n, batch * 200)
+                start = time.perf_counter()
+                hits = 0
+                for i in range(0, total, batch):
+                    hits += sum(1 for row in geocoder.lookup(points[i:i + batch]) if row['country'])
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"  {name:<6} batch {batch:>6}: {total / elapsed:>10.0f} points/s "
+                    f"({total} points, {hits / total:.0%} on land)"
+                )
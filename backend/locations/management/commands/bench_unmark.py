@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from locations.models import VisitedLocation
+from locations.services import unmark_locations
+
+USERNAME = '__bench_unmark__'
+
+
+def legacy_unmark(user, name, level):
+    """The pre-0004 cascade: lookup, target delete, then one delete per child level"""
+    VisitedLocation.objects.filter(user=user, name=name, level=level).first()
+    with transaction.atomic():
+        VisitedLocation.objects.filter(user=user, name=name, level=level).delete()
+        VisitedLocation.objects.filter(user=user, grandparent=name).delete()
+        VisitedLocation.objects.filter(user=user, parent=name).delete()
+
+
+class Command(BaseCommand):
+    help = "Time un-marking a country for a user with many marked districts, old cascade vs single DELETE"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--districts', type=int, default=10000)
+        parser.add_argument('--states', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def seed(self, user, states, districts):
+        rows = [VisitedLocation(user=user, name='Benchland', level=0)]
+        rows += [VisitedLocation(user=user, name=f'S{s}', level=1, parent='Benchland') for s in range(states)]
+        rows += [
+            VisitedLocation(user=user, name=f'D{d}', level=2, parent=f'S{d % states}', grandparent='Benchland')
+            for d in range(districts)
+        ]
+        VisitedLocation.objects.bulk_create(rows, batch_size=2000)
+
+    def run(self, label, fn, user, options):
+        timings = []
+        for _ in range(options['repeat']):
+            self.seed(user, options['states'], options['districts'])
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                fn()
+                timings.append((time.perf_counter() - start) * 1000)
+            VisitedLocation.objects.filter(user=user).delete()
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+        self.stdout.write(
+            f"  {label:<14} p50 {statistics.median(timings):8.1f} ms   p95 {p95:8.1f} ms   "
+            f"{len(ctx.captured_queries)} queries"
+        )
+
+    def handle(self, *args, **options):
+        VisitedLocation.objects.filter(user__username=USERNAME).delete()
+        user, _ = get_user_model().objects.get_or_create(username=USERNAME)
+        try:
+            self.stdout.write(
+                f"User with 1 country / {options['states']} states / {options['districts']} districts marked "
+                f"({connection.vendor}, {options['repeat']} runs)"
+            )
+            for name, level in (('Benchland', 0), ('S0', 1)):
+                item = {'name': name, 'level': level}
+                self.stdout.write(f"Un-mark {name} (level {level}):")
+                self.run('legacy cascade', lambda: legacy_unmark(user, name, level), user, options)
+                self.run('single DELETE', lambda: unmark_locations(user, [item]), user, options)
+
+            self.seed(user, options['states'], options['districts'])
+            counts, _ = unmark_locations(user, [{'name': 'Benchland', 'level': 0}])
+            self.stdout.write(f"Deleted per level for the country: {counts}")
+        finally:
+            user.delete()
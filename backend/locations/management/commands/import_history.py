@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from locations.importer import FORMATS, PRECISION, ImportFormatError, import_history
+
+
+class Command(BaseCommand):
+    help = "Import a GPX track, GeoJSON or Takeout location history and mark the regions it passes through"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Default: detect from name / contents")
+        parser.add_argument('--precision', type=float, default=PRECISION, help="Grid size in degrees for dedup")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+
+        def progress(stats):
+            self.stdout.write(
+                f"  {stats['bytes'] / 1e6:8.1f} MB  {stats['points']:>10} points  {stats['regions']:>6} regions"
+            )
+
+        try:
+            with open(options['path'], 'rb') as f:
+                stats = import_history(
+                    user, f, name=options['path'], fmt=options['format'],
+                    precision=options['precision'], progress=progress,
+                )
+        except ImportFormatError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {stats['format']}: {stats['points']} points, {stats['unique']} unique, "
+            f"{stats['matched']} on the map, {stats['regions']} regions, {stats['marked']} newly marked"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from locations.gazetteer import default_paths, link_visits, load_regions
+
+
+class Command(BaseCommand):
+    help = "Bulk-load or refresh the Region gazetteer from normalized GeoJSON layers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help="Normalized GeoJSON files (default: the layers in settings.GEOJSON_DIR)"
+        )
+        parser.add_argument(
+            '--no-link', action='store_true',
+            help="Don't backfill VisitedLocation.region for rows that predate the gazetteer"
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or default_paths()
+        if not paths:
+            raise CommandError("No normalized GeoJSON found - pass paths or set GEOJSON_DIR")
+
+        for path in paths:
+            self.stdout.write(f"📥 {path}")
+        counts = load_regions(paths, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"✅ Loaded {sum(counts.values())} regions"))
+
+        if not options['no_link']:
+            linked = link_visits()
+            self.stdout.write(f"🔗 Linked {linked} visited locations to regions")
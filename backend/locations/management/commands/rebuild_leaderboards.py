@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from locations.leaderboard import collect_scores, get_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Reload every leaderboard from the database (fills a fresh Redis, repairs drift)"
+
+    def handle(self, *args, **options):
+        boards = collect_scores()
+        get_leaderboard().replace(boards)
+        entries = sum(len(scores) for scores in boards.values())
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {len(boards)} leaderboards ({entries} entries)"))
@@ -0,0 +1,197 @@
+"""
+Cached, versioned my-map payloads.
+
+Every mark / unmark that changes a user's visited set bumps their
+MapVersion row inside the same transaction (and logs the change under that
+version, see changelog.py). The version doubles as the
+ETag and as part of the payload's cache key, so a stale payload can never
+be served: a bump simply makes the old entry unreachable.
+
+The current version itself is cached too (overwritten on commit of a
+bump), so a conditional request for an unchanged map is answered from the
+cache alone, without a database query. Only a cache every process shares
+can hold it: a bump overwrites the writer's own copy, so with a per-process
+cache (LocMemCache, the default without REDIS_URL) other web workers and job
+processes would serve the old version until it expired. There the version
+is read from its row (a primary key lookup) on every request instead.
+
+aget_version() / aget_map() are the same reads for async views, on the
+async cache and ORM APIs.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core.dbrouter import using_replica
+
+from . import bitmap, regionindex
+from .models import MapVersion, VisitedLocation
+
+CACHE_ALIAS = 'maps'
+VERSION_TIMEOUT = 5 * 60  # bounds how long a lost update could leave a stale version cached
+LEVEL_KEYS = {0: 'countries', 1: 'states', 2: 'districts'}
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'version:{user_id}'
+
+
+def _payload_key(user_id, version):
+    return f'payload:{user_id}:{version}'
+
+
+def _version_cached():
+    return not isinstance(_cache(), LocMemCache)
+
+
+def _stored_version(user_id):
+    # Always the primary: a replica's version may lag, and it would stay cached
+    return MapVersion.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('version', flat=True)
+
+
+def get_version(user_id):
+    if not _version_cached():
+        return _stored_version(user_id).first() or 0
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _stored_version(user_id).first() or 0
+        # add(), not set(): never overwrite a version a concurrent bump just stored
+        cache.add(_version_key(user_id), version, VERSION_TIMEOUT)
+    return version
+
+
+async def aget_version(user_id):
+    if not _version_cached():
+        return await _stored_version(user_id).afirst() or 0
+    cache = _cache()
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        version = await _stored_version(user_id).afirst() or 0
+        await cache.aadd(_version_key(user_id), version, VERSION_TIMEOUT)
+    return version
+
+
+def lock_version(user_id):
+    """
+    Current map version, with the user's MapVersion row locked until the
+    transaction ends, so concurrent writers get consecutive versions.
+    """
+    state, _ = MapVersion.objects.select_for_update().get_or_create(user_id=user_id)
+    return state.version
+
+
+def set_version(user_id, version):
+    """Store a version obtained from lock_version() + 1. Call inside the same transaction"""
+    MapVersion.objects.filter(user_id=user_id).update(version=version)
+    if _version_cached():
+        transaction.on_commit(lambda: _cache().set(_version_key(user_id), version, VERSION_TIMEOUT))
+
+
+def _visited_rows(user_id):
+    return VisitedLocation.objects.filter(user_id=user_id).values_list('region_id', 'name', 'level')
+
+
+def _rows_at(user_id, version):
+    """
+    The visited rows as of at least `version`. A replica (core/dbrouter.py)
+    serves them once it has replayed that version; a lagging one would
+    cache an old map under the new version, so then read the primary.
+    """
+    rows = _visited_rows(user_id)
+    if using_replica():
+        replayed = MapVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+        if replayed < version:
+            rows = rows.using(DEFAULT_DB_ALIAS)
+    return list(rows)
+
+
+def names_payload(rows):
+    """The visited set grouped by level, from (region_id, name, level) rows"""
+    payload = {key: [] for key in ('districts', 'states', 'countries')}
+    for _, name, level in rows:
+        payload[LEVEL_KEYS[level]].append(name)
+    return payload
+
+
+def bitmap_payload(rows, index):
+    """
+    The visited set as one bitmap over the region index. Rows not linked to
+    the gazetteer can't be indexed and are listed by name, as in the JSON payload.
+    """
+    indices = []
+    unindexed = {key: [] for key in ('districts', 'states', 'countries')}
+    for region_id, name, level in rows:
+        position = index.position.get(region_id)
+        if position is None:
+            unindexed[LEVEL_KEYS[level]].append(name)
+        else:
+            indices.append(position)
+    return {
+        'manifest': index.version,
+        'bitmap': bitmap.encode(indices, len(index)),
+        'unindexed': unindexed,
+    }
+
+
+def build_payload(user_id, version):
+    """The visited set grouped by level, in one query"""
+    return names_payload(_rows_at(user_id, version))
+
+
+def build_bitmap_payload(user_id, version, index):
+    return bitmap_payload(_rows_at(user_id, version), index)
+
+
+def _payload_cache_key(user_id, version, encoding, index):
+    if encoding == 'bitmap':
+        return f'{_payload_key(user_id, version)}:bitmap:{index.version}'
+    return _payload_key(user_id, version)
+
+
+def get_map(user_id, encoding='names'):
+    """
+    Returns (version, payload), serving the payload from the cache when it is current.
+    encoding: 'names' (lists of names per level) or 'bitmap'.
+    """
+    version = get_version(user_id)
+    cache = _cache()
+    index = regionindex.get_index() if encoding == 'bitmap' else None
+    key = _payload_cache_key(user_id, version, encoding, index)
+    payload = cache.get(key)
+    if payload is None:
+        if encoding == 'bitmap':
+            payload = build_bitmap_payload(user_id, version, index)
+        else:
+            payload = build_payload(user_id, version)
+        cache.set(key, payload)
+    return version, payload
+
+
+async def aget_map(user_id, encoding='names'):
+    version = await aget_version(user_id)
+    cache = _cache()
+    # Built once per process (and on a region reload); may query, so off the event loop
+    index = await sync_to_async(regionindex.get_index)() if encoding == 'bitmap' else None
+    key = _payload_cache_key(user_id, version, encoding, index)
+    payload = await cache.aget(key)
+    if payload is None:
+        if await sync_to_async(using_replica)():
+            rows = await sync_to_async(_rows_at)(user_id, version)
+        else:
+            rows = [row async for row in _visited_rows(user_id)]
+        payload = bitmap_payload(rows, index) if encoding == 'bitmap' else names_payload(rows)
+        await cache.aset(key, payload)
+    return version, payload
+
+
+def etag_for(user_id, version, encoding='names', index=None):
+    if encoding == 'bitmap':
+        # The bitmap also depends on the region index it was encoded against
+        return f'"map-{user_id}-{version}-{(index or regionindex.get_index()).version}"'
+    return f'"map-{user_id}-{version}"'
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Region',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gid', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('level', models.IntegerField(choices=[(0, 'Country'), (1, 'State'), (2, 'District')])),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='locations.region')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='visitedlocation',
+            name='region',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visits', to='locations.region'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitedlocation',
+            constraint=models.UniqueConstraint(fields=('user', 'region'), name='unique_user_region'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(fields=['level', 'name'], name='locations_r_level_936e5e_idx'),
+        ),
+    ]
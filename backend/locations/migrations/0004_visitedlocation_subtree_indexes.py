@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_region_visitedlocation_region'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='visitedlocation',
+            name='locations_v_user_id_4551d1_idx',
+        ),
+        migrations.AddIndex(
+            model_name='visitedlocation',
+            index=models.Index(fields=['user', 'level', 'parent'], name='locations_v_user_id_aeaffd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitedlocation',
+            index=models.Index(fields=['user', 'level', 'grandparent'], name='locations_v_user_id_8a21b9_idx'),
+        ),
+    ]
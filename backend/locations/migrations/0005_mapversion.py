@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0004_visitedlocation_subtree_indexes'),
+        ('users', '0002_user_email_verified_user_phone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='map_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
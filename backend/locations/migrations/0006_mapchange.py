@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0005_mapversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('add', 'Added'), ('remove', 'Removed')], max_length=6)),
+                ('name', models.CharField(max_length=255)),
+                ('level', models.IntegerField(choices=[(0, 'Country'), (1, 'State'), (2, 'District')])),
+                ('parent', models.CharField(blank=True, max_length=255, null=True)),
+                ('grandparent', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='map_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'seq'], name='locations_m_user_id_af783a_idx')],
+            },
+        ),
+    ]
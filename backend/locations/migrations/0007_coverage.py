@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0006_mapchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Coverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visited', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coverage', to='locations.region')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coverage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'region'), name='unique_coverage_user_region'), models.UniqueConstraint(condition=models.Q(('region__isnull', True)), fields=('user',), name='unique_coverage_user_world')],
+            },
+        ),
+    ]
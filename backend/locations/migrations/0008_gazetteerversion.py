@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0007_coverage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GazetteerVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,14 +1,50 @@
 from django.db import models
 from django.conf import settings
 
+LEVEL_CHOICES = (
+    (0, 'Country'),
+    (1, 'State'),
+    (2, 'District'),
+)
+
+
+class Region(models.Model):
+    """
+    Gazetteer entry loaded from the normalized GeoJSON (manage.py load_regions).
+    Integer IDs and GID codes are stable across reloads.
+    """
+    LEVEL_CHOICES = LEVEL_CHOICES
+
+    gid = models.CharField(max_length=64, unique=True)  # GADM GID_n, or ISO3 for countries
+    name = models.CharField(max_length=255)
+    level = models.IntegerField(choices=LEVEL_CHOICES)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['level', 'name']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_level_display()})"
+
+
+class GazetteerVersion(models.Model):
+    """
+    Single row, bumped in the same transaction as every gazetteer (re)load,
+    so each process can tell its region index is out of date (regionindex.py).
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"gazetteer @ {self.version}"
+
+
 class VisitedLocation(models.Model):
-    LEVEL_CHOICES = (
-        (0, 'Country'),
-        (1, 'State'),
-        (2, 'District'),
-    )
+    LEVEL_CHOICES = LEVEL_CHOICES
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='visited_locations')
+    region = models.ForeignKey(Region, on_delete=models.SET_NULL, null=True, blank=True, related_name='visits')
     
     name = models.CharField(max_length=255)
     level = models.IntegerField(choices=LEVEL_CHOICES)
@@ -22,8 +58,85 @@ class VisitedLocation(models.Model):
     class Meta:
         unique_together = ['user', 'name', 'level', 'parent']
         indexes = [
-            models.Index(fields=['user', 'level']),
+            # Subtree deletes: states by country, districts by state / by country
+            models.Index(fields=['user', 'level', 'parent']),
+            models.Index(fields=['user', 'level', 'grandparent']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'region'], name='unique_user_region'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_level_display()})"
+
+
+class MapVersion(models.Model):
+    """
+    Per-user counter bumped by every mark / unmark that changes the visited
+    set. Used as the ETag of the my-map payload and as its cache key.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='map_version')
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.version}"
+
+
+class MapChange(models.Model):
+    """
+    Append-only log of visited-set changes. `seq` is the MapVersion the
+    change produced; every changing transaction logs at least one row, so a
+    user's sequence numbers are contiguous.
+    """
+    ADD = 'add'
+    REMOVE = 'remove'
+    OP_CHOICES = (
+        (ADD, 'Added'),
+        (REMOVE, 'Removed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='map_changes')
+    seq = models.BigIntegerField()
+    op = models.CharField(max_length=6, choices=OP_CHOICES)
+
+    name = models.CharField(max_length=255)
+    level = models.IntegerField(choices=LEVEL_CHOICES)
+    parent = models.CharField(max_length=255, null=True, blank=True)
+    grandparent = models.CharField(max_length=255, null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seq']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} #{self.seq} {self.op} {self.name}"
+
+
+class Coverage(models.Model):
+    """
+    Materialized "X of Y" per user and parent region: how many of `region`'s
+    children the user has visited. region NULL is the world (countries).
+    Maintained incrementally by services.py; manage.py rebuild_coverage repairs drift.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='coverage')
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True, blank=True, related_name='coverage')
+    visited = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'region'], name='unique_coverage_user_region'),
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(region__isnull=True), name='unique_coverage_user_world'
+            ),
+        ]
+
+    @property
+    def percent(self):
+        return round(100.0 * self.visited / self.total, 1) if self.total else 0.0
 
     def __str__(self):
-        return f"{self.name} ({self.get_level_display()})"
\ No newline at end of file
+        return f"{self.user_id} {self.region_id or 'world'}: {self.visited}/{self.total}"
@@ -0,0 +1,139 @@
+"""
+Dense index over the Region gazetteer, shared by server and client so a
+visited set can travel as a bitmap (bitmap.py) instead of names.
+
+Index i is the i-th Region by primary key. The manifest lists every
+region in index order together with a version hash of that order; the
+client caches it by version and only re-downloads after the gazetteer is
+reloaded (load_regions), which is what changes the version.
+
+Each process builds the index once and keeps it until the gazetteer's
+generation, a database row bumped by every reload, moves on. Every web
+and job worker thus notices a reload made by any other process.
+"""
+import hashlib
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+
+from .models import GazetteerVersion, Region
+
+# Seconds a process goes on using its index before asking whether the
+# gazetteer was reloaded elsewhere (load_regions in another process)
+CHECK_INTERVAL = 5
+
+# This process's index, the gazetteer generation it was built at, and
+# when that generation was last compared with the stored one
+_index = None
+_generation = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+class RegionIndex:
+    def __init__(self, rows):
+        # rows: (id, gid, name, level, parent_id) ordered by id
+        self.position = {pk: i for i, (pk, *_) in enumerate(rows)}
+        # Parent id per region, and children per parent id (None: countries), for coverage
+        self.parent_of = {}
+        self.child_counts = {}
+        # Lookups for resolve(): gid -> id, (name, level) -> ids, id -> (name, level)
+        self.by_gid = {}
+        self.by_name = {}
+        self.names = {}
+        for pk, gid, name, level, parent_id in rows:
+            self.parent_of[pk] = parent_id
+            self.child_counts[parent_id] = self.child_counts.get(parent_id, 0) + 1
+            self.by_gid[gid] = pk
+            self.by_name.setdefault((name, level), []).append(pk)
+            self.names[pk] = (name, level)
+        self.regions = [
+            [gid, name, level, self.position.get(parent_id) if parent_id else None]
+            for _, gid, name, level, parent_id in rows
+        ]
+        digest = hashlib.sha256()
+        for gid, name, level, parent in self.regions:
+            digest.update(f'{gid}\t{name}\t{level}\t{parent}\n'.encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def resolve(self, name, level, parent=None, grandparent=None, gid=None):
+        """
+        Region id a mark request refers to, or None if it isn't in the
+        gazetteer. Same rules as gazetteer.resolve_regions, without a query.
+        """
+        pk = self.by_gid.get(gid) if gid else None
+        if pk is not None:
+            return pk
+        for pk in self.by_name.get((name, level), ()):
+            parent_id = self.parent_of[pk]
+            if parent and level >= 1 and (parent_id is None or self.names[parent_id][0] != parent):
+                continue
+            if grandparent and level == 2:
+                grandparent_id = self.parent_of.get(parent_id)
+                if grandparent_id is None or self.names[grandparent_id][0] != grandparent:
+                    continue
+            return pk
+        return None
+
+    def lineage(self, pk):
+        """(name, level, parent name, grandparent name) of region `pk`, as VisitedLocation stores them"""
+        name, level = self.names[pk]
+        ancestors = []
+        parent_id = self.parent_of[pk]
+        while parent_id is not None and len(ancestors) < 2:
+            ancestors.append(self.names[parent_id][0])
+            parent_id = self.parent_of[parent_id]
+        parent, grandparent = (ancestors + [None, None])[:2]
+        return name, level, parent, grandparent
+
+    def manifest(self):
+        """[gid, name, level, parent index or None] per index"""
+        return {
+            'version': self.version,
+            'fields': ['gid', 'name', 'level', 'parent'],
+            'regions': self.regions,
+        }
+
+
+def build_index():
+    rows = Region.objects.using(DEFAULT_DB_ALIAS).order_by('id').values_list('id', 'gid', 'name', 'level', 'parent_id')
+    return RegionIndex(list(rows))
+
+
+def _stored_generation():
+    # The primary: an index built from a lagging replica would stick until the next reload
+    row = GazetteerVersion.objects.using(DEFAULT_DB_ALIAS).filter(pk=1).values_list('version', flat=True)
+    return row.first() or 0
+
+
+def get_index():
+    """
+    The current RegionIndex. The stored gazetteer generation is checked at
+    most every CHECK_INTERVAL seconds; the index is rebuilt from the DB only
+    when it changed.
+    """
+    global _index, _generation, _checked
+    index = _index
+    if index is not None and time.monotonic() - _checked < CHECK_INTERVAL:
+        return index
+    with _lock:
+        if _index is None or time.monotonic() - _checked >= CHECK_INTERVAL:
+            generation = _stored_generation()
+            if _index is None or generation != _generation:
+                _index, _generation = build_index(), generation
+            _checked = time.monotonic()
+        return _index
+
+
+def invalidate():
+    """Call inside the transaction that (re)loaded the gazetteer"""
+    global _index
+    if not GazetteerVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        GazetteerVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    with _lock:
+        _index = None
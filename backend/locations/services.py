@@ -0,0 +1,308 @@
+"""
+Set-based mark / unmark operations shared by the single and batch endpoints.
+
+A mark request expands to its ancestor closure (district -> state ->
+country) in memory; the whole closure is then checked against the user's
+rows with one SELECT and the missing rows are inserted with one
+INSERT ... ON CONFLICT DO NOTHING RETURNING. Unmarks of any number of regions, with their whole
+subtrees, go out as one DELETE ... RETURNING. Items are resolved to their
+Region once, in memory (clean_item); from then on gazetteer rows are told
+apart by region id, never by name alone.
+
+Both bump the user's map version, log what changed under it
+(changelog.py) and adjust the user's coverage counts (coverage.py), in
+the same transaction as the change itself. Everything else (leaderboards,
+...) listens to signals.visits_changed, sent once that transaction commits.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import changelog, coverage, regionindex
+from .mapcache import lock_version, set_version
+from .models import MapChange, Region, VisitedLocation
+from .signals import send_on_commit
+
+MAX_BATCH = 1000
+# Rows per INSERT statement (7 parameters each)
+INSERT_BATCH = 1000
+
+
+def clean_item(raw):
+    """Normalize one request item and resolve it to its Region. Returns (item, error)"""
+    if not isinstance(raw, dict):
+        return None, 'Each item must be an object'
+    name, level = raw.get('name'), raw.get('level')
+    if name is None or level is None:
+        return None, 'Missing name or level'
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        return None, 'Invalid level'
+    if level not in (0, 1, 2):
+        return None, 'Invalid level'
+    return with_region(dict(raw, level=level)), None
+
+
+def with_region(item):
+    """
+    `item` resolved to a Region id against the in-memory region index. A
+    gazetteer region takes its names from the gazetteer; anything else
+    keeps the names it came with and region None.
+    """
+    index = regionindex.get_index()
+    name, level = item['name'], int(item['level'])
+    parent, grandparent = item.get('parent'), item.get('grandparent')
+    region = index.resolve(name, level, parent, grandparent, item.get('gid'))
+    if region is not None:
+        name, level, parent, grandparent = index.lineage(region)
+    return {
+        'name': name,
+        'level': level,
+        'parent': parent,
+        'grandparent': grandparent,
+        'gid': item.get('gid'),
+        'region': region,
+    }
+
+
+def _resolved(items):
+    # Items from clean_item are resolved already; importers pass raw dicts
+    return [item if 'region' in item else with_region(item) for item in items]
+
+
+def ancestor_closure(items):
+    """
+    Expand resolved items into every row that must exist, ancestors
+    included. Gazetteer rows are keyed by region id and take their
+    ancestors from the region tree; the rest by (name, level, parent),
+    like VisitedLocation's unique_together.
+    Returns {key: row_spec}; ancestors carry 'auto': True.
+    """
+    index = regionindex.get_index()
+    closure = {}
+
+    def add(name, level, parent, grandparent, region, auto):
+        key = region if region is not None else (name, level, parent)
+        if key not in closure:
+            closure[key] = {
+                'name': name, 'level': level, 'parent': parent,
+                'grandparent': grandparent, 'region': region, 'auto': auto,
+            }
+        elif not auto:
+            closure[key]['auto'] = False
+
+    def add_ancestors(region):
+        while region is not None:
+            add(*index.lineage(region), region, auto=True)
+            region = index.parent_of[region]
+
+    for item in items:
+        name, level, region = item['name'], item['level'], item['region']
+        parent, grandparent = item['parent'], item['grandparent']
+        add(name, level, parent, grandparent, region, auto=False)
+
+        if region is not None:
+            add_ancestors(index.parent_of[region])
+        elif level == 2 and parent and grandparent:
+            state = index.resolve(parent, 1, grandparent)
+            if state is None:
+                add(parent, 1, grandparent, None, None, auto=True)
+                add(grandparent, 0, None, None, index.resolve(grandparent, 0), auto=True)
+            add_ancestors(state)
+        elif level == 1 and parent:
+            add(parent, 0, None, None, index.resolve(parent, 0), auto=True)
+
+    return closure
+
+
+def _insert(user_id, specs):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING the rows that went in, as
+    (region_id, name, level, parent). bulk_create(ignore_conflicts=True)
+    can't tell which rows it dropped.
+    """
+    table = VisitedLocation._meta.db_table
+    marked_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(specs), INSERT_BATCH):
+            batch = specs[start:start + INSERT_BATCH]
+            params = []
+            for spec in batch:
+                params += [
+                    user_id, spec['region'], spec['name'], spec['level'],
+                    spec['parent'], spec['grandparent'], marked_at,
+                ]
+            values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, region_id, name, level, parent, grandparent, marked_at) '
+                f'VALUES {values} ON CONFLICT DO NOTHING RETURNING region_id, name, level, parent',
+                params,
+            )
+            inserted += cursor.fetchall()
+    return inserted
+
+
+def _split(specs, rows):
+    """(specs without a row, specs with one) among `rows` of (region_id, name, level, parent)"""
+    regions, keys = set(), set()
+    for region, name, level, parent in rows:
+        if region is not None:
+            regions.add(region)
+        keys.add((name, level, parent))
+    missing, found = [], []
+    for spec in specs:
+        match = spec['region'] in regions or (spec['name'], spec['level'], spec['parent']) in keys
+        (found if match else missing).append(spec)
+    return missing, found
+
+
+def mark_locations(user, items):
+    """
+    Mark `items` and their ancestors for `user`.
+    Returns (created, existing): lists of row specs, requested items first.
+    """
+    closure = ancestor_closure(_resolved(items))
+
+    regions = [spec['region'] for spec in closure.values() if spec['region'] is not None]
+    names = {spec['name'] for spec in closure.values()}
+    with transaction.atomic():
+        # Lock first: concurrent marks of the same rows must not both count them
+        seq = lock_version(user.pk) + 1
+        rows = VisitedLocation.objects.filter(user=user).filter(Q(region_id__in=regions) | Q(name__in=names))
+        created, existing = _split(closure.values(), rows.values_list('region_id', 'name', 'level', 'parent'))
+        if not created:
+            return created, existing
+
+        # Only the rows that really went in may reach the change log and the
+        # counts: a conflicting row written meanwhile is skipped, not counted
+        dropped, created = _split(created, _insert(user.pk, created))
+        existing += dropped
+        if not created:
+            return created, existing
+
+        changelog.record(
+            user.pk, seq, MapChange.ADD,
+            [(spec['name'], spec['level'], spec['parent'], spec['grandparent']) for spec in created],
+        )
+        parent_of = regionindex.get_index().parent_of
+        parents = Counter(parent_of[spec['region']] for spec in created if spec['region'] is not None)
+        coverage.apply(user.pk, parents)
+        set_version(user.pk, seq)
+        send_on_commit(user.pk, Counter(spec['level'] for spec in created), parents, seq)
+
+    return created, existing
+
+
+def _equals(column, value):
+    if value is None:
+        return f'{column} IS NULL', []
+    return f'{column} = %s', [value]
+
+
+def _subtree_sql(items):
+    """
+    WHERE clauses for resolved `items` themselves and for everything below
+    them (the states and districts of a country, the districts of a state).
+    Gazetteer rows match on region_id, their subtree through the Region
+    parent chain. Rows outside the gazetteer (region_id NULL) match on their
+    whole name hierarchy, so a same-named state elsewhere is never touched.
+    Returns (roots_sql, roots_params, subtree_sql, subtree_params).
+    """
+    roots, roots_params = [], []
+    children, children_params = [], []
+
+    regions = sorted({item['region'] for item in items if item['region'] is not None})
+    if regions:
+        ids = ', '.join(['%s'] * len(regions))
+        table = Region._meta.db_table
+        roots.append(f'region_id IN ({ids})')
+        roots_params += regions
+        children.append(
+            f'region_id IN (SELECT id FROM {table} WHERE parent_id IN ({ids}) '
+            f'OR parent_id IN (SELECT id FROM {table} WHERE parent_id IN ({ids})))'
+        )
+        children_params += regions * 2
+
+    for item in items:
+        name, level, parent = item['name'], item['level'], item['parent']
+        parent_sql, parent_params = _equals('parent', parent)
+        roots.append(f'(region_id IS NULL AND name = %s AND level = %s AND {parent_sql})')
+        roots_params += [name, level] + parent_params
+        if level == 0:
+            children.append('(region_id IS NULL AND ((level = 1 AND parent = %s) OR (level = 2 AND grandparent = %s)))')
+            children_params += [name, name]
+        elif level == 1:
+            grandparent_sql, grandparent_params = _equals('grandparent', parent)
+            children.append(f'(region_id IS NULL AND level = 2 AND parent = %s AND {grandparent_sql})')
+            children_params += [name] + grandparent_params
+    roots_sql = ' OR '.join(roots)
+    return roots_sql, roots_params, ' OR '.join([roots_sql] + children), roots_params + children_params
+
+
+def unmark_locations(user, items):
+    """
+    Delete `items` and their descendants for `user` in one statement, without
+    loading the subtree into Python first.
+    Returns (counts, roots): deleted rows per level ({0: n, 1: n, 2: n}) and
+    the (name, level, parent, grandparent) of each requested row that existed.
+    """
+    counts = {0: 0, 1: 0, 2: 0}
+    if not items:
+        return counts, []
+    items = _resolved(items)
+    roots_sql, roots_params, subtree_sql, subtree_params = _subtree_sql(items)
+    delete = (
+        f'DELETE FROM {VisitedLocation._meta.db_table} '
+        f'WHERE user_id = %s AND ({subtree_sql}) '
+        f'RETURNING name, level, parent, grandparent, region_id'
+    )
+    params = [user.pk] + subtree_params
+
+    roots = []
+    parents = Counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        seq = lock_version(user.pk) + 1
+        if connection.vendor == 'postgresql':
+            # Log and aggregate server side: a few rows back instead of the whole subtree.
+            # Row kinds: per-level counts, the requested rows, removals per parent region
+            cursor.execute(
+                f'WITH gone AS ({delete}), '
+                f'logged AS ({changelog.record_sql("gone")}) '
+                f"SELECT 'level', level, COUNT(*), NULL, NULL, NULL FROM gone GROUP BY level "
+                f'UNION ALL '
+                f"SELECT 'root', level, 0, name, parent, grandparent FROM gone WHERE {roots_sql} "
+                f'UNION ALL '
+                f"SELECT 'parent', r.parent_id, COUNT(*), NULL, NULL, NULL FROM gone "
+                f'JOIN {Region._meta.db_table} r ON r.id = gone.region_id GROUP BY r.parent_id',
+                params + [user.pk, seq] + roots_params,
+            )
+            for kind, key, count, name, parent, grandparent in cursor.fetchall():
+                if kind == 'level':
+                    counts[key] = count
+                elif kind == 'root':
+                    roots.append((name, key, parent, grandparent))
+                else:
+                    parents[key] = count
+        else:
+            cursor.execute(delete, params)
+            rows = cursor.fetchall()
+            changelog.record(user.pk, seq, MapChange.REMOVE, [row[:4] for row in rows])
+            wanted_regions = {item['region'] for item in items} - {None}
+            wanted_keys = {(item['name'], item['level'], item['parent']) for item in items}
+            parent_of = regionindex.get_index().parent_of
+            for name, level, parent, grandparent, region_id in rows:
+                counts[level] += 1
+                if region_id in wanted_regions or (region_id is None and (name, level, parent) in wanted_keys):
+                    roots.append((name, level, parent, grandparent))
+                if region_id is not None:
+                    parents[parent_of.get(region_id)] += 1
+        if any(counts.values()):
+            removed = {parent: -n for parent, n in parents.items()}
+            coverage.apply(user.pk, removed)
+            set_version(user.pk, seq)
+            send_on_commit(user.pk, {level: -n for level, n in counts.items()}, removed, seq)
+    return counts, roots
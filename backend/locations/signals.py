@@ -0,0 +1,31 @@
+"""
+visits_changed: sent after a mark / unmark that changed a user's visited
+set has committed. Receivers get the net change, never the rows:
+
+    levels   {level: +/- rows}               e.g. {2: +3, 1: +1}
+    parents  {parent region id or None: +/- rows linked to the gazetteer}
+    seq      the map version the change produced
+
+The change is already committed, so a failing receiver is logged rather
+than turning the request into an error.
+"""
+import logging
+
+from django.db import transaction
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+visits_changed = Signal()
+
+
+def _send(**kwargs):
+    for receiver, result in visits_changed.send_robust(sender=None, **kwargs):
+        if isinstance(result, Exception):
+            logger.error("visits_changed receiver %r failed", receiver, exc_info=result)
+
+
+def send_on_commit(user_id, levels, parents, seq):
+    levels = {level: n for level, n in levels.items() if n}
+    parents = {parent: n for parent, n in parents.items() if n}
+    transaction.on_commit(lambda: _send(user_id=user_id, levels=levels, parents=parents, seq=seq))
@@ -0,0 +1,71 @@
+"""
+Incremental reader for the one big array inside a large JSON document
+(the "features" of a FeatureCollection, the "locations" of a location
+history export, ...).
+
+Items are decoded one at a time with JSONDecoder.raw_decode over a sliding
+buffer, so memory stays bounded by the largest single item rather than the
+file. Same approach as scripts/normalize_gadm.py --stream.
+"""
+import json
+import re
+
+READ_CHUNK = 1 << 20  # 1 MB
+_SEPARATORS = ' \t\n\r,'
+
+
+def iter_array(fp, key, chunk_size=READ_CHUNK):
+    """Yield each element of the first array stored under `key` in text file `fp`"""
+    pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(min_size):
+        # Drop consumed text, then read until `min_size` unread chars are buffered
+        nonlocal buf, pos, eof
+        if pos:
+            buf = buf[pos:]
+            pos = 0
+        while not eof and len(buf) < min_size:
+            chunk = fp.read(max(chunk_size, min_size - len(buf)))
+            if not chunk:
+                eof = True
+            buf += chunk
+
+    # 1. Seek to the opening bracket of the array
+    while True:
+        fill(len(buf) + chunk_size)
+        match = pattern.search(buf)
+        if match:
+            pos = match.end()
+            break
+        if eof:
+            raise ValueError(f"No '{key}' array found")
+        # Keep a tail in case the key straddles two chunks
+        buf = buf[-(len(key) + 16):]
+
+    # 2. Decode elements one at a time
+    while True:
+        while pos < len(buf) and buf[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError(f"Unterminated '{key}' array")
+            fill(chunk_size)
+            continue
+        if buf[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Item runs past the buffer - at least double what we hold
+            fill(2 * (len(buf) - pos) + chunk_size)
+            continue
+
+        pos = end
+        yield item
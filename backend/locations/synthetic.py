@@ -0,0 +1,127 @@
+"""
+Synthetic users with plausible visited sets, for benchmarks and local load
+tests (manage.py generate_users, manage.py bench_api).
+
+Places come from the normalized GeoJSON layers (gazetteer.default_paths),
+and the shape of a visited set follows what real accounts look like:
+
+    - a home country, picked by a Zipf-like popularity, where most of the
+      marking happens: a good share of its states, and some districts in
+      each of those
+    - a long tail of other countries (log-normal count, median ~5), mostly
+      marked as a whole, now and then with a state or two
+
+Layers without districts (the repo ships countries and Indian states only)
+get `districts_per_state` made-up ones, so every user still has the
+three-level tree the API has to handle. Everything is driven by one seed:
+the same arguments always produce the same users and visits.
+"""
+import math
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .gazetteer import default_paths, read_regions
+from .services import MAX_BATCH, mark_locations
+
+PASSWORD = 'synthetic'
+
+
+def _item(name, level, parent=None, grandparent=None, gid=None):
+    return {'name': name, 'level': level, 'parent': parent, 'grandparent': grandparent, 'gid': gid}
+
+
+class Atlas:
+    """Countries -> states -> districts, as mark items"""
+
+    def __init__(self, paths=None, districts_per_state=12):
+        self.countries = {}  # name -> item
+        self.states = {}  # country -> [item]
+        self.districts = {}  # (country, state) -> [item]
+        for path in paths or default_paths():
+            for gid, name, level, country, state in read_regions(path):
+                if level == 0:
+                    self.countries[name] = _item(name, 0, gid=gid)
+                elif level == 1:
+                    self.states.setdefault(country, []).append(_item(name, 1, country, gid=gid))
+                else:
+                    self.districts.setdefault((country, state), []).append(_item(name, 2, state, country, gid))
+        if not self.countries:
+            raise ValueError("No countries in the GeoJSON layers")
+
+        for country, states in self.states.items():
+            for state in states:
+                if (country, state['name']) not in self.districts:
+                    self.districts[(country, state['name'])] = [
+                        _item(f"{state['name']} {n + 1}", 2, state['name'], country)
+                        for n in range(districts_per_state)
+                    ]
+
+        # Popularity: a fixed shuffle ranked by 1/rank, countries with states up front
+        names = sorted(self.countries)
+        random.Random(0).shuffle(names)
+        names.sort(key=lambda name: name not in self.states)
+        self.ranked = names
+        self.weights = [1 / (rank + 1) for rank in range(len(names))]
+
+    def visits(self, rng):
+        """Mark items for one user, deepest level only (mark_locations adds the ancestors)"""
+        home = rng.choices(self.ranked, self.weights)[0]
+        abroad = min(len(self.ranked) - 1, int(rng.lognormvariate(math.log(5), 0.9)))
+        others = set()
+        while len(others) < abroad:
+            name = rng.choices(self.ranked, self.weights)[0]
+            if name != home:
+                others.add(name)
+
+        items = []
+        for country in [home, *sorted(others)]:
+            states = self.states.get(country)
+            if not states:
+                items.append(self.countries[country])
+                continue
+            if country == home:
+                share = rng.betavariate(2, 3)
+            else:
+                share = rng.random() * 0.1
+            picked = rng.sample(states, round(share * len(states)))
+            if not picked:
+                items.append(self.countries[country])
+            for state in picked:
+                districts = self.districts[(country, state['name'])]
+                chosen = rng.sample(districts, round(rng.betavariate(1.5, 4) * len(districts)))
+                items.extend(chosen or [state])
+        return items
+
+
+def generate_users(count, prefix='synth', seed=0, atlas=None, stdout=None):
+    """
+    Create users `<prefix>_<n>` for n < count (existing ones are skipped)
+    and mark their visits through mark_locations, so versions, change log,
+    coverage and leaderboards are all kept up to date. Returns
+    (users created, locations marked).
+    """
+    atlas = atlas or Atlas()
+    User = get_user_model()
+    names = [f'{prefix}_{n}' for n in range(count)]
+    existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+    password = make_password(PASSWORD)  # hash once, not once per user
+
+    created = marked = 0
+    for n, username in enumerate(names):
+        # One generator per user: user n gets the same visits however many are made
+        rng = random.Random(f'{seed}:{n}')
+        if username in existing:
+            continue
+        items = atlas.visits(rng)
+        with transaction.atomic():
+            user = User.objects.create(username=username, email=f'{username}@example.com', password=password)
+            for start in range(0, len(items), MAX_BATCH):
+                rows, _ = mark_locations(user, items[start:start + MAX_BATCH])
+                marked += len(rows)
+        created += 1
+        if stdout and created % 100 == 0:
+            stdout.write(f"  {created} users, {marked} locations")
+    return created, marked
@@ -0,0 +1,34 @@
+"""Background tasks for the locations app (run by `manage.py run_worker`)"""
+import os
+
+from django.contrib.auth import get_user_model
+
+from activity.events import emit
+from jobs.queue import set_progress, task
+
+from .importer import import_history
+
+
+@task(queue='imports', timeout=60 * 60, max_attempts=2, bind=True)
+def import_history_file(job, path, name=None, fmt=None):
+    """Import an uploaded history file saved at `path`, deleting it once done"""
+    user = get_user_model().objects.get(pk=job.user_id)
+    size = os.path.getsize(path)
+
+    def progress(stats):
+        set_progress(job, {**stats, 'total_bytes': size})
+
+    with open(path, 'rb') as f:
+        stats = import_history(user, f, name=name, fmt=fmt, progress=progress)
+    os.remove(path)
+    emit('history.imported', user, file=name, **stats)
+    return stats
+
+
+@import_history_file.on_failure
+def remove_history_file(job, path, name=None, fmt=None):
+    """The last attempt failed: nothing will read the upload again"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
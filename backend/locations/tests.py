@@ -1,3 +1,1071 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, F
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from jobs import queue
+from jobs.models import Job
+
+from . import bitmap, coverage, leaderboard, mapcache, regionindex, services, topojson
+from .async_views import AsyncMarkLocationView, AsyncUserMapDataView
+from .changelog import changes_since
+from .geocoder import MAX_GEOCODE_POINTS, ReverseGeocoder
+from .importer import ImportFormatError, detect_format, import_history
+from .management.commands.bench_api import SCENARIOS, Command as BenchCommand
+from .models import Coverage, GazetteerVersion, MapChange, MapVersion, Region, VisitedLocation
+from .services import mark_locations, unmark_locations
+from .synthetic import PASSWORD, Atlas, generate_users
+from .tasks import import_history_file
+from .tiles import get_archive
+
+
+class GazetteerTestCase(TestCase):
+    """Two countries that each have a state called Punjab, with one district apiece"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.india = Region.objects.create(gid='IND', name='India', level=0)
+        cls.pakistan = Region.objects.create(gid='PAK', name='Pakistan', level=0)
+        cls.punjab_in = Region.objects.create(gid='IND.28_1', name='Punjab', level=1, parent=cls.india)
+        cls.punjab_pk = Region.objects.create(gid='PAK.7_1', name='Punjab', level=1, parent=cls.pakistan)
+        cls.amritsar = Region.objects.create(gid='IND.28.1_1', name='Amritsar', level=2, parent=cls.punjab_in)
+        cls.lahore = Region.objects.create(gid='PAK.7.1_1', name='Lahore', level=2, parent=cls.punjab_pk)
+        cls.user = get_user_model().objects.create_user(username='traveller', password='x')
+
+    def setUp(self):
+        # Map payloads live in the 'maps' cache, account states in the default
+        # one, the region index in the process; none is rolled back between tests
+        caches['maps'].clear()
+        caches['default'].clear()
+        regionindex.invalidate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def visited(self):
+        return set(VisitedLocation.objects.filter(user=self.user).values_list('name', 'level', 'parent'))
+
+    def coverage(self):
+        return dict(Coverage.objects.filter(user=self.user).values_list('region_id', 'visited'))
+
+
+class BatchMarkTests(GazetteerTestCase):
+    AMRITSAR = {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}
+    LAHORE = {'name': 'Lahore', 'level': 2, 'parent': 'Punjab', 'grandparent': 'Pakistan'}
+
+    def test_batch_marks_ancestors_once(self):
+        response = self.client.post('/api/locations/mark/batch/', {'mark': [self.AMRITSAR, self.LAHORE]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'status': 'ok', 'marked': 6, 'unmarked': 0})
+        self.assertEqual(MapChange.objects.filter(user=self.user, seq=1, op=MapChange.ADD).count(), 6)
+        self.assertEqual(self.coverage(), {None: 2, self.india.pk: 1, self.pakistan.pk: 1,
+                                           self.punjab_in.pk: 1, self.punjab_pk.pk: 1})
+
+    def test_marking_again_changes_nothing(self):
+        mark_locations(self.user, [self.AMRITSAR])
+        created, existing = mark_locations(self.user, [self.AMRITSAR])
+        self.assertEqual(created, [])
+        self.assertEqual([spec['name'] for spec in existing], ['Amritsar', 'Punjab', 'India'])
+        self.assertEqual(MapVersion.objects.get(user=self.user).version, 1)
+
+    def test_batch_unmark_then_mark(self):
+        mark_locations(self.user, [self.AMRITSAR])
+        response = self.client.post('/api/locations/mark/batch/', {
+            'unmark': [{'name': 'India', 'level': 0}], 'mark': [self.LAHORE],
+        }, format='json')
+        self.assertEqual(response.data, {'status': 'ok', 'marked': 3, 'unmarked': 3})
+        self.assertEqual(self.visited(), {('Pakistan', 0, None), ('Punjab', 1, 'Pakistan'), ('Lahore', 2, 'Punjab')})
+        self.assertEqual(self.coverage(), {None: 1, self.india.pk: 0, self.pakistan.pk: 1,
+                                           self.punjab_in.pk: 0, self.punjab_pk.pk: 1})
+
+    def test_rows_written_meanwhile_are_not_counted(self):
+        insert = services._insert
+
+        def racing(user_id, specs):
+            # Another writer gets India in between the SELECT and the INSERT
+            VisitedLocation.objects.create(user=self.user, region=self.india, name='India', level=0)
+            return insert(user_id, specs)
+
+        with mock.patch.object(services, '_insert', side_effect=racing):
+            created, existing = mark_locations(self.user, [self.AMRITSAR])
+        self.assertEqual([spec['name'] for spec in created], ['Amritsar', 'Punjab'])
+        self.assertEqual([spec['name'] for spec in existing], ['India'])
+        logged = MapChange.objects.filter(user=self.user).values_list('name', flat=True)
+        self.assertEqual(set(logged), {'Amritsar', 'Punjab'})
+        self.assertEqual(self.coverage(), {self.india.pk: 1, self.punjab_in.pk: 1})
+
+    def test_batch_too_large(self):
+        response = self.client.post('/api/locations/mark/batch/', {'mark': [self.AMRITSAR] * 1001}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.visited(), set())
+
+
+class MapViewTests(GazetteerTestCase):
+    URL = '/api/locations/my-map/'
+
+    def setUp(self):
+        super().setUp()
+        # The map view authenticates from the token alone: no force_authenticate
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        mark_locations(self.user, [{'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}])
+
+    def test_full_map_with_etag(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cursor'], 1)
+        self.assertEqual(response.data['districts'], ['Amritsar'])
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_change_invalidates_etag(self):
+        etag = self.client.get(self.URL)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            unmark_locations(self.user, [{'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}])
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['districts'], [])
+
+    def test_change_from_another_process(self):
+        etag = self.client.get(self.URL)['ETag']
+        # Another worker's bump: its on-commit cache update never reaches this process
+        with self.captureOnCommitCallbacks(execute=False):
+            unmark_locations(self.user, [{'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}])
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['cursor']), (200, 2))
+        self.assertEqual(response.data['districts'], [])
+
+    def test_shared_cache_holds_the_version(self):
+        self.enterContext(mock.patch.object(mapcache, '_version_cached', return_value=True))
+        etag = self.client.get(self.URL)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            unmark_locations(self.user, [{'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}])
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).data['cursor'], 2)
+
+    def test_bitmap_encoding(self):
+        response = self.client.get(self.URL, {'encoding': 'bitmap'})
+        index = regionindex.get_index()
+        self.assertEqual(response.data['encoding'], 'bitmap')
+        self.assertIn(index.version, response['ETag'])
+        visited = [index.position[region.pk] for region in (self.india, self.punjab_in, self.amritsar)]
+        self.assertEqual(bitmap.decode(response.data['bitmap']), sorted(visited))
+        self.assertEqual(response.data['bitmap']['size'], len(index))
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.URL, {'encoding': 'morse'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'since': 'yesterday'}).status_code, 400)
+
+    def test_deactivated_user_is_refused(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+
+    def test_deleted_user_is_refused(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            get_user_model().objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+
+    def test_no_token(self):
+        self.assertEqual(APIClient().get(self.URL).status_code, 401)
+
+
+
+class AsyncViewTests(GazetteerTestCase):
+    """The async twins (ASYNC_API_VIEWS) answer like the DRF views"""
+    AMRITSAR = {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        mark_locations(self.user, [self.AMRITSAR])
+
+    async def get_map(self, **params):
+        headers = {**self.auth, **params.pop('headers', {})}
+        request = self.factory.get(MapViewTests.URL, params, headers=headers)
+        return await AsyncUserMapDataView.as_view()(request)
+
+    async def change(self, method, body):
+        request = getattr(self.factory, method)(
+            '/api/locations/mark/', body if isinstance(body, str) else json.dumps(body),
+            content_type='application/json', headers=self.auth,
+        )
+        return await AsyncMarkLocationView.as_view()(request)
+
+    def test_map_matches_sync_view(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        for params in ({}, {'encoding': 'bitmap'}):
+            expected = client.get(MapViewTests.URL, params)
+            response = async_to_sync(self.get_map)(**params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), expected.json())
+            self.assertEqual(response['ETag'], expected['ETag'])
+            again = async_to_sync(self.get_map)(**params, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(again.status_code, 304)
+
+    async def test_delta(self):
+        await sync_to_async(mark_locations)(self.user, [{'name': 'Lahore', 'level': 2, 'parent': 'Punjab'}])
+        response = await self.get_map(since=1)
+        body = json.loads(response.content)
+        self.assertEqual((body['cursor'], body['full']), (2, False))
+        self.assertEqual(body['added']['districts'], ['Lahore'])
+
+    async def test_bad_parameters(self):
+        self.assertEqual((await self.get_map(encoding='morse')).status_code, 400)
+        self.assertEqual((await self.get_map(since='yesterday')).status_code, 400)
+
+    async def test_authentication(self):
+        request = self.factory.get(MapViewTests.URL)
+        self.assertEqual((await AsyncUserMapDataView.as_view()(request)).status_code, 401)
+        request = self.factory.get(MapViewTests.URL, headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual((await AsyncUserMapDataView.as_view()(request)).status_code, 401)
+
+        await get_user_model().objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        await caches['default'].aclear()
+        self.assertEqual((await self.get_map()).status_code, 401)
+        self.assertEqual((await self.change('post', self.AMRITSAR)).status_code, 401)
+
+    def test_mark_and_unmark(self):
+        lahore = {'name': 'Lahore', 'level': 2, 'parent': 'Punjab', 'grandparent': 'Pakistan'}
+        response = async_to_sync(self.change)('post', lahore)
+        self.assertEqual((response.status_code, json.loads(response.content)['status']), (200, 'marked'))
+        self.assertIn(('Lahore', 2, 'Punjab'), self.visited())
+
+        response = async_to_sync(self.change)('delete', {'name': 'Punjab', 'level': 1, 'parent': 'India'})
+        self.assertEqual(json.loads(response.content)['deleted'], {'countries': 0, 'states': 1, 'districts': 1})
+        self.assertEqual(self.visited(), {
+            ('India', 0, None), ('Pakistan', 0, None), ('Punjab', 1, 'Pakistan'), ('Lahore', 2, 'Punjab'),
+        })
+
+    async def test_bad_mark_requests(self):
+        self.assertEqual((await self.change('post', 'not json')).status_code, 400)
+        self.assertEqual((await self.change('post', ['a list'])).status_code, 400)
+        self.assertEqual((await self.change('post', {'name': 'Amritsar', 'level': 7})).status_code, 400)
+
+class RegionIndexTests(GazetteerTestCase):
+    def test_manifest(self):
+        response = self.client.get('/api/locations/regions/manifest/')
+        manifest = response.json()
+        self.assertEqual(manifest['fields'], ['gid', 'name', 'level', 'parent'])
+        self.assertEqual(len(manifest['regions']), 6)
+        amritsar = manifest['regions'][regionindex.get_index().position[self.amritsar.pk]]
+        self.assertEqual(manifest['regions'][amritsar[3]][:3], ['IND.28_1', 'Punjab', 1])
+        self.assertEqual(response['ETag'], f'"{manifest["version"]}"')
+        again = self.client.get('/api/locations/regions/manifest/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_resolve(self):
+        index = regionindex.get_index()
+        self.assertEqual(index.resolve('Punjab', 1, 'Pakistan'), self.punjab_pk.pk)
+        self.assertEqual(index.resolve('Lahore', 2, 'Punjab', 'Pakistan'), self.lahore.pk)
+        self.assertIsNone(index.resolve('Lahore', 2, 'Punjab', 'India'))
+        self.assertEqual(index.resolve('anything', 2, gid='IND.28.1_1'), self.amritsar.pk)
+        self.assertEqual(index.lineage(self.amritsar.pk), ('Amritsar', 2, 'Punjab', 'India'))
+
+    def test_reload_in_another_process(self):
+        index = regionindex.get_index()
+        # What load_regions in another process leaves behind: new rows and a
+        # new generation, none of this process's state touched
+        Region.objects.create(gid='IND.1_1', name='Goa', level=1, parent=self.india)
+        GazetteerVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        self.assertIs(regionindex.get_index(), index)
+        with mock.patch.object(regionindex, 'CHECK_INTERVAL', 0):
+            fresh = regionindex.get_index()
+            self.assertEqual(len(fresh), 7)
+            self.assertNotEqual(fresh.version, index.version)
+            # Unchanged generation: no rebuild
+            self.assertIs(regionindex.get_index(), fresh)
+
+
+class DeltaSyncTests(GazetteerTestCase):
+    AMRITSAR = {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_locations(self.user, [self.AMRITSAR])                                   # 1
+            mark_locations(self.user, [{'name': 'Lahore', 'level': 2, 'gid': 'PAK.7.1_1'}])  # 2
+            unmark_locations(self.user, [self.AMRITSAR])                                 # 3
+            mark_locations(self.user, [self.AMRITSAR])                                   # 4
+
+    def test_delta(self):
+        delta = changes_since(self.user.pk, 1, 4)
+        # Amritsar went away and came back: only the last operation counts
+        self.assertEqual(delta['added'], {
+            'districts': ['Lahore', 'Amritsar'], 'states': ['Punjab'], 'countries': ['Pakistan'],
+        })
+        self.assertEqual(delta['removed'], {'districts': [], 'states': [], 'countries': []})
+
+    def test_same_version(self):
+        delta = changes_since(self.user.pk, 3, 3)
+        self.assertEqual(delta['added']['districts'], [])
+        self.assertEqual(delta['removed']['districts'], [])
+
+    def test_out_of_range(self):
+        self.assertIsNone(changes_since(self.user.pk, 0, 3))
+        self.assertIsNone(changes_since(self.user.pk, 4, 3))
+
+    def test_gap_in_the_log(self):
+        # Both ends are there, a version in between is not
+        MapChange.objects.filter(user=self.user, seq=3).delete()
+        self.assertIsNone(changes_since(self.user.pk, 1, 4))
+        self.assertIsNone(changes_since(self.user.pk, 2, 3))
+        self.assertIsNotNone(changes_since(self.user.pk, 3, 4))
+
+    def test_view(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = self.client.get('/api/locations/my-map/', {'since': 2})
+        self.assertEqual(response.data['cursor'], 4)
+        self.assertFalse(response.data['full'])
+        self.assertEqual(response.data['added']['districts'], ['Amritsar'])
+        self.assertEqual(response.data['removed']['districts'], [])
+
+        MapChange.objects.filter(user=self.user, seq=3).delete()
+        response = self.client.get('/api/locations/my-map/', {'since': 2})
+        self.assertTrue(response.data['full'])
+        self.assertEqual(sorted(response.data['districts']), ['Amritsar', 'Lahore'])
+
+
+class CoverageTests(GazetteerTestCase):
+    def setUp(self):
+        super().setUp()
+        mark_locations(self.user, [
+            {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'},
+            {'name': 'Atlantis', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'},
+        ])
+
+    def test_stats(self):
+        response = self.client.get('/api/locations/stats/')
+        self.assertEqual(response.status_code, 200)
+        by_name = {row['name']: row for row in response.data['coverage']}
+        self.assertEqual(sorted(by_name), ['India', 'Punjab', 'World'])
+        # Atlantis isn't in the gazetteer: it doesn't count
+        self.assertEqual(by_name['Punjab'], {
+            'gid': 'IND.28_1', 'name': 'Punjab', 'level': 2, 'visited': 1, 'total': 1, 'percent': 100.0,
+        })
+        self.assertEqual((by_name['World']['visited'], by_name['World']['total']), (1, 2))
+        self.assertEqual(by_name['World']['percent'], 50.0)
+
+    def test_level_filter(self):
+        response = self.client.get('/api/locations/stats/', {'level': 1})
+        self.assertEqual([row['name'] for row in response.data['coverage']], ['India'])
+        self.assertEqual(self.client.get('/api/locations/stats/', {'level': 3}).status_code, 400)
+
+    def test_unmark_decrements(self):
+        unmark_locations(self.user, [{'name': 'India', 'level': 0}])
+        self.assertEqual(self.coverage(), {None: 0, self.india.pk: 0, self.punjab_in.pk: 0})
+
+    def test_rebuild_matches_incremental(self):
+        mark_locations(self.user, [{'name': 'Lahore', 'level': 2, 'gid': 'PAK.7.1_1'}])
+        unmark_locations(self.user, [{'name': 'Punjab', 'level': 1, 'parent': 'India'}])
+        incremental = {k: v for k, v in self.coverage().items() if v}
+        self.assertEqual(coverage.rebuild([self.user.pk]), len(incremental))
+        self.assertEqual(self.coverage(), incremental)
+
+
+@override_settings(LEADERBOARD_BACKEND='locations.leaderboard.LocalLeaderboard')
+class LeaderboardViewTests(GazetteerTestCase):
+    URL = '/api/locations/leaderboard/'
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(leaderboard, '_backend', None))
+        self.other = get_user_model().objects.create_user(username='homebody', password='x')
+        mark_locations(self.other, [{'name': 'Lahore', 'level': 2, 'gid': 'PAK.7.1_1'}])
+        leaderboard.get_leaderboard()  # a snapshot from before the marks below
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_locations(self.user, [
+                {'name': 'Amritsar', 'level': 2, 'gid': 'IND.28.1_1'},
+                {'name': 'Lahore', 'level': 2, 'gid': 'PAK.7.1_1'},
+            ])
+
+    def test_level_board(self):
+        response = self.client.get(self.URL, {'board': 'countries'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['top'], [
+            {'rank': 1, 'username': 'traveller', 'score': 2},
+            {'rank': 2, 'username': 'homebody', 'score': 1},
+        ])
+        self.assertEqual(response.data['me'], {'score': 2, 'rank': 1, 'percentile': 50.0, 'size': 2})
+
+    def test_region_board_ties(self):
+        response = self.client.get(self.URL, {'region': 'PAK.7_1', 'limit': 5})
+        self.assertEqual([entry['rank'] for entry in response.data['top']], [1, 1])
+        self.assertEqual(response.data['board'], 'PAK.7_1')
+
+    def test_unmark_updates_the_board(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            unmark_locations(self.user, [{'name': 'India', 'level': 0}])
+        response = self.client.get(self.URL, {'board': 'districts'})
+        self.assertEqual([entry['score'] for entry in response.data['top']], [1, 1])
+
+    def test_change_from_another_process(self):
+        self.client.get(self.URL)
+        # No visits_changed here: the mark happened in some other worker
+        with self.captureOnCommitCallbacks(execute=False):
+            mark_locations(self.other, [{'name': 'Amritsar', 'level': 2, 'gid': 'IND.28.1_1'}])
+        response = self.client.get(self.URL, {'board': 'countries'})
+        self.assertEqual([entry['score'] for entry in response.data['top']], [2, 2])
+
+    def test_rebuilt_only_after_a_change(self):
+        self.client.get(self.URL)
+        with mock.patch.object(leaderboard, 'collect_scores', wraps=leaderboard.collect_scores) as collect:
+            self.client.get(self.URL)
+            self.client.get(self.URL, {'board': 'states'})
+            self.assertEqual(collect.call_count, 0)
+            unmark_locations(self.user, [{'name': 'India', 'level': 0}])
+            self.client.get(self.URL)
+            self.assertEqual(collect.call_count, 1)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.URL, {'board': 'planets'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'region': 'XXX'}).status_code, 404)
+        self.assertEqual(self.client.get(self.URL, {'limit': 'all'}).status_code, 400)
+
+
+class SubtreeUnmarkTests(GazetteerTestCase):
+    def setUp(self):
+        super().setUp()
+        mark_locations(self.user, [
+            {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'},
+            {'name': 'Lahore', 'level': 2, 'parent': 'Punjab', 'grandparent': 'Pakistan'},
+        ])
+
+    def test_mark_links_rows_to_their_regions(self):
+        regions = dict(VisitedLocation.objects.filter(user=self.user).values_list('region_id', 'parent'))
+        self.assertEqual(regions, {
+            self.india.pk: None, self.punjab_in.pk: 'India', self.amritsar.pk: 'Punjab',
+            self.pakistan.pk: None, self.punjab_pk.pk: 'Pakistan', self.lahore.pk: 'Punjab',
+        })
+
+    def test_unmark_state_leaves_same_named_state_elsewhere(self):
+        response = self.client.delete(
+            '/api/locations/mark/', {'name': 'Punjab', 'level': 1, 'parent': 'India'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], {'countries': 0, 'states': 1, 'districts': 1})
+        self.assertEqual(self.visited(), {
+            ('India', 0, None), ('Pakistan', 0, None), ('Punjab', 1, 'Pakistan'), ('Lahore', 2, 'Punjab'),
+        })
+
+    def test_unmark_by_gid(self):
+        counts, roots = unmark_locations(self.user, [{'name': 'Punjab', 'level': 1, 'gid': 'PAK.7_1'}])
+        self.assertEqual(counts, {0: 0, 1: 1, 2: 1})
+        self.assertEqual(roots, [('Punjab', 1, 'Pakistan', None)])
+        self.assertIn(('Punjab', 1, 'India'), self.visited())
+
+    def test_unmark_event_names_the_deleted_row(self):
+        with mock.patch('locations.views.emit') as emit:
+            response = self.client.delete(
+                '/api/locations/mark/', {'name': 'Panjab', 'level': 1, 'gid': 'PAK.7_1'}, format='json',
+            )
+        self.assertEqual(response.data['deleted'], {'countries': 0, 'states': 1, 'districts': 1})
+        emit.assert_called_once_with(
+            'location.unmarked', self.user, name='Punjab', level=1, parent='Pakistan', grandparent=None,
+            removed={'states': 1, 'districts': 1},
+        )
+
+    def test_unmark_country_takes_its_subtree_only(self):
+        counts, roots = unmark_locations(self.user, [{'name': 'India', 'level': 0}])
+        self.assertEqual(counts, {0: 1, 1: 1, 2: 1})
+        self.assertEqual(self.visited(), {('Pakistan', 0, None), ('Punjab', 1, 'Pakistan'), ('Lahore', 2, 'Punjab')})
+
+    def test_unmark_rows_outside_the_gazetteer(self):
+        mark_locations(self.user, [
+            {'name': 'Atlantis', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'},
+            {'name': 'Lemuria', 'level': 1, 'parent': 'Pakistan'},
+            {'name': 'Mu', 'level': 2, 'parent': 'Lemuria', 'grandparent': 'Pakistan'},
+        ])
+        self.assertIsNone(VisitedLocation.objects.get(user=self.user, name='Atlantis').region_id)
+
+        counts, roots = unmark_locations(self.user, [{'name': 'Punjab', 'level': 1, 'parent': 'India'}])
+        self.assertEqual(counts, {0: 0, 1: 1, 2: 2})
+        counts, roots = unmark_locations(self.user, [{'name': 'Lemuria', 'level': 1, 'parent': 'India'}])
+        self.assertEqual(counts, {0: 0, 1: 0, 2: 0})
+        counts, roots = unmark_locations(self.user, [{'name': 'Lemuria', 'level': 1, 'parent': 'Pakistan'}])
+        self.assertEqual(counts, {0: 0, 1: 1, 2: 1})
+        self.assertEqual(roots, [('Lemuria', 1, 'Pakistan', None)])
+        self.assertEqual(self.visited(), {
+            ('India', 0, None), ('Pakistan', 0, None), ('Punjab', 1, 'Pakistan'), ('Lahore', 2, 'Punjab'),
+        })
+
+    def test_subtree_goes_in_one_delete(self):
+        with CaptureQueriesContext(connection) as ctx:
+            counts, _ = unmark_locations(self.user, [
+                {'name': 'India', 'level': 0}, {'name': 'Punjab', 'level': 1, 'parent': 'Pakistan'},
+            ])
+        self.assertEqual(counts, {0: 1, 1: 2, 2: 2})
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn(VisitedLocation._meta.db_table, deletes[0])
+
+    def test_unmark_logs_and_counts_what_it_deleted(self):
+        unmark_locations(self.user, [{'name': 'Punjab', 'level': 1, 'parent': 'India'}])
+        removed = MapChange.objects.filter(user=self.user, op=MapChange.REMOVE)
+        self.assertEqual(set(removed.values_list('seq', 'name', 'level')), {(2, 'Punjab', 1), (2, 'Amritsar', 2)})
+        self.assertEqual(MapVersion.objects.get(user=self.user).version, 2)
+        self.assertEqual(self.coverage()[self.india.pk], 0)
+        self.assertEqual(self.coverage()[self.pakistan.pk], 1)
+
+    def test_unmark_nothing_marked(self):
+        response = self.client.delete('/api/locations/mark/', {'name': 'Nowhere', 'level': 0}, format='json')
+        self.assertEqual(response.data['deleted'], {'countries': 0, 'states': 0, 'districts': 0})
+        self.assertEqual(len(self.visited()), 6)
+        # Nothing deleted: no new version, nothing logged
+        self.assertEqual(MapVersion.objects.get(user=self.user).version, 1)
+        self.assertFalse(MapChange.objects.filter(op=MapChange.REMOVE).exists())
+
+    def test_invalid_items(self):
+        self.assertEqual(self.client.delete('/api/locations/mark/', {'name': 'India'}, format='json').status_code, 400)
+        response = self.client.post(
+            '/api/locations/mark/batch/', {'unmark': [{'name': 'India', 'level': 7}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.visited()), 6)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Server-side unmark path (a CTE around DELETE ... RETURNING)')
+class PostgresUnmarkTests(GazetteerTestCase):
+    def setUp(self):
+        super().setUp()
+        mark_locations(self.user, [
+            {'name': 'Amritsar', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'},
+            {'name': 'Lahore', 'level': 2, 'parent': 'Punjab', 'grandparent': 'Pakistan'},
+        ])
+
+    def test_subtrees_logged_and_counted_in_one_statement(self):
+        with CaptureQueriesContext(connection) as ctx:
+            counts, roots = unmark_locations(self.user, [
+                {'name': 'India', 'level': 0}, {'name': 'Punjab', 'level': 1, 'gid': 'PAK.7_1'},
+            ])
+        self.assertEqual(counts, {0: 1, 1: 2, 2: 2})
+        self.assertEqual(sorted(roots, key=str), [('India', 0, None, None), ('Punjab', 1, 'Pakistan', None)])
+        self.assertEqual(self.visited(), {('Pakistan', 0, None)})
+        statements = [q['sql'] for q in ctx.captured_queries if VisitedLocation._meta.db_table in q['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('WITH gone AS (DELETE'))
+
+        removed = MapChange.objects.filter(user=self.user, op=MapChange.REMOVE)
+        self.assertEqual(set(removed.values_list('seq', 'name', 'level', 'parent')), {
+            (2, 'India', 0, None), (2, 'Punjab', 1, 'India'), (2, 'Amritsar', 2, 'Punjab'),
+            (2, 'Punjab', 1, 'Pakistan'), (2, 'Lahore', 2, 'Punjab'),
+        })
+        self.assertEqual(MapVersion.objects.get(user=self.user).version, 2)
+        self.assertEqual(self.coverage(), {
+            None: 1, self.india.pk: 0, self.pakistan.pk: 0, self.punjab_in.pk: 0, self.punjab_pk.pk: 0,
+        })
+
+    def test_rows_outside_the_gazetteer(self):
+        mark_locations(self.user, [{'name': 'Atlantis', 'level': 2, 'parent': 'Punjab', 'grandparent': 'India'}])
+        counts, roots = unmark_locations(self.user, [{'name': 'Punjab', 'level': 1, 'parent': 'India'}])
+        self.assertEqual((counts, roots), ({0: 0, 1: 1, 2: 2}, [('Punjab', 1, 'India', None)]))
+        # Atlantis has no region, so no parent to decrement
+        self.assertEqual(self.coverage()[self.punjab_in.pk], 0)
+        self.assertEqual(self.coverage()[self.india.pk], 0)
+
+    def test_nothing_marked(self):
+        counts, roots = unmark_locations(self.user, [{'name': 'Nowhere', 'level': 0}])
+        self.assertEqual((counts, roots), ({0: 0, 1: 0, 2: 0}, []))
+        self.assertEqual(MapVersion.objects.get(user=self.user).version, 1)
+        self.assertFalse(MapChange.objects.filter(op=MapChange.REMOVE).exists())
+
+
+
+class TopoJSONDecoderTests(SimpleTestCase):
+    # Two unit squares side by side; arc 1 is their shared edge
+    TOPOLOGY = {
+        'type': 'Topology',
+        'transform': {'scale': [0.5, 0.5], 'translate': [10, 20]},
+        'arcs': [
+            [[2, 0], [-2, 0], [0, 2], [2, 0]],  # West, open at the border: (2,0) (0,0) (0,2) (2,2)
+            [[2, 2], [0, -2]],                   # border: (2,2) -> (2,0)
+            [[2, 2], [2, 0], [0, -2], [-2, 0]],  # East: (2,2) (4,2) (4,0) (2,0)
+        ],
+        'objects': {
+            'states': {'type': 'GeometryCollection', 'geometries': [
+                {'type': 'Polygon', 'properties': {'name': 'West'}, 'arcs': [[0, 1]]},
+                {'type': 'MultiPolygon', 'properties': {'name': 'East'}, 'arcs': [[[2, ~1]]]},
+                {'type': None, 'properties': {'name': 'Nowhere'}},
+            ]},
+        },
+    }
+
+    def test_decodes_delta_encoded_shared_arcs(self):
+        west, east, nowhere = topojson.to_feature_collection(self.TOPOLOGY, 'states')['features']
+        self.assertEqual(west['properties'], {'name': 'West'})
+        self.assertEqual(west['geometry'], {'type': 'Polygon', 'coordinates': [
+            [[11.0, 20.0], [10.0, 20.0], [10.0, 21.0], [11.0, 21.0], [11.0, 20.0]],
+        ]})
+        self.assertEqual(east['geometry'], {'type': 'MultiPolygon', 'coordinates': [[
+            [[11.0, 21.0], [12.0, 21.0], [12.0, 20.0], [11.0, 20.0], [11.0, 21.0]],
+        ]]})
+        self.assertIsNone(nowhere['geometry'])
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'mapped.topo.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.TOPOLOGY, f)
+            collections = topojson.load(path)
+        self.assertEqual(list(collections), ['states'])
+        self.assertEqual(len(collections['states']['features']), 3)
+
+    def test_unsupported_geometry(self):
+        topology = dict(self.TOPOLOGY, objects={'lines': {'type': 'LineString', 'arcs': [0]}})
+        with self.assertRaises(ValueError):
+            topojson.to_feature_collection(topology, 'lines')
+
+
+class BitmapCodecTests(SimpleTestCase):
+    def test_round_trip(self):
+        for indices, size in [([], 10), ([0], 1), ([3, 4, 5, 9], 10), (list(range(0, 4000, 3)), 4000)]:
+            payload = bitmap.encode(indices, size)
+            self.assertEqual(bitmap.decode(payload), indices)
+            self.assertEqual((payload['size'], payload['count']), (size, len(indices)))
+
+    def test_picks_the_smaller_codec(self):
+        self.assertEqual(bitmap.encode(range(100, 200), 10_000)['codec'], 'rle')
+        self.assertEqual(bitmap.encode(range(0, 1000, 2), 1000)['codec'], 'bits')
+
+    def test_rle_runs(self):
+        # gap 3, run 3, gap 3, run 1
+        self.assertEqual(bitmap.encode_rle([3, 4, 5, 9]), bytes([3, 3, 3, 1]))
+        self.assertEqual(bitmap.decode_rle(bitmap.encode_rle([200])), [200])
+
+    def test_bad_input(self):
+        with self.assertRaises(ValueError):
+            bitmap.encode([10], 10)
+        with self.assertRaises(ValueError):
+            bitmap.decode_rle(bytes([0x80]))
+        with self.assertRaises(ValueError):
+            bitmap.decode_rle(bytes([1]))
+        with self.assertRaises(ValueError):
+            bitmap.decode({'codec': 'gzip', 'data': ''})
+
+
+class LocalLeaderboardTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        board = leaderboard.LocalLeaderboard()
+        scores = {}
+        for _ in range(2000):
+            member = rng.randrange(40)
+            delta = rng.randint(-30, 60)  # scores well past the initial capacity of 64
+            scores[member] = max(scores.get(member, 0) + delta, 0)
+            self.assertEqual(board.incr('b', member, delta), scores[member])
+
+        ranked = sorted(((score, member) for member, score in scores.items() if score), reverse=True)
+        self.assertEqual(board.size('b'), len(ranked))
+        self.assertEqual([score for _, score in board.top('b', 10)], [score for score, _ in ranked[:10]])
+        for member, score in scores.items():
+            self.assertEqual(board.count_above('b', score), sum(1 for s, _ in ranked if s > score))
+            self.assertEqual(board.count_below('b', score), sum(1 for s, _ in ranked if s < score) if score else 0)
+
+    def test_standing_and_ties(self):
+        board = leaderboard.LocalLeaderboard()
+        board.replace({'b': {1: 5, 2: 5, 3: 2, 4: 0}})
+        self.assertEqual(board.top('b', 2), [(1, 5), (2, 5)])
+        self.assertEqual(board.standing('b', 2), {'score': 5, 'rank': 1, 'percentile': 33.3, 'size': 3})
+        self.assertEqual(board.standing('b', 3), {'score': 2, 'rank': 3, 'percentile': 0.0, 'size': 3})
+        self.assertEqual(board.standing('b', 4)['rank'], None)
+
+        board.incr('b', 1, -5)
+        self.assertEqual(board.size('b'), 2)
+        self.assertEqual(board.standing('b', 2)['rank'], 1)
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def boundary(coordinates, geometry_type='Polygon', **props):
+    return {'type': 'Feature', 'properties': props, 'geometry': {'type': geometry_type, 'coordinates': coordinates}}
+
+
+def squareland(test):
+    """
+    A geocoder over temporary layers. Lon 0..10 / lat 0..10 is Squareland,
+    except a lake at 4..6 (a hole). Its state West covers lon 0..5, in two
+    pieces; district Westend is lon 0..2.
+    """
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    layers = {
+        'countries.json': [boundary(
+            [square(0, 0, 10, 10), square(4, 4, 6, 6)], name='Squareland', level=0, gid='SQL',
+        )],
+        'states.json': [boundary(
+            [[square(0, 0, 5, 4)], [square(0, 6, 5, 10)]], 'MultiPolygon',
+            name='West', level=1, country='Squareland', gid='SQL.1_1',
+        )],
+        'districts.json': [boundary(
+            [square(0, 0, 2, 4)], name='Westend', level=2, country='Squareland', region='West', gid='SQL.1.1_1',
+        )],
+    }
+    paths = []
+    for name, features in layers.items():
+        paths.append(os.path.join(tmp.name, name))
+        with open(paths[-1], 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return ReverseGeocoder(paths)
+
+
+class GeocoderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.geocoder = squareland(self)
+
+
+class ReverseGeocoderTests(GeocoderTestCase):
+    def test_lookup(self):
+        district, state, country, lake, outside = self.geocoder.lookup([(1, 1), (8, 3), (8, 8), (5, 5), (20, 20)])
+        self.assertEqual(district['district'], {
+            'name': 'Westend', 'level': 2, 'parent': 'West', 'grandparent': 'Squareland', 'gid': 'SQL.1.1_1',
+        })
+        self.assertEqual(district['state']['gid'], 'SQL.1_1')
+        self.assertEqual((state['state']['name'], state['district']), ('West', None))
+        self.assertEqual((country['country']['name'], country['state']), ('Squareland', None))
+        self.assertEqual((lake['country'], lake['state']), (None, None))
+        self.assertEqual((outside['lat'], outside['lon'], outside['country']), (20.0, 20.0, None))
+
+    def test_many_points(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(-1, 11), rng.uniform(-1, 11)) for _ in range(500)]
+        for (lat, lon), row in zip(points, self.geocoder.lookup(points)):
+            inside = 0 < lat < 10 and 0 < lon < 10 and not (4 < lat < 6 and 4 < lon < 6)
+            self.assertEqual(row['country'] is not None, inside, (lat, lon))
+
+    def test_no_points(self):
+        self.assertEqual(self.geocoder.lookup([]), [])
+
+
+class ReverseGeocodeViewTests(GeocoderTestCase):
+    URL = '/api/locations/geocode/'
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch('locations.views.get_geocoder', return_value=self.geocoder))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model()(pk=1, username='traveller'))
+
+    def test_get(self):
+        response = self.client.get(self.URL, {'lat': 1, 'lon': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['district']['name'], 'Westend')
+
+    def test_post(self):
+        response = self.client.post(self.URL, {'points': [[1, 1], [8, 8]]}, format='json')
+        self.assertEqual([row['state'] and row['state']['name'] for row in response.data['results']], ['West', None])
+
+    def test_malformed_or_impossible_points(self):
+        for lat, lon in [('nan', 1), (1, 'inf'), ('-inf', 1), (90.5, 0), (0, -180.1), ('north', 1)]:
+            response = self.client.get(self.URL, {'lat': lat, 'lon': lon})
+            self.assertEqual(response.status_code, 400, (lat, lon))
+        self.assertEqual(self.client.get(self.URL, {'lat': 1}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'lat': 90, 'lon': -180}).status_code, 200)
+
+        # Raw bodies: the JSON parser takes NaN and 1e999 (inf), the test client wouldn't send them
+        for points in ['[[1, 1], ["nan", 1]]', '[[1, NaN]]', '[[1, 1e999]]', '[[91, 0]]', '[[1]]', '"everywhere"']:
+            response = self.client.post(self.URL, f'{{"points": {points}}}', content_type='application/json')
+            self.assertEqual(response.status_code, 400, points)
+
+    def test_too_many_points(self):
+        points = [[1, 1]] * (MAX_GEOCODE_POINTS + 1)
+        self.assertEqual(self.client.post(self.URL, {'points': points}, format='json').status_code, 400)
+
+
+GPX = b'''<?xml version="1.0"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>
+  <trkpt lat="1" lon="1"/><trkpt lat="1.001" lon="1.001"/><trkpt lat="8" lon="8"/>
+  <trkpt lat="5" lon="5"/><trkpt lat="100" lon="0"/><trkpt lat="x" lon="0"/>
+</trkseg></trk></gpx>'''
+
+
+class ImportHistoryTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch('locations.importer.get_geocoder', return_value=squareland(self)))
+        caches['maps'].clear()
+        regionindex.invalidate()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.upload_dir = tmp.name
+        self.enterContext(override_settings(JOB_UPLOAD_DIR=self.upload_dir))
+        self.user = get_user_model().objects.create_user(username='hiker', password='x')
+
+    def staged(self, content):
+        path = os.path.join(self.upload_dir, 'trip.gpx')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def run_next(self):
+        job = queue.claim('test', ['imports'])
+        queue.execute(job)
+        job.refresh_from_db()
+        return job
+
+    def visited(self):
+        return set(VisitedLocation.objects.filter(user=self.user).values_list('name', 'level'))
+
+    def test_import(self):
+        with open(self.staged(GPX), 'rb') as f:
+            stats = import_history(self.user, f, name='trip.gpx')
+        self.assertEqual(stats['format'], 'gpx')
+        # Two points share a cell; lat 100 and 'x' are dropped
+        self.assertEqual((stats['points'], stats['unique'], stats['matched'], stats['regions']), (5, 3, 2, 2))
+        self.assertEqual(stats['marked'], 3)
+        self.assertEqual(self.visited(), {('Squareland', 0), ('West', 1), ('Westend', 2)})
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('trip.GPX', b''), 'gpx')
+        self.assertEqual(detect_format('export.json', b'{"locations": []}'), 'takeout')
+        self.assertEqual(detect_format(None, b'  {"type": "FeatureCollection"'), 'geojson')
+        with self.assertRaises(ImportFormatError):
+            detect_format('notes.txt', b'hello')
+
+    def test_job_removes_the_upload(self):
+        path = self.staged(GPX)
+        import_history_file.delay(path, name='trip.gpx', fmt='gpx', user=self.user)
+        job = self.run_next()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['marked'], 3)
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_job_removes_the_upload_after_the_last_attempt(self):
+        path = self.staged(b'<gpx><trk><trkpt lat="1"')
+        import_history_file.delay(path, name='trip.gpx', fmt='gpx', user=self.user)
+        job = self.run_next()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertTrue(os.path.exists(path))  # still needed by the retry
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = self.run_next()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.visited(), set())
+
+    def test_view(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('trip.gpx', GPX)
+        response = client.post('/api/locations/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(user=self.user)
+        self.assertEqual(response['Location'], f'/api/jobs/{job.pk}/')
+        self.assertEqual(job.payload['kwargs'], {'name': 'trip.gpx', 'fmt': 'gpx'})
+        self.assertEqual(os.listdir(self.upload_dir), [os.path.basename(job.payload['args'][0])])
+
+    def test_view_errors(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post('/api/locations/import/', {}, format='multipart').status_code, 400)
+        for data in [{'file': SimpleUploadedFile('trip.gpx', GPX), 'format': 'kml'},
+                     {'file': SimpleUploadedFile('notes.txt', b'hello')}]:
+            self.assertEqual(client.post('/api/locations/import/', data, format='multipart').status_code, 400)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertFalse(Job.objects.exists())
+
+
+class TileViewTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'tiles.mbtiles')
+        self.write_archive(self.path, '42', b'gzipped-mvt')
+        self.enterContext(override_settings(TILES_MBTILES_PATH=self.path))
+
+    def write_archive(self, path, version, tile):
+        db = sqlite3.connect(path)
+        db.executescript("""
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+            INSERT INTO metadata VALUES ('minzoom', '2'), ('maxzoom', '10');
+        """)
+        db.execute('INSERT INTO metadata VALUES (?, ?)', ('version', version))
+        # XYZ 3/5/2 is TMS row 2**3 - 1 - 2 = 5
+        db.execute('INSERT INTO tiles VALUES (3, 5, 5, ?)', (tile,))
+        db.commit()
+        db.close()
+
+    def test_tile(self):
+        response = self.client.get('/api/tiles/3/5/2.pbf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'gzipped-mvt')
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], '"42-3-5-2"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_conditional(self):
+        response = self.client.get('/api/tiles/3/5/2.pbf', headers={'If-None-Match': '"42-3-5-2"'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_empty_tile(self):
+        self.assertEqual(self.client.get('/api/tiles/3/0/0.pbf').status_code, 204)
+
+    def test_zoom_outside_the_archive(self):
+        self.assertEqual(self.client.get('/api/tiles/1/0/0.pbf').status_code, 404)
+        self.assertEqual(self.client.get('/api/tiles/11/0/0.pbf').status_code, 404)
+        # Rejected before the tile range check computes 1 << z
+        self.assertEqual(self.client.get(f'/api/tiles/{10 ** 12}/0/0.pbf').status_code, 404)
+
+    def test_tile_outside_the_zoom_level(self):
+        self.assertEqual(self.client.get('/api/tiles/3/8/0.pbf').status_code, 404)
+        self.assertEqual(self.client.get('/api/tiles/3/0/8.pbf').status_code, 404)
+
+    def test_missing_archive(self):
+        with override_settings(TILES_MBTILES_PATH=self.path + '.missing'):
+            self.assertEqual(self.client.get('/api/tiles/3/5/2.pbf').status_code, 404)
+
+    def test_rebuilt_archive(self):
+        self.assertEqual(self.client.get('/api/tiles/3/5/2.pbf').content, b'gzipped-mvt')
+        old = get_archive()
+        # As build_tiles.py does it: a new file renamed over the live one
+        self.write_archive(self.path + '.tmp', '43', b'rebuilt-mvt')
+        os.replace(self.path + '.tmp', self.path)
+        response = self.client.get('/api/tiles/3/5/2.pbf')
+        self.assertEqual((response.content, response['ETag']), (b'rebuilt-mvt', '"43-3-5-2"'))
+        # A request still holding the old archive reads the old file to the end
+        self.assertEqual(old.get_tile(3, 5, 2), b'gzipped-mvt')
+
+
+def atlas_layers(test):
+    """Normalized layers in a temporary GEOJSON_DIR: Alpha with three states, Beta with none"""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    layers = {
+        'world-countries.json': [
+            boundary([square(0, 0, 10, 10)], name='Alpha', level=0, gid='ALP'),
+            boundary([square(20, 0, 30, 10)], name='Beta', level=0, gid='BET'),
+        ],
+        'india-states.json': [
+            boundary([square(0, 0, 5, 5)], name=name, level=1, country='Alpha', gid=f'ALP.{n}_1')
+            for n, name in enumerate(['North', 'South', 'East'], 1)
+        ],
+    }
+    for name, features in layers.items():
+        with open(os.path.join(tmp.name, name), 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return tmp.name
+
+
+class SyntheticUserTests(TestCase):
+    def setUp(self):
+        caches['maps'].clear()
+        regionindex.invalidate()
+        self.geojson = atlas_layers(self)
+        self.enterContext(override_settings(GEOJSON_DIR=self.geojson))
+
+    def test_atlas(self):
+        atlas = Atlas(districts_per_state=4)
+        self.assertEqual(atlas.ranked, ['Alpha', 'Beta'])  # countries with states first
+        self.assertEqual([state['name'] for state in atlas.states['Alpha']], ['North', 'South', 'East'])
+        self.assertEqual(atlas.districts[('Alpha', 'North')][0], {
+            'name': 'North 1', 'level': 2, 'parent': 'North', 'grandparent': 'Alpha', 'gid': None,
+        })
+        # One seed, one answer
+        self.assertEqual(atlas.visits(random.Random(3)), atlas.visits(random.Random(3)))
+
+    def test_no_countries(self):
+        with self.assertRaisesMessage(ValueError, 'No countries'):
+            Atlas([os.path.join(self.geojson, 'india-states.json')])
+        with self.assertRaises(CommandError):
+            call_command('generate_users', '1', os.path.join(self.geojson, 'india-states.json'), stdout=io.StringIO())
+
+    def test_generate_users(self):
+        created, marked = generate_users(5, prefix='synth', seed=1, atlas=Atlas(districts_per_state=4))
+        self.assertEqual(created, 5)
+        users = get_user_model().objects.filter(username__startswith='synth_')
+        self.assertEqual(users.count(), 5)
+        self.assertEqual(VisitedLocation.objects.filter(user__in=users).count(), marked)
+        for user in users:
+            self.assertTrue(user.check_password(PASSWORD))
+            self.assertTrue(VisitedLocation.objects.filter(user=user, level=0).exists())
+            self.assertEqual(MapVersion.objects.get(user=user).version, 1)
+
+        # Existing users are left alone
+        before = self.visits_per_user()
+        self.assertEqual(generate_users(6, prefix='synth', seed=1, atlas=Atlas(districts_per_state=4))[0], 1)
+        after = self.visits_per_user()
+        self.assertGreater(after.pop('synth_5'), 0)
+        self.assertEqual(after, before)
+
+    def visits_per_user(self):
+        rows = VisitedLocation.objects.values_list('user__username').annotate(n=Count('id')).order_by()
+        return dict(rows)
+
+
+class BenchAPITests(TestCase):
+    def setUp(self):
+        caches['maps'].clear()
+        regionindex.invalidate()
+        self.enterContext(override_settings(GEOJSON_DIR=atlas_layers(self)))
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.baseline = os.path.join(tmp.name, 'api.json')
+
+    def bench(self, *args):
+        out = io.StringIO()
+        call_command(
+            'bench_api', '--users', '3', '--calls', '6', '--warmup', '1', '--baseline', self.baseline,
+            *args, stdout=out, stderr=io.StringIO(),
+        )
+        return out.getvalue()
+
+    def test_save_then_check(self):
+        self.assertIn('Saved baseline', self.bench('--save'))
+        with open(self.baseline, encoding='utf-8') as f:
+            record = json.load(f)
+        self.assertEqual(record['params'], {'users': 3, 'calls': 6, 'seed': 0})
+        self.assertEqual(sorted(record['results']), sorted(SCENARIOS))
+        # Latencies are noise at this size: only query counts are held to the baseline here
+        self.assertIn('No regressions', self.bench('--tolerance', '1000', '--slack-ms', '1000'))
+
+    def test_regressions(self):
+        then = {'p50_ms': 1.0, 'p90_ms': 2.0, 'p99_ms': 3.0, 'queries': 3, 'queries_mean': 2.5}
+        baseline = {'results': {'mark': then}}
+        options = {'tolerance': 0.5, 'slack_ms': 1.0}
+        regressions = BenchCommand().regressions
+
+        self.assertEqual(regressions({'mark': dict(then, p50_ms=2.4)}, baseline, options, True), [])
+        failures = regressions({'mark': dict(then, p50_ms=2.6, queries=4)}, baseline, options, True)
+        self.assertEqual(len(failures), 2)
+        self.assertIn('mark: 4 queries per call', failures[0])
+        self.assertIn('mark: p50_ms 2.60 > 2.50', failures[1])
+        # A higher mean only counts when the same users / calls were sampled
+        self.assertEqual(regressions({'mark': dict(then, queries_mean=2.9)}, baseline, options, False), [])
+        self.assertEqual(len(regressions({'mark': dict(then, queries_mean=2.9)}, baseline, options, True)), 1)
+
+    def test_query_regression_fails(self):
+        self.bench('--save', '--scenario', 'my-map')
+        with open(self.baseline, encoding='utf-8') as f:
+            record = json.load(f)
+        record['results']['my-map'].update(queries=0, queries_mean=0)
+        with open(self.baseline, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        with self.assertRaisesMessage(CommandError, '1 regressions'):
+            self.bench('--scenario', 'my-map', '--tolerance', '1000', '--slack-ms', '1000')
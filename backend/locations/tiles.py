@@ -0,0 +1,85 @@
+"""
+Read-only access to the MBTiles vector tile archive built by
+scripts/build_tiles.py.
+
+SQLite connections can't be shared across threads, so every worker thread
+gets its own read-only connection, opened once and reused for the life of
+the process. The archive is opened `immutable` with a large mmap window, so
+tile reads are served straight from the page cache without locking.
+
+build_tiles.py replaces the archive by renaming a new file over it, so an
+archive is keyed on the file's inode and mtime: after a rebuild the next
+request opens the new file, while requests already holding the old archive
+finish reading the old (unlinked, but still open) one.
+"""
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+MMAP_SIZE = 256 * 1024 * 1024  # 256 MB
+MAX_ZOOM = 22  # deepest zoom ever served, whatever the metadata says
+
+
+class MBTilesArchive:
+    def __init__(self, path, mmap_size=MMAP_SIZE):
+        self.path = str(path)
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro&immutable=1', uri=True)
+            conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+            self._local.conn = conn
+        return conn
+
+    def metadata(self):
+        return dict(self._connection().execute('SELECT name, value FROM metadata'))
+
+    @property
+    def version(self):
+        if not hasattr(self, '_version'):
+            self._version = self.metadata().get('version', '0')
+        return self._version
+
+    @property
+    def zoom_range(self):
+        """(minzoom, maxzoom) from the archive metadata, within 0..MAX_ZOOM"""
+        if not hasattr(self, '_zoom_range'):
+            metadata = self.metadata()
+            try:
+                minzoom = int(metadata.get('minzoom', 0))
+                maxzoom = int(metadata.get('maxzoom', MAX_ZOOM))
+            except ValueError:
+                minzoom, maxzoom = 0, MAX_ZOOM
+            self._zoom_range = (max(minzoom, 0), min(maxzoom, MAX_ZOOM))
+        return self._zoom_range
+
+    def get_tile(self, z, x, y):
+        """Tile bytes (gzipped MVT) for XYZ coordinates, or None if the tile is empty"""
+        # MBTiles rows are stored in TMS order (y axis flipped)
+        row = self._connection().execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        return row[0] if row else None
+
+
+# Only the current build: a replaced archive's connections close with the last request using it
+@lru_cache(maxsize=1)
+def _archive_for(path, inode, mtime_ns):
+    return MBTilesArchive(path)
+
+
+def get_archive():
+    """The current archive, or None if it hasn't been built"""
+    path = str(settings.TILES_MBTILES_PATH)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return _archive_for(path, stat.st_ino, stat.st_mtime_ns)
@@ -0,0 +1,82 @@
+"""
+Minimal TopoJSON decoder for the files written by scripts/topojson_gadm.py.
+
+Supports what that encoder emits: a quantized, delta-encoded Topology with
+GeometryCollections of Polygon / MultiPolygon geometries. Returns plain
+GeoJSON dicts, so anything that reads the normalized GeoJSON can read the
+TopoJSON output too.
+"""
+import json
+
+
+def _arc_decoder(topology):
+    transform = topology.get('transform')
+    decoded = [None] * len(topology['arcs'])
+
+    def decode_arc(i):
+        if decoded[i] is None:
+            arc = topology['arcs'][i]
+            if transform:
+                (sx, sy), (tx, ty) = transform['scale'], transform['translate']
+                x = y = 0
+                points = []
+                for dx, dy in arc:
+                    x += dx
+                    y += dy
+                    points.append([x * sx + tx, y * sy + ty])
+            else:
+                points = [list(p) for p in arc]
+            decoded[i] = points
+        return decoded[i]
+
+    return decode_arc
+
+
+def _ring(arc_indexes, decode_arc):
+    points = []
+    for index in arc_indexes:
+        # Negative index ~i means arc i traversed backwards
+        arc = decode_arc(~index)[::-1] if index < 0 else decode_arc(index)
+        # Consecutive arcs share their boundary point
+        points.extend(arc[1:] if points else arc)
+    return points
+
+
+def _geometry(geometry, decode_arc):
+    kind = geometry.get('type')
+    if kind == 'Polygon':
+        coordinates = [_ring(r, decode_arc) for r in geometry['arcs']]
+    elif kind == 'MultiPolygon':
+        coordinates = [[_ring(r, decode_arc) for r in polygon] for polygon in geometry['arcs']]
+    elif kind is None:
+        return None
+    else:
+        raise ValueError(f"Unsupported TopoJSON geometry type: {kind}")
+    return {'type': kind, 'coordinates': coordinates}
+
+
+def object_names(topology):
+    return list(topology['objects'])
+
+
+def to_feature_collection(topology, name):
+    """Decode one named object of a Topology into a GeoJSON FeatureCollection"""
+    obj = topology['objects'][name]
+    decode_arc = _arc_decoder(topology)
+
+    geometries = obj['geometries'] if obj.get('type') == 'GeometryCollection' else [obj]
+    features = []
+    for geometry in geometries:
+        features.append({
+            'type': 'Feature',
+            'properties': geometry.get('properties', {}),
+            'geometry': _geometry(geometry, decode_arc),
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def load(path):
+    """Read a .topo.json file and decode every object. Returns {name: FeatureCollection}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        topology = json.load(f)
+    return {name: to_feature_collection(topology, name) for name in object_names(topology)}
@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from .views import MarkLocationView, UserMapDataView # <--- Make sure this is MarkLocationView
+from .async_views import AsyncMarkLocationView, AsyncUserMapDataView
+from .views import BatchMarkLocationView, CoverageStatsView, ImportHistoryView, LeaderboardView, MarkLocationView, RegionManifestView, ReverseGeocodeView, UserMapDataView # <--- Make sure this is MarkLocationView
+
+# Under the ASGI profile the hottest endpoints are served by their async variants
+mark_view = AsyncMarkLocationView if settings.ASYNC_API_VIEWS else MarkLocationView
+map_view = AsyncUserMapDataView if settings.ASYNC_API_VIEWS else UserMapDataView
 
 urlpatterns = [
     # We use the new view here
-    path('mark/', MarkLocationView.as_view(), name='mark-location'), 
-    path('my-map/', UserMapDataView.as_view(), name='user-map'),
+    path('mark/', mark_view.as_view(), name='mark-location'), 
+    path('mark/batch/', BatchMarkLocationView.as_view(), name='mark-location-batch'),
+    path('my-map/', map_view.as_view(), name='user-map'),
+    path('stats/', CoverageStatsView.as_view(), name='coverage-stats'),
+    path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('geocode/', ReverseGeocodeView.as_view(), name='reverse-geocode'),
+    path('import/', ImportHistoryView.as_view(), name='import-history'),
+    path('regions/manifest/', RegionManifestView.as_view(), name='region-manifest'),
 ]
\ No newline at end of file
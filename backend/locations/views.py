@@ -1,140 +1,396 @@
-import logging
+import math
+import os
+import uuid
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.db import transaction
-from .models import VisitedLocation
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseNotModified, JsonResponse
+from django.views import View
+from core.dbrouter import replica_reads
+from users.authentication import ActiveJWTStatelessUserAuthentication
+from activity.events import emit
+from jobs.views import accepted
+from .changelog import changes_since
+from .mapcache import etag_for, get_map, get_version
+from .geocoder import MAX_GEOCODE_POINTS, get_geocoder
+from .importer import FORMATS as IMPORT_FORMATS, ImportFormatError, detect_format
+from .leaderboard import LEVEL_BOARDS, get_leaderboard, region_board
+from .models import Coverage, Region
+from .regionindex import get_index
+from .services import MAX_BATCH, clean_item, mark_locations, unmark_locations
+from .tasks import import_history_file
+from .tiles import get_archive
+
+def emit_marked(user, created):
+    """Activity events for the rows a mark created (`auto`: added as an ancestor)"""
+    for spec in created:
+        emit(
+            'location.marked', user,
+            name=spec['name'], level=spec['level'], parent=spec['parent'], grandparent=spec['grandparent'],
+            auto=bool(spec.get('auto')),
+        )
+
+
+def mark_one(user, data):
+    """
+    Smart Mark: Handles Countries, States, or Districts.
+    Returns (body, status); shared by the sync and async views.
+    """
+    name = data.get('name')
+    parent = data.get('parent')
+    grandparent = data.get('grandparent')
+
+    item, error = clean_item(data)
+    if error:
+        return {'error': error}, 400
+
+    # 1. Mark the target plus its state/country in one SELECT + one INSERT
+    created, _ = mark_locations(user, [item])
+    created_keys = {(c['name'], c['level']) for c in created}
+
+    # 2. Activity: the target if it was new, plus any state / country added on the way
+    if (item['name'], item['level']) not in created_keys:
+        emit('location.already_visited', user, name=name, level=item['level'], parent=parent, grandparent=grandparent)
+    emit_marked(user, created)
+
+    return {'status': 'marked', 'name': name}, 200
+
+
+def unmark_one(user, data):
+    """
+    Smart Un-mark. Returns (body, status).
+    """
+    name = data.get('name')
+
+    item, error = clean_item(data)
+    if error:
+        return {'error': error}, 400
+
+    # 1. Delete the item and its whole subtree in one statement
+    counts, roots = unmark_locations(user, [item])
+
+    # The DELETE hands back the row as stored (a gid may resolve to another
+    # spelling than the request's), so no lookup beforehand
+    removed = {'states': counts[1], 'districts': counts[2]}
+    for root_name, level, parent, grandparent in roots:
+        emit(
+            'location.unmarked', user,
+            name=root_name, level=level, parent=parent, grandparent=grandparent, removed=removed,
+        )
+
+    return {
+        'status': 'unmarked',
+        'name': name,
+        'deleted': {'countries': counts[0], 'states': counts[1], 'districts': counts[2]},
+    }, 200
 
-# Get an instance of a logger
-logger = logging.getLogger(__name__)
 
 class MarkLocationView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def log_action(self, user, action, name, level, parent, grandparent):
-        """
-        Helper to print formatted logs to the console
-        """
-        level_map = {0: 'Country', 1: 'State', 2: 'District'}
-        level_str = level_map.get(level, 'Unknown')
-        
-        # Build the log message
-        msg = f"🌍 [MAP ACTIVITY] User: {user.username} | Action: {action} | {level_str}: {name}"
-        
-        if parent:
-            msg += f" | Region: {parent}"
-        if grandparent:
-            msg += f" | Country: {grandparent}"
-            
-        # Print to terminal (so you see it immediately)
-        print(msg)
-        # Also log to system logger (good for production files later)
-        logger.info(msg)
+    def post(self, request):
+        body, status = mark_one(request.user, request.data)
+        return Response(body, status=status)
+
+    def delete(self, request):
+        body, status = unmark_one(request.user, request.data)
+        return Response(body, status=status)
+
+class BatchMarkLocationView(APIView):
+    """
+    Mark and/or unmark many regions in one round trip:
+    {"mark": [{name, level, parent, grandparent, gid?}, ...], "unmark": [...]}
+    Everything happens in a single transaction.
+    """
+    permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        """
-        Smart Mark: Handles Countries, States, or Districts.
-        """
         user = request.user
-        data = request.data
-        
-        name = data.get('name')
-        level = data.get('level') 
-        parent = data.get('parent')       
-        grandparent = data.get('grandparent') 
+        lists = {}
+        for key in ('mark', 'unmark'):
+            raw = request.data.get(key) or []
+            if not isinstance(raw, list):
+                return Response({'error': f"'{key}' must be a list"}, status=400)
+            items = []
+            for entry in raw:
+                item, error = clean_item(entry)
+                if error:
+                    return Response({'error': error, 'item': entry}, status=400)
+                items.append(item)
+            lists[key] = items
 
-        if name is None or level is None:
-            return Response({'error': 'Missing name or level'}, status=400)
+        if len(lists['mark']) + len(lists['unmark']) > MAX_BATCH:
+            return Response({'error': f'At most {MAX_BATCH} items per batch'}, status=400)
 
         with transaction.atomic():
-            # 1. Always mark the target location
-            obj, created = VisitedLocation.objects.get_or_create(
-                user=user,
-                name=name,
-                level=level,
-                parent=parent,
-                grandparent=grandparent
-            )
-
-            # 2. LOGGING (Only if actually new)
-            if created:
-                self.log_action(user, "MARKED", name, level, parent, grandparent)
-            else:
-                print(f"ℹ️  [INFO] User {user.username} tried to mark {name} (Already visited)")
-
-            # 3. BUBBLE UP LOGIC
-            if level == 2 and parent and grandparent:
-                # Mark State
-                s_obj, s_created = VisitedLocation.objects.get_or_create(
-                    user=user, name=parent, level=1, parent=grandparent
-                )
-                if s_created: print(f"    ↳ Auto-marked Parent State: {parent}")
-
-                # Mark Country
-                c_obj, c_created = VisitedLocation.objects.get_or_create(
-                    user=user, name=grandparent, level=0
-                )
-                if c_created: print(f"    ↳ Auto-marked Grandparent Country: {grandparent}")
-            
-            elif level == 1 and parent:
-                # Mark Country
-                c_obj, c_created = VisitedLocation.objects.get_or_create(
-                    user=user, name=parent, level=0
-                )
-                if c_created: print(f"    ↳ Auto-marked Parent Country: {parent}")
-
-        return Response({'status': 'marked', 'name': name})
+            counts, roots = unmark_locations(user, lists['unmark'])
+            deleted = sum(counts.values())
+            created, _ = mark_locations(user, lists['mark'])
 
-    def delete(self, request):
-        """
-        Smart Un-mark.
-        """
-        user = request.user
-        data = request.data
-        name = data.get('name')
-        level = data.get('level')
-        
-        # We fetch parent info from DB if not provided, for better logging
-        if level is not None and name:
-            target = VisitedLocation.objects.filter(user=user, name=name, level=level).first()
-            parent = target.parent if target else data.get('parent')
-            grandparent = target.grandparent if target else data.get('grandparent')
-        else:
-            parent = data.get('parent')
-            grandparent = data.get('grandparent')
+        emit_marked(user, created)
+        for name, level, parent, grandparent in roots:
+            emit('location.unmarked', user, name=name, level=level, parent=parent, grandparent=grandparent)
+
+        return Response({
+            'status': 'ok',
+            'marked': len(created),
+            'unmarked': deleted,
+        })
+
+
+def map_params(params):
+    """(encoding, since, error) from a my-map query string"""
+    encoding = params.get('encoding', 'names')
+    if encoding not in ('names', 'bitmap'):
+        return None, None, 'Invalid encoding'
+    since = params.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return None, None, 'Invalid since'
+    return encoding, since, None
 
-        with transaction.atomic():
-            # 1. Delete the specific item
-            deleted_count, _ = VisitedLocation.objects.filter(user=user, name=name, level=level).delete()
-
-            if deleted_count > 0:
-                self.log_action(user, "UNMARKED", name, level, parent, grandparent)
-
-            # 2. CASCADE DOWN logic
-            if level == 0: # Country
-                # Delete all children
-                d_del, _ = VisitedLocation.objects.filter(user=user, grandparent=name).delete()
-                s_del, _ = VisitedLocation.objects.filter(user=user, parent=name).delete()
-                if s_del or d_del:
-                    print(f"    🔥 Cascade Delete: Removed {s_del} states and {d_del} districts in {name}")
-            
-            elif level == 1: # State
-                d_del, _ = VisitedLocation.objects.filter(user=user, parent=name).delete()
-                if d_del:
-                    print(f"    🔥 Cascade Delete: Removed {d_del} districts in {name}")
-
-        return Response({'status': 'unmarked', 'name': name})
 
 class UserMapDataView(APIView):
     permission_classes = [IsAuthenticated]
 
+    # Token claims are enough to know the user; whether the account is still
+    # active comes from the cache, not a user query per request
+    authentication_classes = [ActiveJWTStatelessUserAuthentication]
+
+    @replica_reads
     def get(self, request):
         """
         Fetch ALL visited locations to paint the map.
+        Conditional on the user's map version: unchanged maps get a 304.
+
+        ?since=<cursor> returns only what was added / removed after that
+        version; falls back to the full map if the log can't cover it.
+        ?encoding=bitmap sends the full map as a bitmap over the region
+        index manifest (RegionManifestView) instead of name lists.
         """
-        locations = VisitedLocation.objects.filter(user=request.user)
+        user_id = request.user.id
+        encoding, since, error = map_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=400)
+        version = get_version(user_id)
+
+        if since is not None:
+            delta = changes_since(user_id, since, version)
+            if delta is not None:
+                return Response({'cursor': version, 'full': False, **delta})
+
+        etag = etag_for(user_id, version, encoding)
+        if since is None and request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            version, payload = get_map(user_id, encoding)
+            etag = etag_for(user_id, version, encoding)
+            response = Response({'cursor': version, 'full': True, 'encoding': encoding, **payload})
+
+        response['ETag'] = etag
+        # Always revalidate; the browser re-sends the ETag and gets a cheap 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+class CoverageStatsView(APIView):
+    """
+    "X of Y" progress per parent region, from the materialized Coverage table
+    in a single query. ?level=0|1|2 keeps only the coverage of that child
+    level (0: countries of the world, 1: states per country, 2: districts per state).
+    """
+    permission_classes = [IsAuthenticated]
+
+    @replica_reads
+    def get(self, request):
+        rows = Coverage.objects.filter(user=request.user).select_related('region').order_by('region__name')
+        level = request.query_params.get('level')
+        if level is not None:
+            if level not in ('0', '1', '2'):
+                return Response({'error': 'Invalid level'}, status=400)
+            rows = rows.filter(region__isnull=True) if level == '0' else rows.filter(region__level=int(level) - 1)
+
+        results = []
+        for row in rows:
+            region = row.region
+            results.append({
+                'gid': region.gid if region else None,
+                'name': region.name if region else 'World',
+                'level': region.level + 1 if region else 0,
+                'visited': row.visited,
+                'total': row.total,
+                'percent': row.percent,
+            })
+        return Response({'coverage': results})
+
+
+class LeaderboardView(APIView):
+    """
+    Top-N and the caller's standing on one board.
+    ?board=countries|states|districts (default districts), or ?region=<gid>
+    for the visited children of one country / state; ?limit=N (max 100).
+    """
+    permission_classes = [IsAuthenticated]
+
+    @replica_reads
+    def get(self, request):
+        gid = request.query_params.get('region')
+        if gid:
+            region = Region.objects.filter(gid=gid).only('id', 'name').first()
+            if region is None:
+                return Response({'error': 'Unknown region'}, status=404)
+            board = region_board(region.id)
+        else:
+            board = request.query_params.get('board', 'districts')
+            if board not in LEVEL_BOARDS.values():
+                return Response({'error': 'Invalid board'}, status=400)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=400)
+
+        leaderboard = get_leaderboard()
+        top = leaderboard.top(board, limit)
+        usernames = dict(
+            get_user_model().objects.filter(id__in=[member for member, _ in top]).values_list('id', 'username')
+        )
+        entries, rank, seen = [], 0, 0
+        previous = None
+        for member, score in top:
+            seen += 1
+            if score != previous:
+                rank, previous = seen, score
+            entries.append({'rank': rank, 'username': usernames.get(member), 'score': score})
+
         return Response({
-            'districts': locations.filter(level=2).values_list('name', flat=True),
-            'states': locations.filter(level=1).values_list('name', flat=True),
-            'countries': locations.filter(level=0).values_list('name', flat=True),
-        })
\ No newline at end of file
+            'board': gid or board,
+            'top': entries,
+            'me': leaderboard.standing(board, request.user.id),
+        })
+
+
+def parse_point(lat, lon):
+    """(lat, lon) as floats; ValueError unless both are finite and on the globe"""
+    lat, lon = float(lat), float(lon)
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Point out of range')
+    return lat, lon
+
+
+class ReverseGeocodeView(APIView):
+    """
+    Which country / state / district is a point in?
+    GET ?lat=..&lon=..  or  POST {"points": [[lat, lon], ...]} (up to MAX_GEOCODE_POINTS).
+    Each match comes back in the shape /mark/ expects.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            point = parse_point(request.query_params['lat'], request.query_params['lon'])
+        except (KeyError, ValueError):
+            return Response({'error': 'lat and lon are required numbers'}, status=400)
+        return Response(get_geocoder().lookup([point])[0])
+
+    def post(self, request):
+        points = request.data.get('points')
+        if not isinstance(points, list):
+            return Response({'error': "'points' must be a list of [lat, lon]"}, status=400)
+        if len(points) > MAX_GEOCODE_POINTS:
+            return Response({'error': f'At most {MAX_GEOCODE_POINTS} points per request'}, status=400)
+        try:
+            coords = [parse_point(lat, lon) for lat, lon in points]
+        except (TypeError, ValueError):
+            return Response({'error': "'points' must be a list of [lat, lon]"}, status=400)
+        return Response({'results': get_geocoder().lookup(coords)})
+
+
+class ImportHistoryView(APIView):
+    """
+    Upload a GPX track, GeoJSON or Takeout location history (multipart field
+    "file", optional "format") and mark every region it passes through.
+    The import runs on the job queue: 202 with the job to poll.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file uploaded'}, status=400)
+        fmt = request.data.get('format') or None
+        if fmt and fmt not in IMPORT_FORMATS:
+            return Response({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}, status=400)
+
+        # Fail fast on files we can't read at all; the rest is the worker's job
+        try:
+            fmt = fmt or detect_format(upload.name, upload.read(4096))
+        except ImportFormatError as exc:
+            return Response({'error': f'Could not read file: {exc}'}, status=400)
+        upload.seek(0)
+
+        os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(settings.JOB_UPLOAD_DIR, f'{uuid.uuid4().hex}-{os.path.basename(upload.name)}')
+        with open(path, 'wb') as f:
+            for chunk in upload.chunks():
+                f.write(chunk)
+
+        job = import_history_file.delay(path, name=upload.name, fmt=fmt, user=request.user)
+        return accepted(job)
+
+
+class RegionManifestView(View):
+    """
+    The dense region index behind ?encoding=bitmap. Public; clients cache it
+    by version and revalidate with If-None-Match.
+    """
+
+    def get(self, request):
+        index = get_index()
+        etag = f'"{index.version}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(index.manifest())
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, no-cache'
+        return response
+
+
+class TileView(View):
+    """
+    Serves pre-built vector tiles from the MBTiles archive.
+    Public and immutable per archive build, so browsers and CDNs can cache hard.
+    """
+
+    def get(self, request, z, x, y):
+        archive = get_archive()
+        if archive is None:
+            return HttpResponseNotFound('Tile archive not built (run scripts/build_tiles.py)')
+        minzoom, maxzoom = archive.zoom_range
+        # Bound z before anything scales with it (1 << z)
+        if not minzoom <= z <= maxzoom:
+            return HttpResponseNotFound('Zoom out of range')
+        if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return HttpResponseNotFound('Tile out of range')
+
+        etag = f'"{archive.version}-{z}-{x}-{y}"'
+        cache_control = f'public, max-age={settings.TILES_CACHE_MAX_AGE}, immutable'
+
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            data = archive.get_tile(z, x, y)
+            if data is None:
+                # Nothing to draw here - an empty 204 is cached just like a tile
+                response = HttpResponse(status=204)
+            else:
+                response = HttpResponse(data, content_type='application/vnd.mapbox-vector-tile')
+                response['Content-Encoding'] = 'gzip'
+
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
@@ -3,5 +3,6 @@ from .models import DistrictPhoto
 
 @admin.register(DistrictPhoto)
 class DistrictPhotoAdmin(admin.ModelAdmin):
-    list_display = ('district_name', 'user', 'file_size_bytes', 'uploaded_at')
-    list_filter = ('country_name', 'user')
\ No newline at end of file
+    list_display = ('district_name', 'user', 'status', 'file_size_bytes', 'uploaded_at')
+    list_filter = ('status', 'country_name', 'user')
+    list_select_related = ('user',)
\ No newline at end of file
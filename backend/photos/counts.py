@@ -0,0 +1,64 @@
+"""
+Denormalized photo counts per user and place (PhotoCount).
+
+Every change to which place a photo counts for goes through apply():
+uploads with a location, placement from EXIF, rejection and deletion.
+Counts move with F() increments, so concurrent uploads don't need a lock;
+rebuild() recomputes them from DistrictPhoto with one GROUP BY.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import DistrictPhoto, PhotoCount
+
+
+def place(photo):
+    """The (country, state, district) a photo counts for; None if it has no location"""
+    key = (photo.country_name, photo.state_name, photo.district_name)
+    return key if any(key) else None
+
+
+def apply(user_id, deltas):
+    """deltas: {(country, state, district): +/- photos}"""
+    for key, n in deltas.items():
+        if key is None or not n:
+            continue
+        country, state, district = key
+        rows = PhotoCount.objects.filter(
+            user_id=user_id, country_name=country, state_name=state, district_name=district,
+        )
+        if rows.update(count=Greatest(F('count') + n, 0)) or n < 0:
+            continue
+        try:
+            with transaction.atomic():
+                PhotoCount.objects.create(
+                    user_id=user_id, country_name=country, state_name=state, district_name=district, count=n,
+                )
+        except IntegrityError:
+            # Created concurrently since our UPDATE
+            rows.update(count=F('count') + n)
+
+
+def rebuild(user_ids=None):
+    """Recompute the counts, replacing the stored rows. Returns the number of rows written"""
+    photos = DistrictPhoto.objects.exclude(status=DistrictPhoto.FAILED)
+    if user_ids is not None:
+        photos = photos.filter(user_id__in=user_ids)
+    grouped = (
+        photos.values_list('user_id', 'country_name', 'state_name', 'district_name')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    rows = [
+        PhotoCount(user_id=user_id, country_name=country, state_name=state, district_name=district, count=n)
+        for user_id, country, state, district, n in grouped
+        if country or state or district
+    ]
+    with transaction.atomic():
+        stale = PhotoCount.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        PhotoCount.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
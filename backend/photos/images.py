@@ -0,0 +1,126 @@
+"""
+Image handling for uploads: validation, EXIF parsing and resized variants.
+
+Every stored file is re-encoded from the pixels, so none of the upload's
+metadata (EXIF, including its GPS position, XMP, comments) survives; what
+is useful is parsed out first by read_exif(). The EXIF orientation is
+applied to the pixels before it is dropped.
+"""
+import io
+from datetime import datetime, timedelta, timezone
+
+from PIL import ExifTags, Image, ImageOps
+
+FORMATS = ('JPEG', 'MPO', 'PNG', 'WEBP')
+MAX_PIXELS = 50_000_000
+JPEG_QUALITY = 85
+# Largest first: each variant is resized from the one before it
+VARIANTS = (
+    ('full', 4096),
+    ('preview', 1280),
+    ('thumb', 320),
+)
+
+
+class ImageError(ValueError):
+    pass
+
+
+def open_image(path):
+    """Open and check an image without decoding its pixels"""
+    try:
+        image = Image.open(path)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise ImageError('Not a readable image') from exc
+    if image.format not in FORMATS:
+        image.close()
+        raise ImageError(f"Unsupported image type {image.format}; use JPEG, PNG or WebP")
+    if image.width * image.height > MAX_PIXELS:
+        image.close()
+        raise ImageError(f'Image is too large ({image.width}x{image.height})')
+    return image
+
+
+def _degrees(dms, ref):
+    degrees, minutes, seconds = (float(v) for v in dms)
+    value = degrees + minutes / 60 + seconds / 3600
+    return -value if ref in ('S', 'W') else value
+
+
+def _taken_at(value, offset):
+    # EXIF times are local to the camera; without an offset, read them as UTC
+    try:
+        taken = datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+    tz = timezone.utc
+    if offset:
+        try:
+            sign = -1 if offset[0] == '-' else 1
+            hours, minutes = (int(part) for part in offset.lstrip('+-').split(':'))
+            tz = timezone(sign * timedelta(hours=hours, minutes=minutes))
+        except ValueError:
+            pass
+    return taken.replace(tzinfo=tz)
+
+
+def read_exif(image):
+    """{'taken_at', 'latitude', 'longitude', 'camera'}; each None when absent or unreadable"""
+    meta = {'taken_at': None, 'latitude': None, 'longitude': None, 'camera': None}
+    try:
+        exif = image.getexif()
+        details = exif.get_ifd(ExifTags.IFD.Exif)
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    except Exception:
+        # Malformed EXIF is common and never a reason to reject the photo
+        return meta
+
+    camera = ' '.join(
+        str(exif[tag]).strip('\x00 ') for tag in (ExifTags.Base.Make, ExifTags.Base.Model) if exif.get(tag)
+    )
+    meta['camera'] = camera[:255] or None
+
+    taken = details.get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    if taken:
+        meta['taken_at'] = _taken_at(taken, details.get(ExifTags.Base.OffsetTimeOriginal))
+
+    try:
+        lat = _degrees(gps[ExifTags.GPS.GPSLatitude], gps.get(ExifTags.GPS.GPSLatitudeRef))
+        lon = _degrees(gps[ExifTags.GPS.GPSLongitude], gps.get(ExifTags.GPS.GPSLongitudeRef))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return meta
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        meta['latitude'], meta['longitude'] = lat, lon
+    return meta
+
+
+def _flatten(image):
+    """RGB for JPEG, with transparency composited onto white"""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA', 'P', 'PA'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def make_variants(image):
+    """
+    Yield (name, jpeg bytes, (width, height)) for every entry in VARIANTS,
+    none larger than the original.
+    """
+    icc_profile = image.info.get('icc_profile')
+    # JPEG can decode straight to a reduced scale; much cheaper for big photos
+    image.draft('RGB', (VARIANTS[0][1], VARIANTS[0][1]))
+    try:
+        image.load()
+    except (OSError, SyntaxError, ValueError) as exc:
+        raise ImageError('Could not decode the image (truncated or corrupt file?)') from exc
+    image = _flatten(ImageOps.exif_transpose(image))
+    for name, size in VARIANTS:
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True, icc_profile=icc_profile)
+        yield name, out.getvalue(), image.size
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from photos.counts import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized per-place photo counts from DistrictPhoto (repairs drift)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help="Only this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        written = rebuild(options['users'])
+        scope = f"{len(options['users'])} users" if options['users'] else "all users"
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt photo counts for {scope}: {written} rows"))
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='districtphoto',
+            old_name='cloudinary_public_id',
+            new_name='storage_key',
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='camera',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='height',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='preview_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='processing', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='taken_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='districtphoto',
+            name='width',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='districtphoto',
+            name='file_size_bytes',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='districtphoto',
+            name='photo_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
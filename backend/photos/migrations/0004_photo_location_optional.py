@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0003_photo_processing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='districtphoto',
+            name='country_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='districtphoto',
+            name='district_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='districtphoto',
+            name='state_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0004_photo_location_optional'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_name', models.CharField(blank=True, max_length=255)),
+                ('state_name', models.CharField(blank=True, max_length=255)),
+                ('district_name', models.CharField(blank=True, max_length=255)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='districtphoto',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='photo_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='districtphoto',
+            index=models.Index(fields=['user', 'country_name', '-uploaded_at', '-id'], name='photo_country_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='districtphoto',
+            index=models.Index(fields=['user', 'country_name', 'state_name', '-uploaded_at', '-id'], name='photo_state_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='districtphoto',
+            index=models.Index(fields=['user', 'country_name', 'state_name', 'district_name', '-uploaded_at', '-id'], name='photo_district_recent'),
+        ),
+        migrations.AddField(
+            model_name='photocount',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photo_counts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='photocount',
+            constraint=models.UniqueConstraint(fields=('user', 'country_name', 'state_name', 'district_name'), name='unique_photo_count_place'),
+        ),
+    ]
@@ -2,21 +2,79 @@ from django.db import models
 from django.conf import settings
 
 class DistrictPhoto(models.Model):
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='photos')
-    
-    # Location
-    district_name = models.CharField(max_length=255)
-    state_name = models.CharField(max_length=255)
-    country_name = models.CharField(max_length=255)
-    
-    # Cloudinary Data
-    photo_url = models.URLField()
-    cloudinary_public_id = models.CharField(max_length=255)
-    
-    # Metadata for Storage Caps
-    file_size_bytes = models.IntegerField()
+
+    # Location: given with the upload, or resolved from the EXIF position (blank if neither)
+    district_name = models.CharField(max_length=255, blank=True)
+    state_name = models.CharField(max_length=255, blank=True)
+    country_name = models.CharField(max_length=255, blank=True)
+
+    # Stored files (photos/storage.py): variants live under storage_key
+    photo_url = models.URLField(max_length=500, blank=True)
+    preview_url = models.URLField(max_length=500, blank=True)
+    thumbnail_url = models.URLField(max_length=500, blank=True)
+    storage_key = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PROCESSING)
+    error = models.CharField(max_length=255, blank=True)
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+
+    # From EXIF (which is stripped from the stored files)
+    taken_at = models.DateTimeField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    camera = models.CharField(max_length=255, blank=True)
+
+    # Metadata for Storage Caps: the upload's size while processing, then the stored variants' total
+    file_size_bytes = models.BigIntegerField()
     caption = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Gallery pages, newest first: all photos, then by country / state / district
+            models.Index(fields=['user', '-uploaded_at', '-id'], name='photo_user_recent'),
+            models.Index(fields=['user', 'country_name', '-uploaded_at', '-id'], name='photo_country_recent'),
+            models.Index(
+                fields=['user', 'country_name', 'state_name', '-uploaded_at', '-id'], name='photo_state_recent'
+            ),
+            models.Index(
+                fields=['user', 'country_name', 'state_name', 'district_name', '-uploaded_at', '-id'],
+                name='photo_district_recent',
+            ),
+        ]
+
+    def __str__(self):
+        # user_id, not user: listing photos must not cost a query each
+        return f"Photo #{self.pk} by user {self.user_id} in {self.district_name or 'unknown place'}"
+
+
+class PhotoCount(models.Model):
+    """
+    Photos per user and place, kept up to date by photos/counts.py so the
+    gallery never has to COUNT(*) over DistrictPhoto.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='photo_counts')
+    country_name = models.CharField(max_length=255, blank=True)
+    state_name = models.CharField(max_length=255, blank=True)
+    district_name = models.CharField(max_length=255, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'country_name', 'state_name', 'district_name'], name='unique_photo_count_place'
+            ),
+        ]
+
     def __str__(self):
-        return f"Photo by {self.user.username} in {self.district_name}"
\ No newline at end of file
+        return f"{self.user_id} {self.country_name}/{self.state_name}/{self.district_name}: {self.count}"
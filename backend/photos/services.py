@@ -0,0 +1,197 @@
+"""
+Photo lifecycle and storage accounting.
+
+An upload reserves its size against the user's storage_limit before
+anything is stored: one conditional UPDATE ... SET storage_used_bytes =
+storage_used_bytes + n WHERE storage_used_bytes <= limit - n, so
+concurrent uploads can never overshoot the limit together. Once the
+variants are stored the charge is corrected to their actual total;
+failed and deleted photos give their bytes back.
+
+Photos uploaded without a location are placed from their EXIF GPS
+position by locate_photos(), a whole batch per reverse-geocoder call.
+"""
+import io
+import os
+import uuid
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from locations.geocoder import get_geocoder
+from locations.services import MAX_BATCH, mark_locations
+
+from . import counts
+from .images import VARIANTS, ImageError, make_variants, open_image, read_exif
+from .models import DistrictPhoto
+from .storage import get_storage
+
+
+def reserve_storage(user, size):
+    """Charge `size` bytes to `user` if they fit under the limit. Returns whether they did"""
+    users = get_user_model().objects.filter(pk=user.pk)
+    limit = user.storage_limit
+    if limit != float('inf'):
+        users = users.filter(storage_used_bytes__lte=limit - size)
+    return users.update(storage_used_bytes=F('storage_used_bytes') + size) == 1
+
+
+def adjust_storage(user_id, delta):
+    get_user_model().objects.filter(pk=user_id).update(
+        storage_used_bytes=Greatest(F('storage_used_bytes') + delta, 0)
+    )
+
+
+def new_storage_key(user):
+    return f'photos/{user.pk}/{uuid.uuid4().hex}'
+
+
+def variant_key(photo, name):
+    return f'{photo.storage_key}/{name}.jpg'
+
+
+def remove_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _place(photo, row):
+    """Fill the photo's names from a geocoder row. False if the point is in no region"""
+    district, state, country = row['district'], row['state'], row['country']
+    if not (district or state or country):
+        return False
+    # A region's own parent names first, so they agree with what marking it records
+    photo.district_name = district['name'] if district else ''
+    photo.state_name = (district and district['parent']) or (state and state['name']) or ''
+    photo.country_name = (
+        (district and district['grandparent']) or (state and state['parent']) or (country and country['name']) or ''
+    )
+    return True
+
+
+def locate_photos(user, photos, paths, mark=False):
+    """
+    Place the photos that have no location yet at the GPS position in
+    their uploads' EXIF. All positions are resolved in one reverse-geocoder
+    pass and written back with one bulk_update; with mark=True the deepest
+    region found for each is marked visited, MAX_BATCH per mark.
+    Returns how many photos were placed.
+    """
+    pending, points = [], []
+    for photo, path in zip(photos, paths):
+        if photo.district_name or photo.state_name or photo.country_name:
+            continue
+        try:
+            with open_image(path) as image:
+                meta = read_exif(image)
+        except ImageError:
+            continue  # process_photo rejects it
+        if meta['latitude'] is not None:
+            photo.latitude, photo.longitude = meta['latitude'], meta['longitude']
+            pending.append(photo)
+            points.append((meta['latitude'], meta['longitude']))
+    if not points:
+        return 0
+
+    placed, regions = [], {}
+    for photo, row in zip(pending, get_geocoder().lookup(points)):
+        if _place(photo, row):
+            placed.append(photo)
+            region = row['district'] or row['state'] or row['country']
+            regions.setdefault(region['gid'], region)
+    with transaction.atomic():
+        # Photos deleted meanwhile must not be counted
+        alive = set(
+            DistrictPhoto.objects.select_for_update().filter(pk__in=[photo.pk for photo in placed])
+            .values_list('pk', flat=True)
+        )
+        placed = [photo for photo in placed if photo.pk in alive]
+        DistrictPhoto.objects.bulk_update(
+            placed, ['district_name', 'state_name', 'country_name', 'latitude', 'longitude'], batch_size=500,
+        )
+        counts.apply(user.pk, Counter(counts.place(photo) for photo in placed))
+
+    if mark:
+        items = list(regions.values())
+        for start in range(0, len(items), MAX_BATCH):
+            mark_locations(user, items[start:start + MAX_BATCH])
+    return len(placed)
+
+
+def process_photo(photo, path):
+    """
+    Parse the upload at `path`, store its variants and mark the photo
+    ready. Raises images.ImageError for files that aren't usable images.
+    """
+    storage = get_storage()
+    with open_image(path) as image:
+        meta = read_exif(image)
+        urls, stored, size = {}, 0, None
+        for name, data, dimensions in make_variants(image):
+            urls[name] = storage.save(variant_key(photo, name), io.BytesIO(data))
+            stored += len(data)
+            size = size or dimensions  # the first variant is the largest
+
+    with transaction.atomic():
+        # Deleted while processing: nothing to update, and the files must go
+        updated = DistrictPhoto.objects.filter(pk=photo.pk, status=DistrictPhoto.PROCESSING).update(
+            status=DistrictPhoto.READY,
+            photo_url=urls['full'],
+            preview_url=urls['preview'],
+            thumbnail_url=urls['thumb'],
+            width=size[0],
+            height=size[1],
+            taken_at=meta['taken_at'],
+            latitude=meta['latitude'],
+            longitude=meta['longitude'],
+            camera=meta['camera'] or '',
+            file_size_bytes=stored,
+        )
+        if updated:
+            adjust_storage(photo.user_id, stored - photo.file_size_bytes)
+    if not updated:
+        delete_files(photo)
+    remove_upload(path)
+    return {'photo': photo.pk, 'bytes': stored, 'width': size[0], 'height': size[1]}
+
+
+def reject_photo(photo, error, path=None):
+    """Mark a photo failed and refund its reservation"""
+    with transaction.atomic():
+        photo = DistrictPhoto.objects.select_for_update().filter(pk=photo.pk, status=DistrictPhoto.PROCESSING).first()
+        if photo is not None:
+            photo.status, photo.error = DistrictPhoto.FAILED, error[:255]
+            photo.save(update_fields=['status', 'error'])
+            adjust_storage(photo.user_id, -photo.file_size_bytes)
+            counts.apply(photo.user_id, {counts.place(photo): -1})
+    if path:
+        remove_upload(path)
+
+
+def delete_photo(photo):
+    """Delete the row, refund its bytes, and remove its files once that commits"""
+    with transaction.atomic():
+        # Lock the row so a concurrent process_photo can't change its size under us
+        photo = DistrictPhoto.objects.select_for_update().filter(pk=photo.pk).first()
+        if photo is None:
+            return False
+        photo.delete()
+        if photo.status != DistrictPhoto.FAILED:
+            # Failed photos were refunded and uncounted when they failed
+            adjust_storage(photo.user_id, -photo.file_size_bytes)
+            counts.apply(photo.user_id, {counts.place(photo): -1})
+        if photo.status == DistrictPhoto.READY:
+            transaction.on_commit(lambda: delete_files(photo))
+    return True
+
+
+def delete_files(photo):
+    storage = get_storage()
+    for name, _ in VARIANTS:
+        storage.delete(variant_key(photo, name))
+
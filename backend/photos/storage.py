@@ -0,0 +1,91 @@
+"""
+Where photo files live. settings.PHOTO_STORAGE_BACKEND names the class:
+
+    LocalStorage       files under MEDIA_ROOT, served from MEDIA_URL
+                       (development, tests, single-host deploys)
+    CloudinaryStorage  Cloudinary, configured from CLOUDINARY_URL
+
+Keys are relative paths ('photos/<user>/<uuid>/thumb.jpg'); the backend
+turns them into URLs.
+"""
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class Storage:
+    """Backend interface"""
+
+    def save(self, key, fp, content_type='image/jpeg'):
+        """Store binary file `fp` under `key`. Returns its public URL"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove `key`; missing keys are not an error"""
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    def __init__(self, root=None, base_url=None):
+        self.root = os.fspath(root or settings.MEDIA_ROOT)
+        self.base_url = base_url or settings.MEDIA_URL
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.join(self.root, '')):
+            raise ValueError(f'Key escapes the storage root: {key!r}')
+        return path
+
+    def save(self, key, fp, content_type='image/jpeg'):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename, so a reader never sees half a file
+        partial = f'{path}.part'
+        with open(partial, 'wb') as f:
+            while chunk := fp.read(64 * 1024):
+                f.write(chunk)
+        os.replace(partial, path)
+        return f"{self.base_url.rstrip('/')}/{key}"
+
+    def delete(self, key):
+        path = self.path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # not empty yet
+
+
+class CloudinaryStorage(Storage):
+    def __init__(self):
+        try:
+            import cloudinary.uploader
+        except ImportError as exc:
+            raise ImproperlyConfigured("CloudinaryStorage needs the 'cloudinary' package") from exc
+        self.uploader = cloudinary.uploader
+
+    def _public_id(self, key):
+        # Cloudinary adds the extension itself
+        return os.path.splitext(key)[0]
+
+    def save(self, key, fp, content_type='image/jpeg'):
+        result = self.uploader.upload(fp, public_id=self._public_id(key), resource_type='image', overwrite=True)
+        return result['secure_url']
+
+    def delete(self, key):
+        self.uploader.destroy(self._public_id(key), resource_type='image')
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = import_string(settings.PHOTO_STORAGE_BACKEND)()
+    return _storage
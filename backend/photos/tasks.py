@@ -0,0 +1,68 @@
+"""Background tasks for the photos app (run by `manage.py run_worker`)"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from jobs.queue import task
+
+from .images import ImageError
+from .models import DistrictPhoto
+from .services import locate_photos, process_photo, reject_photo, remove_upload
+
+
+@task(queue='photos', timeout=2 * 60, max_attempts=3, bind=True)
+def process_upload(job, photo_id, path, locate=False, mark=False):
+    """Turn the upload saved at `path` into the photo's stored variants"""
+    photo = DistrictPhoto.objects.filter(pk=photo_id, status=DistrictPhoto.PROCESSING).first()
+    if photo is None:
+        # Deleted before we got to it
+        remove_upload(path)
+        return None
+    try:
+        if locate:
+            locate_photos(photo.user, [photo], [path], mark=mark)
+        return process_photo(photo, path)
+    except ImageError as exc:
+        # Retrying won't fix the file
+        reject_photo(photo, str(exc), path)
+        return {'photo': photo.pk, 'error': str(exc)}
+
+
+@process_upload.on_failure
+def reject_upload(job, photo_id, path, **kwargs):
+    """The last attempt failed (or timed out): refund the photo and drop its upload"""
+    photo = DistrictPhoto.objects.filter(pk=photo_id).first()
+    if photo is not None:
+        reject_photo(photo, 'Processing failed')
+    remove_upload(path)
+
+
+@task(queue='photos', timeout=10 * 60, max_attempts=2, bind=True)
+def process_batch(job, photo_ids, paths, mark=False):
+    """
+    Place a batch of uploads from their EXIF positions in one pass, then
+    queue each one's variants as its own job.
+    """
+    user = get_user_model().objects.get(pk=job.user_id)
+    photos = DistrictPhoto.objects.in_bulk(photo_ids)
+    pairs = []
+    for pk, path in zip(photo_ids, paths):
+        if pk in photos:
+            pairs.append((photos[pk], path))
+        else:
+            remove_upload(path)
+    placed = locate_photos(user, [photo for photo, _ in pairs], [path for _, path in pairs], mark=mark)
+    # All or none: if this fails, reject_batch must not drop uploads a queued job still needs
+    with transaction.atomic():
+        for photo, path in pairs:
+            process_upload.delay(photo.pk, path, user=user)
+    return {'photos': len(pairs), 'placed': placed}
+
+
+@process_batch.on_failure
+def reject_batch(job, photo_ids, paths, **kwargs):
+    """No variants job will come for these: refund the photos still waiting and drop their uploads"""
+    photos = DistrictPhoto.objects.in_bulk(photo_ids)
+    for pk, path in zip(photo_ids, paths):
+        if pk in photos:
+            reject_photo(photos[pk], 'Processing failed')
+        remove_upload(path)
@@ -1,3 +1,385 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import ExifTags, Image
+from rest_framework.test import APIClient
+
+from jobs import queue
+from jobs.models import Job
+from locations import regionindex
+from locations.models import VisitedLocation
+from locations.tests import squareland
+
+from . import counts, storage
+from .images import ImageError, make_variants, open_image, read_exif
+from .models import DistrictPhoto, PhotoCount
+from .views import decode_cursor, encode_cursor
+
+PLACE = {'country_name': 'India', 'state_name': 'Goa', 'district_name': 'North Goa'}
+
+
+def jpeg(size=(64, 48), lat=None, lon=None, taken=None, offset=None, camera=None, orientation=None):
+    exif = Image.Exif()
+    if camera:
+        exif[ExifTags.Base.Make], exif[ExifTags.Base.Model] = camera
+    if orientation:
+        exif[ExifTags.Base.Orientation] = orientation
+    if lat is not None:
+        exif[ExifTags.IFD.GPSInfo] = {
+            ExifTags.GPS.GPSLatitudeRef: 'S' if lat < 0 else 'N',
+            ExifTags.GPS.GPSLatitude: (float(abs(lat)), 0.0, 0.0),
+            ExifTags.GPS.GPSLongitudeRef: 'W' if lon < 0 else 'E',
+            ExifTags.GPS.GPSLongitude: (float(abs(lon)), 0.0, 0.0),
+        }
+    if taken:
+        details = {ExifTags.Base.DateTimeOriginal: taken}
+        if offset:
+            details[ExifTags.Base.OffsetTimeOriginal] = offset
+        exif[ExifTags.IFD.Exif] = details
+    out = io.BytesIO()
+    Image.new('RGB', size, 'teal').save(out, 'JPEG', exif=exif)
+    return out.getvalue()
+
+
+def opened(data):
+    return Image.open(io.BytesIO(data))
+
+
+def truncated():
+    """A JPEG cut off halfway through its pixel data: the header reads fine"""
+    out = io.BytesIO()
+    Image.effect_noise((400, 300), 64).convert('RGB').save(out, 'JPEG')
+    return out.getvalue()[:len(out.getvalue()) // 2]
+
+
+class ImageTests(SimpleTestCase):
+    def test_read_exif(self):
+        meta = read_exif(opened(jpeg(
+            lat=-1.5, lon=-2, taken='2024:05:01 10:00:00', offset='+05:30', camera=('Canon', 'EOS R6'),
+        )))
+        self.assertEqual((meta['latitude'], meta['longitude'], meta['camera']), (-1.5, -2.0, 'Canon EOS R6'))
+        self.assertEqual(meta['taken_at'], datetime(2024, 5, 1, 4, 30, tzinfo=dt_timezone.utc))
+
+    def test_missing_or_bad_exif(self):
+        empty = {'taken_at': None, 'latitude': None, 'longitude': None, 'camera': None}
+        self.assertEqual(read_exif(opened(jpeg())), empty)
+        meta = read_exif(opened(jpeg(lat=95, lon=10, taken='not a date')))
+        self.assertEqual((meta['latitude'], meta['taken_at']), (None, None))
+
+    def test_open_image_rejects(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt') as f:
+            f.write(b'hello')
+            f.flush()
+            with self.assertRaisesMessage(ImageError, 'Not a readable image'):
+                open_image(f.name)
+        with tempfile.NamedTemporaryFile(suffix='.gif') as f:
+            Image.new('P', (4, 4)).save(f, 'GIF')
+            f.flush()
+            with self.assertRaisesMessage(ImageError, 'Unsupported image type GIF'):
+                open_image(f.name)
+
+    def test_variants(self):
+        variants = list(make_variants(opened(jpeg(size=(2000, 1000)))))
+        self.assertEqual([(name, size) for name, _, size in variants], [
+            ('full', (2000, 1000)), ('preview', (1280, 640)), ('thumb', (320, 160)),
+        ])
+        # Re-encoded from the pixels: no EXIF survives
+        self.assertEqual(dict(opened(variants[0][1]).getexif()), {})
+
+    def test_variants_apply_orientation(self):
+        _, data, size = next(make_variants(opened(jpeg(size=(64, 48), orientation=6))))
+        self.assertEqual(size, (48, 64))
+
+    def test_truncated_image(self):
+        with self.assertRaises(ImageError):
+            list(make_variants(opened(truncated())))
+
+
+class PhotoTestCase(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = os.path.join(tmp.name, 'media')
+        self.uploads = os.path.join(tmp.name, 'uploads')
+        self.enterContext(override_settings(JOB_UPLOAD_DIR=self.uploads))
+        self.enterContext(mock.patch.object(storage, '_storage', storage.LocalStorage(self.media, '/media/')))
+        self.enterContext(mock.patch('photos.services.get_geocoder', return_value=squareland(self)))
+        caches['maps'].clear()
+        regionindex.invalidate()
+        self.user = get_user_model().objects.create_user(username='photographer', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, data, name='photo.jpg', **fields):
+        return self.client.post('/api/photos/', {'file': SimpleUploadedFile(name, data), **fields}, format='multipart')
+
+    def run_next(self):
+        job = queue.claim('test', ['photos'])
+        queue.execute(job)
+        job.refresh_from_db()
+        return job
+
+    def staged(self):
+        return os.listdir(self.uploads) if os.path.isdir(self.uploads) else []
+
+    def storage_used(self):
+        self.user.refresh_from_db(fields=['storage_used_bytes'])
+        return self.user.storage_used_bytes
+
+    def photo_counts(self):
+        return {
+            (row.country_name, row.state_name, row.district_name): row.count
+            for row in PhotoCount.objects.filter(user=self.user)
+        }
+
+
+class UploadTests(PhotoTestCase):
+    def test_upload(self):
+        data = jpeg(size=(2000, 1000), camera=('Canon', 'EOS'))
+        response = self.upload(data, caption='Beach', **PLACE)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['photo']['status'], DistrictPhoto.PROCESSING)
+        self.assertEqual(self.storage_used(), len(data))
+        self.assertEqual(self.photo_counts(), {('India', 'Goa', 'North Goa'): 1})
+        self.assertEqual(len(self.staged()), 1)
+
+        job = self.run_next()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        photo = DistrictPhoto.objects.get()
+        self.assertEqual((photo.status, photo.width, photo.height, photo.camera), ('ready', 2000, 1000, 'Canon EOS'))
+        self.assertEqual(photo.thumbnail_url, f'/media/{photo.storage_key}/thumb.jpg')
+        stored = sum(
+            os.path.getsize(os.path.join(self.media, photo.storage_key, f'{name}.jpg'))
+            for name in ('full', 'preview', 'thumb')
+        )
+        self.assertEqual((photo.file_size_bytes, self.storage_used()), (stored, stored))
+        self.assertEqual(self.staged(), [])
+
+        response = self.client.get(f'/api/photos/{photo.pk}/')
+        self.assertEqual((response.data['status'], response.data['caption']), ('ready', 'Beach'))
+
+    def test_rejected_uploads_leave_nothing_behind(self):
+        response = self.upload(jpeg(), country_name='India', state_name='Goa')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Missing district_name', response.data['error'])
+        response = self.upload(b'not an image', name='notes.txt', **PLACE)
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Not a readable image'))
+        self.assertEqual(self.client.post('/api/photos/', {}, format='multipart').status_code, 400)
+        self.assertEqual(self.staged(), [])
+        self.assertFalse(DistrictPhoto.objects.exists())
+
+    @override_settings(PHOTO_MAX_UPLOAD_BYTES=1024)
+    def test_too_large(self):
+        response = self.upload(jpeg(size=(400, 400)), **PLACE)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.staged(), [])
+
+    def test_storage_full(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(storage_used_bytes=self.user.LIMIT_FREE - 10)
+        response = self.upload(jpeg(), **PLACE)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.data['storage_used'], self.user.LIMIT_FREE - 10)
+        self.assertEqual(self.staged(), [])
+        self.assertFalse(DistrictPhoto.objects.exists())
+
+    def test_unusable_image_is_rejected_without_retry(self):
+        self.upload(truncated(), **PLACE)
+        job = self.run_next()
+        self.assertEqual((job.status, job.attempts), (Job.SUCCEEDED, 1))
+        photo = DistrictPhoto.objects.get()
+        self.assertEqual(photo.status, DistrictPhoto.FAILED)
+        self.assertEqual((self.storage_used(), self.photo_counts()), (0, {('India', 'Goa', 'North Goa'): 0}))
+        self.assertEqual(self.staged(), [])
+
+    def test_final_failure_refunds_and_removes_upload(self):
+        self.upload(jpeg(), **PLACE)
+        with mock.patch('photos.tasks.process_photo', side_effect=RuntimeError('storage down')):
+            job = self.run_next()
+            self.assertEqual((job.status, self.staged() != []), (Job.QUEUED, True))
+            for _ in range(job.max_attempts - 1):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                job = self.run_next()
+        self.assertEqual(job.status, Job.FAILED)
+        photo = DistrictPhoto.objects.get()
+        self.assertEqual((photo.status, photo.error), (DistrictPhoto.FAILED, 'Processing failed'))
+        self.assertEqual((self.storage_used(), self.photo_counts()), (0, {('India', 'Goa', 'North Goa'): 0}))
+        self.assertEqual(self.staged(), [])
+
+    def test_delete(self):
+        self.upload(jpeg(), **PLACE)
+        self.run_next()
+        photo = DistrictPhoto.objects.get()
+        folder = os.path.join(self.media, photo.storage_key)
+        self.assertTrue(os.path.isdir(folder))
+
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(username='other', password='x'))
+        self.assertEqual(other.delete(f'/api/photos/{photo.pk}/').status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/photos/{photo.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(os.path.exists(folder))
+        self.assertEqual((self.storage_used(), self.photo_counts()), (0, {('India', 'Goa', 'North Goa'): 0}))
+        self.assertEqual(self.client.get(f'/api/photos/{photo.pk}/').status_code, 404)
+
+
+class PlacementTests(PhotoTestCase):
+    def visited(self):
+        return set(VisitedLocation.objects.filter(user=self.user).values_list('name', 'level'))
+
+    def test_upload_placed_from_exif(self):
+        response = self.upload(jpeg(lat=1, lon=1), mark='true')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.run_next().status, Job.SUCCEEDED)
+        photo = DistrictPhoto.objects.get()
+        self.assertEqual(
+            (photo.country_name, photo.state_name, photo.district_name, photo.status),
+            ('Squareland', 'West', 'Westend', 'ready'),
+        )
+        self.assertEqual((photo.latitude, photo.longitude), (1.0, 1.0))
+        self.assertEqual(self.photo_counts(), {('Squareland', 'West', 'Westend'): 1})
+        self.assertEqual(self.visited(), {('Squareland', 0), ('West', 1), ('Westend', 2)})
+
+    def test_given_location_wins(self):
+        self.upload(jpeg(lat=1, lon=1), **PLACE)
+        self.run_next()
+        self.assertEqual(DistrictPhoto.objects.get().district_name, 'North Goa')
+        self.assertEqual(self.visited(), set())
+
+    def test_no_position_or_outside_every_region(self):
+        self.upload(jpeg())
+        self.upload(jpeg(lat=50, lon=50))
+        self.run_next()
+        self.run_next()
+        self.assertEqual(set(DistrictPhoto.objects.values_list('status', 'country_name')), {('ready', '')})
+        self.assertEqual(self.photo_counts(), {})
+
+    def batch(self, files, **fields):
+        files = [SimpleUploadedFile(name, data) for name, data in files]
+        return self.client.post('/api/photos/batch/', {'files': files, **fields}, format='multipart')
+
+    def test_batch(self):
+        response = self.batch([('a.jpg', jpeg(lat=1, lon=1)), ('b.jpg', jpeg(lat=8, lon=3)), ('c.txt', b'text')])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['rejected'], [{'name': 'c.txt', 'error': 'Not a readable image'}])
+        self.assertEqual(len(response.data['photos']), 2)
+
+        job = self.run_next()
+        self.assertEqual(job.result, {'photos': 2, 'placed': 2})
+        self.assertEqual(self.photo_counts(), {('Squareland', 'West', 'Westend'): 1, ('Squareland', 'West', ''): 1})
+        self.assertEqual(Job.objects.filter(name='photos.tasks.process_upload').count(), 2)
+        self.run_next()
+        self.run_next()
+        self.assertEqual(set(DistrictPhoto.objects.values_list('status', flat=True)), {'ready'})
+        self.assertEqual(self.staged(), [])
+
+    def test_batch_errors(self):
+        response = self.batch([('c.txt', b'text')])
+        self.assertEqual((response.status_code, response.data['error']), (400, 'No readable images'))
+        with override_settings(PHOTO_MAX_BATCH=1):
+            response = self.batch([('a.jpg', jpeg()), ('b.jpg', jpeg())])
+        self.assertEqual((response.status_code, response.data['error']), (400, 'At most 1 photos per batch'))
+        self.assertEqual(self.staged(), [])
+        self.assertFalse(DistrictPhoto.objects.exists())
+
+    def test_batch_final_failure_refunds_and_removes_uploads(self):
+        self.batch([('a.jpg', jpeg(lat=1, lon=1)), ('b.jpg', jpeg())])
+        with mock.patch('photos.tasks.locate_photos', side_effect=RuntimeError('geocoder down')):
+            job = self.run_next()
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            job = self.run_next()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(set(DistrictPhoto.objects.values_list('status', flat=True)), {'failed'})
+        self.assertEqual(self.storage_used(), 0)
+        self.assertEqual(self.staged(), [])
+        self.assertFalse(Job.objects.filter(name='photos.tasks.process_upload').exists())
+
+
+class GalleryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='photographer', password='x')
+        places = [
+            ('India', 'Goa', 'North Goa'), ('India', 'Goa', 'South Goa'), ('India', 'Kerala', 'Kochi'), ('', '', ''),
+        ]
+        photos = DistrictPhoto.objects.bulk_create([
+            DistrictPhoto(
+                user=cls.user, country_name=country, state_name=state, district_name=district,
+                storage_key=f'photos/{n}', file_size_bytes=100, status=DistrictPhoto.READY,
+            )
+            for n, (country, state, district) in enumerate(places * 3)
+        ])
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        for n, photo in enumerate(photos):
+            # Pairs share a timestamp: pages must split ties by id
+            DistrictPhoto.objects.filter(pk=photo.pk).update(uploaded_at=start + timedelta(hours=n // 2))
+        counts.rebuild()
+        cls.newest_first = list(DistrictPhoto.objects.order_by('-uploaded_at', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get('/api/photos/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids.append([photo['id'] for photo in response.data['photos']])
+            cursor = response.data['next']
+            if cursor is None:
+                return ids
+
+    def test_pages(self):
+        pages = self.pages(limit=5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), self.newest_first)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/photos/', {'limit': 1})
+        self.assertEqual(set(response.data['photos'][0]), {
+            'id', 'status', 'district_name', 'state_name', 'country_name', 'caption',
+            'thumbnail_url', 'preview_url', 'width', 'height', 'taken_at', 'uploaded_at',
+        })
+
+    def test_place_filter(self):
+        pages = self.pages(country='India', state='Goa', limit=4)
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        goa = set(DistrictPhoto.objects.filter(state_name='Goa').values_list('pk', flat=True))
+        self.assertEqual(set(sum(pages, [])), goa)
+        self.assertEqual(self.pages(country='India', state='Goa', district='Nowhere'), [[]])
+
+    def test_errors(self):
+        for params in ({'state': 'Goa'}, {'limit': 0}, {'limit': 'ten'}, {'cursor': '!!'}, {'cursor': 'bm9waXBl'}):
+            self.assertEqual(self.client.get('/api/photos/', params).status_code, 400, params)
+
+    def test_cursor_round_trip(self):
+        photo = DistrictPhoto.objects.get(pk=self.newest_first[0])
+        self.assertEqual(decode_cursor(encode_cursor(photo)), (photo.uploaded_at, photo.pk))
+
+    def test_counts(self):
+        response = self.client.get('/api/photos/counts/')
+        self.assertEqual(response.data['total'], 9)
+        self.assertEqual(response.data['counts'][0]['photos'], 3)
+        response = self.client.get('/api/photos/counts/', {'level': 1, 'country': 'India'})
+        self.assertEqual(response.data['counts'], [
+            {'country_name': 'India', 'state_name': 'Goa', 'photos': 6},
+            {'country_name': 'India', 'state_name': 'Kerala', 'photos': 3},
+        ])
+        self.assertEqual(self.client.get('/api/photos/counts/', {'level': 3}).status_code, 400)
+        self.assertEqual(self.client.get('/api/photos/counts/', {'district': 'Kochi'}).status_code, 400)
+
+    def test_rebuild_matches_incremental_counts(self):
+        before = set(PhotoCount.objects.values_list('country_name', 'state_name', 'district_name', 'count'))
+        PhotoCount.objects.update(count=0)
+        self.assertEqual(counts.rebuild([self.user.pk]), 3)
+        after = set(PhotoCount.objects.values_list('country_name', 'state_name', 'district_name', 'count'))
+        self.assertEqual(after, before)
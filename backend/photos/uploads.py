@@ -0,0 +1,72 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+
+
+class SavedUpload(UploadedFile):
+    """An upload already written to its final place on disk, at .path"""
+
+    def __init__(self, path, name, content_type, size, charset):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset)
+        self.path = path
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class DiskUploadHandler(FileUploadHandler):
+    """
+    Write the files of one multipart field straight into JOB_UPLOAD_DIR as
+    they arrive, a chunk at a time. Past max_bytes (per file) the partial
+    file is deleted and the rest of the body drained without being kept:
+    .too_large is set and request.FILES lacks that file. Files past
+    max_files set .too_many and are skipped, as are other file fields.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, request=None, field_name='file', max_bytes=None, max_files=1):
+        super().__init__(request)
+        self.field = field_name
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.too_large = False
+        self.too_many = False
+        self.count = 0
+        self.path = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != self.field:
+            raise SkipFile()
+        if self.count >= self.max_files:
+            self.too_many = True
+            raise SkipFile()
+        self.count += 1
+        os.makedirs(settings.JOB_UPLOAD_DIR, exist_ok=True)
+        self.path = os.path.join(settings.JOB_UPLOAD_DIR, f'{uuid.uuid4().hex}-{os.path.basename(self.file_name)}')
+        self.file = open(self.path, 'wb')
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.too_large = True
+            self.upload_interrupted()
+            raise StopUpload()
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        return SavedUpload(self.path, self.file_name, self.content_type, file_size, self.charset)
+
+    def upload_interrupted(self):
+        if self.path is not None and not self.file.closed:
+            self.file.close()
+            os.remove(self.path)
@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import PhotoBatchUploadView, PhotoCountsView, PhotoDetailView, PhotoListView
+
+urlpatterns = [
+    path('', PhotoListView.as_view(), name='photo-list'),
+    path('batch/', PhotoBatchUploadView.as_view(), name='photo-upload-batch'),
+    path('counts/', PhotoCountsView.as_view(), name='photo-counts'),
+    path('<int:pk>/', PhotoDetailView.as_view(), name='photo-detail'),
+]
@@ -1,3 +1,315 @@
-from django.shortcuts import render
+import base64
+import binascii
+from datetime import datetime
 
-# Create your views here.
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from core.dbrouter import replica_reads
+from jobs.views import accepted
+from .images import ImageError, open_image
+from . import counts
+from .models import DistrictPhoto, PhotoCount
+from .services import adjust_storage, delete_photo, new_storage_key, reserve_storage
+from .tasks import process_batch, process_upload
+from .uploads import DiskUploadHandler
+
+
+def photo_data(photo):
+    return {
+        'id': photo.pk,
+        'status': photo.status,
+        'error': photo.error or None,
+        'district_name': photo.district_name,
+        'state_name': photo.state_name,
+        'country_name': photo.country_name,
+        'caption': photo.caption,
+        'photo_url': photo.photo_url or None,
+        'preview_url': photo.preview_url or None,
+        'thumbnail_url': photo.thumbnail_url or None,
+        'width': photo.width,
+        'height': photo.height,
+        'taken_at': photo.taken_at,
+        'latitude': photo.latitude,
+        'longitude': photo.longitude,
+        'camera': photo.camera or None,
+        'file_size_bytes': photo.file_size_bytes,
+        'uploaded_at': photo.uploaded_at,
+    }
+
+
+LOCATION_FIELDS = ('district_name', 'state_name', 'country_name')
+# What a gallery page loads per photo (.only()): no EXIF, full-size or storage columns
+GALLERY_FIELDS = (
+    'id', 'status', 'district_name', 'state_name', 'country_name', 'caption',
+    'thumbnail_url', 'preview_url', 'width', 'height', 'taken_at', 'uploaded_at',
+)
+GALLERY_PAGE = 30
+MAX_GALLERY_PAGE = 100
+
+
+def gallery_data(photo):
+    return {field: getattr(photo, field) for field in GALLERY_FIELDS}
+
+
+def encode_cursor(photo):
+    raw = f'{photo.uploaded_at.isoformat()}|{photo.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(uploaded_at, id) of the last photo on the previous page. Raises ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        uploaded_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def _location(data):
+    """(fields, error): all three location fields, or none to place the photo from its EXIF"""
+    fields = {key: (data.get(key) or '').strip() for key in LOCATION_FIELDS}
+    missing = [key for key, value in fields.items() if not value]
+    if missing and len(missing) < len(fields):
+        return None, f"Missing {', '.join(missing)} (or leave all three out to use the photo's GPS position)"
+    return fields, None
+
+
+def _flag(data, key):
+    return str(data.get(key, '')).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _storage_full(user):
+    user.refresh_from_db(fields=['storage_used_bytes'])
+    return Response({
+        'error': 'Storage limit reached',
+        'storage_used': user.storage_used_bytes,
+        'storage_limit': user.storage_limit,
+    }, status=413)
+
+
+def _too_large():
+    limit_mb = settings.PHOTO_MAX_UPLOAD_BYTES // (1024 * 1024)
+    return Response({'error': f'Photos are limited to {limit_mb} MB each'}, status=413)
+
+
+def _place_filter(params):
+    """(filter kwargs, error) from ?country= / &state= / &district=, each level needing the one above"""
+    country, state, district = (params.get(key) for key in ('country', 'state', 'district'))
+    if (state and not country) or (district and not state):
+        return None, 'state needs country, and district needs state'
+    place = {}
+    for field, value in (('country_name', country), ('state_name', state), ('district_name', district)):
+        if value:
+            place[field] = value
+    return place, None
+
+
+class PhotoListView(APIView):
+    """
+    GET: the user's photo gallery, newest first, optionally for one place
+    (?country=, &state=, &district=). Keyset pagination: pass the
+    response's "next" back as ?cursor= for the following page (?limit=,
+    max MAX_GALLERY_PAGE). Each page is one index range scan, however deep.
+
+    POST: upload a photo (multipart: "file", optional "caption"). Give its
+    "district_name", "state_name" and "country_name", or leave them out to
+    have it placed from its EXIF GPS position; "mark=true" then also marks
+    the district visited.
+
+    The file is streamed to disk as it arrives and its size charged to the
+    user's storage before it is accepted; resizing runs on the job queue,
+    so the answer is 202 with the photo (status "processing") and its job.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @replica_reads
+    def get(self, request):
+        place, error = _place_filter(request.query_params)
+        if error:
+            return Response({'error': error}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', GALLERY_PAGE)), MAX_GALLERY_PAGE)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=400)
+        if limit < 1:
+            return Response({'error': 'Invalid limit'}, status=400)
+
+        photos = DistrictPhoto.objects.filter(user=request.user, **place)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                uploaded_at, pk = decode_cursor(cursor)
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=400)
+            photos = photos.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, pk__lt=pk))
+
+        # One extra row tells whether there is a next page
+        page = list(photos.only(*GALLERY_FIELDS).order_by('-uploaded_at', '-id')[:limit + 1])
+        more = len(page) > limit
+        page = page[:limit]
+        return Response({
+            'photos': [gallery_data(photo) for photo in page],
+            'next': encode_cursor(page[-1]) if more else None,
+        })
+
+    def post(self, request):
+        handler = DiskUploadHandler(request, max_bytes=settings.PHOTO_MAX_UPLOAD_BYTES)
+        request.upload_handlers = [handler]
+
+        upload = request.FILES.get('file')
+        if handler.too_large:
+            return _too_large()
+        if upload is None:
+            return Response({'error': 'No file uploaded'}, status=400)
+
+        fields, error = _location(request.data)
+        if error:
+            upload.discard()
+            return Response({'error': error}, status=400)
+
+        # Fail fast on files that aren't images at all (reads the header only)
+        try:
+            open_image(upload.path).close()
+        except ImageError as exc:
+            upload.discard()
+            return Response({'error': str(exc)}, status=400)
+
+        user = request.user
+        if not reserve_storage(user, upload.size):
+            upload.discard()
+            return _storage_full(user)
+
+        upload.close()
+        try:
+            with transaction.atomic():
+                photo = DistrictPhoto.objects.create(
+                    user=user,
+                    caption=request.data.get('caption') or '',
+                    storage_key=new_storage_key(user),
+                    file_size_bytes=upload.size,
+                    **fields,
+                )
+                counts.apply(user.pk, {counts.place(photo): 1})
+                job = process_upload.delay(
+                    photo.pk, upload.path, locate=not fields['district_name'], mark=_flag(request.data, 'mark'),
+                    user=user,
+                )
+        except Exception:
+            adjust_storage(user.pk, -upload.size)
+            upload.discard()
+            raise
+        return accepted(job, photo=photo_data(photo))
+
+
+class PhotoBatchUploadView(APIView):
+    """
+    Upload up to PHOTO_MAX_BATCH photos at once (multipart field "files",
+    repeated), each placed from its EXIF GPS position; "mark=true" marks
+    every district found visited. Files that aren't images are listed in
+    "rejected"; the rest are charged to storage together, or not at all.
+
+    One job places the whole batch in a single reverse-geocoding pass and
+    then queues the resizing of each photo.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        handler = DiskUploadHandler(
+            request, field_name='files', max_bytes=settings.PHOTO_MAX_UPLOAD_BYTES, max_files=settings.PHOTO_MAX_BATCH,
+        )
+        request.upload_handlers = [handler]
+
+        uploads = request.FILES.getlist('files')
+        if handler.too_large or handler.too_many:
+            for upload in uploads:
+                upload.discard()
+            if handler.too_large:
+                return _too_large()
+            return Response({'error': f'At most {settings.PHOTO_MAX_BATCH} photos per batch'}, status=400)
+        if not uploads:
+            return Response({'error': 'No files uploaded'}, status=400)
+
+        accepted_uploads, rejected = [], []
+        for upload in uploads:
+            try:
+                open_image(upload.path).close()
+            except ImageError as exc:
+                rejected.append({'name': upload.name, 'error': str(exc)})
+                upload.discard()
+                continue
+            upload.close()
+            accepted_uploads.append(upload)
+        if not accepted_uploads:
+            return Response({'error': 'No readable images', 'rejected': rejected}, status=400)
+
+        user = request.user
+        total = sum(upload.size for upload in accepted_uploads)
+        if not reserve_storage(user, total):
+            for upload in accepted_uploads:
+                upload.discard()
+            return _storage_full(user)
+
+        try:
+            with transaction.atomic():
+                photos = DistrictPhoto.objects.bulk_create([
+                    DistrictPhoto(user=user, storage_key=new_storage_key(user), file_size_bytes=upload.size)
+                    for upload in accepted_uploads
+                ])
+                job = process_batch.delay(
+                    [photo.pk for photo in photos], [upload.path for upload in accepted_uploads],
+                    mark=_flag(request.data, 'mark'), user=user,
+                )
+        except Exception:
+            adjust_storage(user.pk, -total)
+            for upload in accepted_uploads:
+                upload.discard()
+            raise
+        return accepted(job, photos=[photo_data(photo) for photo in photos], rejected=rejected)
+
+
+class PhotoCountsView(APIView):
+    """
+    Photo counts per place from the denormalized PhotoCount table: per
+    district by default, ?level=1 per state, ?level=0 per country;
+    ?country= / &state= narrow it down.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @replica_reads
+    def get(self, request):
+        place, error = _place_filter(request.query_params)
+        if error:
+            return Response({'error': error}, status=400)
+        level = request.query_params.get('level', '2')
+        if level not in ('0', '1', '2'):
+            return Response({'error': 'Invalid level'}, status=400)
+        keys = ['country_name', 'state_name', 'district_name'][:int(level) + 1]
+
+        rows = (
+            PhotoCount.objects.filter(user=request.user, count__gt=0, **place)
+            .values(*keys)
+            .annotate(photos=Sum('count'))
+            .order_by('-photos', *keys)
+        )
+        return Response({'counts': list(rows), 'total': sum(row['photos'] for row in rows)})
+
+
+class PhotoDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        photo = DistrictPhoto.objects.filter(pk=pk, user=request.user).first()
+        if photo is None:
+            return Response({'error': 'Not found'}, status=404)
+        return Response(photo_data(photo))
+
+    def delete(self, request, pk):
+        photo = DistrictPhoto.objects.filter(pk=pk, user=request.user).first()
+        if photo is None or not delete_photo(photo):
+            return Response({'error': 'Not found'}, status=404)
+        return Response({'status': 'deleted', 'id': pk})
@@ -0,0 +1,63 @@
+"""
+Stateless JWT authentication that still notices deactivated accounts.
+
+JWTStatelessUserAuthentication trusts the token alone, so a user who was
+deactivated or deleted would keep reading their map until the token
+expires (a week). Here the token's user id is also checked against a
+cached "is active" flag: one cache read per request, one primary-key
+query per ACTIVE_TIMEOUT. Saving or deleting a user drops the entry once
+that commits; a queryset .update() bypasses the signals and shows within
+ACTIVE_TIMEOUT.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+ACTIVE_TIMEOUT = 60
+
+
+def _active_key(user_id):
+    return f'user-active:{user_id}'
+
+
+def _active_users(user_id):
+    return get_user_model().objects.filter(pk=user_id, is_active=True)
+
+
+def is_active(user_id):
+    active = cache.get(_active_key(user_id))
+    if active is None:
+        active = _active_users(user_id).exists()
+        cache.set(_active_key(user_id), active, ACTIVE_TIMEOUT)
+    return active
+
+
+async def ais_active(user_id):
+    active = await cache.aget(_active_key(user_id))
+    if active is None:
+        active = await _active_users(user_id).aexists()
+        await cache.aset(_active_key(user_id), active, ACTIVE_TIMEOUT)
+    return active
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_user(sender, instance, **kwargs):
+    # On commit: a request in between would cache the old state again
+    key = _active_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class ActiveJWTStatelessUserAuthentication(JWTStatelessUserAuthentication):
+    """A TokenUser from the token's claims, refused if the account is gone or inactive"""
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not is_active(user.id):
+            raise AuthenticationFailed('User is inactive or deleted', code='user_inactive')
+        return user
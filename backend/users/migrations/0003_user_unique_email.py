@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:54
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    Signup never compared emails case-insensitively, so an existing database
+    may hold Foo@x.com and foo@x.com. Stop with the list of accounts to merge
+    or fix, instead of failing on the constraint halfway through a deploy.
+    """
+    User = apps.get_model('users', 'User')
+    users = User.objects.using(schema_editor.connection.alias).exclude(email='').annotate(lowered=Lower('email'))
+    taken = users.values('lowered').annotate(n=Count('id')).filter(n__gt=1).values_list('lowered', flat=True)
+    clashes = users.filter(lowered__in=list(taken)).order_by('lowered', 'id').values_list('id', 'username', 'email')
+    if clashes:
+        accounts = '\n'.join(f'  id={pk} username={username!r} email={email!r}' for pk, username, email in clashes)
+        raise RuntimeError(
+            'Accounts share an email up to case; give each a distinct email (or none) before migrating:\n'
+            + accounts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_user_email_verified_user_phone'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='unique_user_email'),
+        ),
+    ]
@@ -2,6 +2,7 @@
 # 1. backend/users/models.py (UPDATE)
 # ============================================
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
@@ -20,6 +21,14 @@ class User(AbstractUser):
     # Limits (in bytes)
     LIMIT_FREE = 200 * 1024 * 1024          # 200 MB
     LIMIT_PREMIUM = 5 * 1024 * 1024 * 1024  # 5 GB
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # One account per email, whatever its case; accounts without one (admin) are exempt
+            models.UniqueConstraint(
+                Lower('email'), condition=~models.Q(email=''), name='unique_user_email',
+            ),
+        ]
     
     def __str__(self):
         return self.username
@@ -0,0 +1,64 @@
+"""
+Password hashing on a small, bounded thread pool.
+
+A signup spends most of its time in the password hasher (PBKDF2, hundreds
+of milliseconds of CPU by design). Run on the request threads, a burst of
+signups would occupy every core and every worker thread at once, and
+everything else would queue behind it. Here at most SIGNUP_HASH_WORKERS
+hashes run per process (hashlib releases the GIL, so they run in
+parallel), and at most SIGNUP_HASH_BACKLOG more wait for a turn. Past that,
+hash_password() raises HashingBusy at once and the signup is refused with
+a 503 instead of piling up.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+class HashingBusy(Exception):
+    """Every hashing worker is busy and the backlog is full"""
+
+
+class HashingPool:
+    def __init__(self, workers, backlog):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + backlog)
+
+    def hash(self, raw_password):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy
+        try:
+            return self.executor.submit(make_password, raw_password).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(settings.SIGNUP_HASH_WORKERS, settings.SIGNUP_HASH_BACKLOG)
+    return _pool
+
+
+def _forget_pool():
+    # A forked child has none of the parent's threads
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def hash_password(raw_password):
+    """make_password(raw_password) on the pool. Raises HashingBusy when it is full"""
+    return get_pool().hash(raw_password)
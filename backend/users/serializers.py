@@ -2,10 +2,35 @@
 # ============================================
 # 2. backend/users/serializers.py (NEW FILE)
 # ============================================
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from .models import User
+from .passwords import hash_password
+
+# Unique columns / constraints -> the error reported for a clash on each
+CONFLICTS = {
+    'email': "Email already registered",
+    'phone': "Phone number already used",
+    'username': "A user with that username already exists.",
+}
+
+
+def conflicting_field(exc):
+    """The field whose unique constraint an IntegrityError from a User insert hit, or None"""
+    diag = getattr(exc.__cause__, 'diag', None)  # psycopg names the constraint
+    text = getattr(diag, 'constraint_name', None) or str(exc).split('\n')[0]
+    for field in CONFLICTS:
+        if field in text.lower():
+            return field
+    return None
+
 
 class SignupSerializer(serializers.ModelSerializer):
+    """
+    Uniqueness of username, email and phone is left to the database: no
+    lookups ahead of the insert (they could race it anyway). A clash comes
+    back from save() as a ValidationError on the field, like any other.
+    """
     password = serializers.CharField(write_only=True, min_length=8)
     confirm_password = serializers.CharField(write_only=True)
     
@@ -13,32 +38,32 @@ class SignupSerializer(serializers.ModelSerializer):
         model = User
         fields = ['username', 'email', 'phone', 'password', 'confirm_password']
         extra_kwargs = {
-            'email': {'required': True},
-            'phone': {'required': True}
+            # The model allows blank (accounts made in the admin); a signup must not
+            'email': {'required': True, 'allow_blank': False},
+            'phone': {'required': True, 'allow_blank': False, 'validators': []},
+            # Without the UniqueValidator DRF would add: one query per field
+            'username': {'validators': [User.username_validator]},
         }
     
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email already registered")
-        return value
-    
-    def validate_phone(self, value):
-        if User.objects.filter(phone=value).exists():
-            raise serializers.ValidationError("Phone number already used")
-        return value
-    
     def validate(self, data):
         if data['password'] != data['confirm_password']:
             raise serializers.ValidationError("Passwords do not match")
         return data
     
     def create(self, validated_data):
-        validated_data.pop('confirm_password')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
             phone=validated_data['phone'],
-            password=validated_data['password'],
+            password=hash_password(validated_data['password']),  # off the request thread
             is_active=True  # Set to False if you want email verification first
         )
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError as exc:
+            field = conflicting_field(exc)
+            if field is None:
+                raise
+            raise serializers.ValidationError({field: [CONFLICTS[field]]})
         return user
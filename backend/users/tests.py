@@ -1,3 +1,180 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import passwords
+from .models import User
+from .passwords import HashingBusy, HashingPool
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def signup(**fields):
+    body = {
+        'username': 'traveller',
+        'email': 'traveller@example.com',
+        'phone': '9876543210',
+        'password': 'long-enough',
+        'confirm_password': 'long-enough',
+    }
+    body.update(fields)
+    return body
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SignupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, body):
+        return self.client.post('/api/auth/signup/', body, format='json')
+
+    def assertRefused(self, response, field):
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertEqual(response.data['error'], field)
+
+    def test_signup(self):
+        response = self.post(signup(email='Traveller@EXAMPLE.com'))
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get()
+        self.assertEqual((user.username, user.email, user.phone), ('traveller', 'Traveller@example.com', '9876543210'))
+        self.assertTrue(user.check_password('long-enough'))
+
+    def test_invalid_input_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            self.assertRefused(self.post(signup(confirm_password='something-else')), 'password')
+            self.assertRefused(self.post(signup(email='not an email')), 'email')
+            self.assertRefused(self.post(signup(username='no spaces')), 'username')
+
+    def test_blank_email_or_phone(self):
+        self.assertRefused(self.post(signup(email='')), 'email')
+        self.assertRefused(self.post(signup(username='other', phone='')), 'phone')
+        self.assertFalse(User.objects.exists())
+
+    def test_taken_fields(self):
+        self.assertEqual(self.post(signup()).status_code, 201)
+        self.assertRefused(self.post(signup(username='other', email='TRAVELLER@example.com', phone='1')), 'email')
+        self.assertRefused(self.post(signup(username='other', email='other@example.com')), 'phone')
+        response = self.post(signup(email='other@example.com', phone='1'))
+        self.assertRefused(response, 'username')
+        self.assertEqual(response.data['message'], 'A user with that username already exists.')
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_busy_hashing_pool(self):
+        with mock.patch.object(passwords, 'get_pool') as get_pool:
+            get_pool.return_value.hash.side_effect = HashingBusy
+            response = self.post(signup())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(User.objects.exists())
+
+
+class HashingPoolTests(TestCase):
+    def test_full_pool_refuses_at_once(self):
+        pool = HashingPool(workers=1, backlog=0)
+        self.addCleanup(pool.executor.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(raw_password):
+            started.set()
+            release.wait(5)
+            return 'hashed'
+
+        with mock.patch.object(passwords, 'make_password', slow_hash):
+            results = []
+            thread = threading.Thread(target=lambda: results.append(pool.hash('first')))
+            thread.start()
+            started.wait(5)
+            with self.assertRaises(HashingBusy):
+                pool.hash('second')
+            release.set()
+            thread.join()
+            self.assertEqual(results, ['hashed'])
+            self.assertEqual(pool.hash('third'), 'hashed')  # its slot is free again
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SignupRaceTests(TransactionTestCase):
+    RACERS = 4
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads need a database file (shared-cache memory databases fail fast on locks)')
+        # Room for every racer: this is about the unique constraints, not shedding load
+        pool = HashingPool(self.RACERS, 0)
+        self.addCleanup(pool.executor.shutdown)
+        self.enterContext(mock.patch.object(passwords, '_pool', pool))
+
+    def race(self, field):
+        bodies = []
+        for n in range(self.RACERS):
+            body = signup(username=f'racer{n}', email=f'racer{n}@example.com', phone=f'10000{n}')
+            if field == 'email':
+                # The constraint is case-insensitive: so must be the clash
+                body['email'] = 'SHARED@example.com' if n % 2 else 'shared@example.com'
+            else:
+                body[field] = {'username': 'shared', 'phone': '999999'}[field]
+            bodies.append(body)
+
+        barrier = threading.Barrier(self.RACERS)
+        responses, errors = [], []
+
+        def post(body):
+            try:
+                barrier.wait()
+                response = APIClient().post('/api/auth/signup/', body, format='json')
+                responses.append((response.status_code, response.data.get('error')))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post, args=(body,)) for body in bodies]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(responses), [(201, None)] + [(400, field)] * (self.RACERS - 1))
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_racing_for_a_username(self):
+        self.race('username')
+
+    def test_racing_for_an_email(self):
+        self.race('email')
+
+    def test_racing_for_a_phone(self):
+        self.race('phone')
+
+
+class UniqueEmailMigrationTests(TransactionTestCase):
+    BEFORE = [('users', '0002_user_email_verified_user_phone')]
+    AFTER = [('users', '0003_user_unique_email')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_duplicates_are_reported_before_the_constraint(self):
+        self.addCleanup(self.migrate, self.AFTER)
+        OldUser = self.migrate(self.BEFORE).get_model('users', 'User')
+        OldUser.objects.create(username='first', email='Foo@example.com')
+        second = OldUser.objects.create(username='second', email='foo@example.com')
+        OldUser.objects.create(username='admin', email='')
+        OldUser.objects.create(username='admin2', email='')
+
+        with self.assertRaisesMessage(RuntimeError, "username='first' email='Foo@example.com'") as raised:
+            self.migrate(self.AFTER)
+        self.assertIn("username='second' email='foo@example.com'", str(raised.exception))
+        self.assertNotIn('admin', str(raised.exception))
+
+        OldUser.objects.filter(pk=second.pk).update(email='second@example.com')
+        self.migrate(self.AFTER)
+        self.assertEqual(User.objects.count(), 4)
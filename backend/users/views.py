@@ -4,38 +4,56 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework import status
+from rest_framework import serializers, status
+from .passwords import HashingBusy
 from .serializers import SignupSerializer
 
+
+def signup_error(errors):
+    """One {'error': <field>, 'message': ...} response for serializer errors"""
+    if 'email' in errors:
+        return Response({'error': 'email', 'message': str(errors['email'][0])}, status=400)
+    elif 'phone' in errors:
+        return Response({'error': 'phone', 'message': str(errors['phone'][0])}, status=400)
+    elif 'username' in errors:
+        return Response({'error': 'username', 'message': str(errors['username'][0])}, status=400)
+    elif 'non_field_errors' in errors:
+        return Response({'error': 'password', 'message': str(errors['non_field_errors'][0])}, status=400)
+    
+    return Response({'error': 'general', 'message': 'Signup failed'}, status=400)
+
+
 class SignupView(APIView):
+    """
+    Validation runs no queries; the insert is the one query, and the
+    database's unique constraints answer "already registered" (see
+    SignupSerializer). Password hashing waits for a slot on a bounded pool
+    (users/passwords.py): 503 when signups outrun it.
+    """
     permission_classes = [AllowAny]
     
     def post(self, request):
         serializer = SignupSerializer(data=request.data)
         
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            # Return specific error messages
+            return signup_error(serializer.errors)
+        try:
             user = serializer.save()
-            
-            # TODO: Send verification email here
-            # send_verification_email(user)
-            
-            return Response({
-                'message': 'Account created successfully',
-                'username': user.username,
-                'email': user.email
-            }, status=status.HTTP_201_CREATED)
-        
-        # Return specific error messages
-        errors = serializer.errors
+        except serializers.ValidationError as exc:
+            # Taken username / email / phone, from the insert
+            return signup_error(exc.detail)
+        except HashingBusy:
+            return Response(
+                {'error': 'general', 'message': 'Too many signups right now, please try again'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+            )
         
-        # Format error response
-        if 'email' in errors:
-            return Response({'error': 'email', 'message': str(errors['email'][0])}, status=400)
-        elif 'phone' in errors:
-            return Response({'error': 'phone', 'message': str(errors['phone'][0])}, status=400)
-        elif 'username' in errors:
-            return Response({'error': 'username', 'message': str(errors['username'][0])}, status=400)
-        elif 'non_field_errors' in errors:
-            return Response({'error': 'password', 'message': str(errors['non_field_errors'][0])}, status=400)
+        # TODO: Send verification email here
+        # send_verification_email(user)
         
-        return Response({'error': 'general', 'message': 'Signup failed'}, status=400)
+        return Response({
+            'message': 'Account created successfully',
+            'username': user.username,
+            'email': user.email
+        }, status=status.HTTP_201_CREATED)
@@ -134,18 +134,40 @@ export default function Map() {
     loadGeoData();
   }, []);
 
-  // 2. Fetch User Progress
+  // 2. Fetch User Progress (full map first, then only the changes since our cursor)
+  const syncCursor = useRef<number | null>(null);
+
   const fetchUserProgress = useCallback(async () => {
     try {
       const token = localStorage.getItem('token');
       if (!token) return;
 
-      const res = await api.get('/locations/my-map/');
-      setVisited({
-        districts: new Set(res.data.districts),
-        states: new Set(res.data.states),
-        countries: new Set(res.data.countries)
-      });
+      const since = syncCursor.current;
+      const res = await api.get('/locations/my-map/', { params: since ? { since } : {} });
+      const data = res.data;
+
+      if (data.full) {
+        setVisited({
+          districts: new Set(data.districts),
+          states: new Set(data.states),
+          countries: new Set(data.countries)
+        });
+      } else {
+        setVisited(prev => {
+          const apply = (current: Set<string>, added: string[], removed: string[]) => {
+            const next = new Set(current);
+            removed.forEach(name => next.delete(name));
+            added.forEach(name => next.add(name));
+            return next;
+          };
+          return {
+            districts: apply(prev.districts, data.added.districts, data.removed.districts),
+            states: apply(prev.states, data.added.states, data.removed.states),
+            countries: apply(prev.countries, data.added.countries, data.removed.countries)
+          };
+        });
+      }
+      syncCursor.current = data.cursor;
 
       worldLayerKey.current++;
       statesLayerKey.current++;
@@ -0,0 +1,122 @@
+# scripts/bench_normalize.py
+# Peak-RSS / throughput benchmark for normalize_gadm.py
+#
+#   python scripts/bench_normalize.py --features 200000 --vertices 200
+#
+# Writes a synthetic GADM level-2 FeatureCollection, then normalizes it once
+# with json.load (in-memory) and once with --stream, each in a fresh process
+# so the peak RSS numbers don't contaminate each other.
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import normalize_gadm  # noqa: E402
+
+
+def write_synthetic_districts(path, n_features, n_vertices, seed=0):
+    """Write a GADM-shaped level-2 file without ever holding it in memory"""
+    rng = random.Random(seed)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"type":"FeatureCollection","name":"gadm41_SYN_2","features":[')
+        for i in range(n_features):
+            state = i // 50
+            cx, cy = rng.uniform(-170, 170), rng.uniform(-80, 80)
+            ring = []
+            for k in range(n_vertices):
+                a = 2 * math.pi * k / n_vertices
+                r = 0.2 + rng.random() * 0.05
+                ring.append([round(cx + r * math.cos(a), 6), round(cy + r * math.sin(a), 6)])
+            ring.append(ring[0])
+
+            feature = {
+                'type': 'Feature',
+                'properties': {
+                    'GID_2': f'SYN.{state}.{i}_1', 'GID_0': 'SYN', 'COUNTRY': 'Synthetica',
+                    'GID_1': f'SYN.{state}_1', 'NAME_1': f'State{state}',
+                    'NL_NAME_1': 'NA', 'NAME_2': f'District{i}', 'VARNAME_2': 'NA',
+                    'NL_NAME_2': 'NA', 'TYPE_2': 'District', 'ENGTYPE_2': 'District',
+                    'CC_2': 'NA', 'HASC_2': 'NA',
+                },
+                'geometry': {'type': 'MultiPolygon', 'coordinates': [[ring]]},
+            }
+            if i:
+                f.write(',')
+            json.dump(feature, f, separators=(',', ':'))
+        f.write(']}')
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _count_features(path):
+    return sum(1 for _ in normalize_gadm.iter_features(path))
+
+
+def _run(input_file, output_file, stream, queue):
+    # Silence the normalizer's progress output inside the benchmark
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    normalize_gadm.normalize_districts(input_file, output_file, stream=stream)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, _peak_rss_mb()))
+
+
+def measure(input_file, output_file, stream):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(input_file, output_file, stream, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark normalize_gadm streaming vs in-memory")
+    parser.add_argument('--features', type=int, default=50_000)
+    parser.add_argument('--vertices', type=int, default=100, help="Vertices per polygon ring")
+    parser.add_argument('--skip-memory', action='store_true', help="Only run the streaming mode")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, 'districts-raw.json')
+        print(f"🛠  Generating {args.features} features x {args.vertices} vertices...")
+        write_synthetic_districts(raw, args.features, args.vertices)
+        size_mb = os.path.getsize(raw) / (1024 * 1024)
+        n = _count_features(raw)
+        print(f"✓ {raw} is {size_mb:.1f} MB ({n} features)\n")
+
+        modes = [('stream', True)] if args.skip_memory else [('in-memory', False), ('stream', True)]
+        outputs = {}
+
+        print(f"{'mode':<10} {'seconds':>9} {'features/s':>12} {'peak RSS MB':>12}")
+        for label, stream in modes:
+            out = os.path.join(tmp, f'districts-{label}.json')
+            elapsed, rss = measure(raw, out, stream)
+            outputs[label] = out
+            print(f"{label:<10} {elapsed:>9.2f} {n / elapsed:>12.0f} {rss:>12.1f}")
+
+        if len(outputs) == 2:
+            with open(outputs['in-memory'], 'rb') as a, open(outputs['stream'], 'rb') as b:
+                same = a.read() == b.read()
+            print(f"\n{'✅' if same else '❌'} Outputs {'identical' if same else 'DIFFER'}")
+            return 0 if same else 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
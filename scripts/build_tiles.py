@@ -0,0 +1,384 @@
+# scripts/build_tiles.py
+# Cut the normalized layers into a z/x/y vector tile pyramid (MBTiles)
+#
+#   cd frontend && python ../scripts/build_tiles.py
+#
+# Each zoom level is simplified once per layer (simplify_gadm, so shared
+# borders stay shared), projected to Web Mercator, clipped per tile and
+# encoded as a Mapbox Vector Tile. Tiles are gzipped and written to a
+# single SQLite file following the MBTiles 1.3 layout, which the backend
+# serves from /api/tiles/<z>/<x>/<y>.pbf.
+#
+# Layers only exist from the zoom Map.tsx starts drawing them at, so the
+# district layer never ships in a country-level tile.
+import argparse
+import gzip
+import json
+import math
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+import numpy as np
+
+from simplify_gadm import MAX_ZOOM, MIN_ZOOM, ZOOM_THRESHOLDS, iter_rings, simplify_features, tolerance_for_zoom
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXTENT = 4096
+BUFFER = 64  # tile units of overlap so strokes don't clip at tile edges
+MAX_LAT = 85.0511287798
+
+# (tile layer name, input file, first zoom it is drawn at)
+DEFAULT_LAYERS = [
+    ('countries', 'public/geojson/world-countries.json', MIN_ZOOM),
+    ('states', 'public/geojson/india-states.json', ZOOM_THRESHOLDS['STATES']),
+    ('districts', 'public/geojson/india-districts.json', ZOOM_THRESHOLDS['DISTRICTS']),
+]
+DEFAULT_OUTPUT = os.path.join(ROOT, 'backend', 'data', 'mapped.mbtiles')
+
+TILE_PROPERTIES = ('name', 'level', 'country', 'region', 'gid')
+
+
+# ----------------------------------------------------------------------
+# Projection & clipping
+# ----------------------------------------------------------------------
+
+def project(ring, zoom):
+    """lon/lat ring -> (N, 2) array of Web Mercator world pixel coords at `zoom` (in tiles)"""
+    pts = np.asarray(ring, dtype=float)[:, :2]
+    n = 2 ** zoom
+    lat = np.radians(np.clip(pts[:, 1], -MAX_LAT, MAX_LAT))
+    x = (pts[:, 0] + 180.0) / 360.0 * n
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n
+    return np.column_stack([x, y])
+
+
+def _clip_edge(points, axis, bound, keep_less):
+    """
+    One Sutherland-Hodgman pass against the line coord[axis] == bound, done
+    for the whole ring at once: each vertex emits the crossing point of its
+    incoming edge (if the edge crosses) and then itself (if inside).
+    """
+    if not len(points):
+        return points
+    coord = points[:, axis]
+    inside = coord <= bound if keep_less else coord >= bound
+    prev = np.roll(points, 1, axis=0)
+    prev_in = np.roll(inside, 1)
+    cross = inside != prev_in
+    if not cross.any():
+        return points if inside.all() else points[:0]
+
+    emit = cross.astype(int) + inside
+    offsets = np.cumsum(emit) - emit
+    out = np.empty((int(emit.sum()), 2))
+
+    p, c = prev[cross], points[cross]
+    t = (bound - p[:, axis]) / (c[:, axis] - p[:, axis])
+    out[offsets[cross]] = p + t[:, None] * (c - p)
+    out[offsets[inside] + cross[inside]] = points[inside]
+    return out
+
+
+def clip_ring(points, lo, hi, axes=(0, 1)):
+    """Clip a closed ring ((N, 2) array, no closing point) to [lo, hi] on each axis"""
+    for axis in axes:
+        points = _clip_edge(points, axis, lo, keep_less=False)
+        points = _clip_edge(points, axis, hi, keep_less=True)
+    return points
+
+
+def ring_area(points):
+    """Shoelace area in tile coordinates (y down)"""
+    area = 0
+    for i in range(len(points)):
+        x1, y1 = points[i - 1]
+        x2, y2 = points[i]
+        area += x1 * y2 - x2 * y1
+    return area / 2
+
+
+# ----------------------------------------------------------------------
+# Mapbox Vector Tile encoding (spec v2.1)
+# ----------------------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def encode_polygon(rings):
+    """Geometry command stream for a list of rings in integer tile coords"""
+    commands = []
+    cx = cy = 0
+    for ring in rings:
+        commands.append((1 & 0x7) | (1 << 3))          # MoveTo, 1 point
+        x, y = ring[0]
+        commands += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append((2 & 0x7) | ((len(ring) - 1) << 3))  # LineTo
+        for x, y in ring[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+        commands.append(7 | (1 << 3))                  # ClosePath
+    return commands
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int) and value >= 0:
+        return _key(5, 0) + _varint(value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+def encode_layer(name, features):
+    """features: list of (properties, rings). Returns the serialized Layer message"""
+    keys, values = {}, {}
+    body = bytearray()
+
+    for props, rings in features:
+        tags = []
+        for k in TILE_PROPERTIES:
+            v = props.get(k)
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v).__name__, v), len(values)))
+
+        feature = _packed(2, tags) + _key(3, 0) + _varint(3) + _packed(4, encode_polygon(rings))
+        body += _bytes_field(2, feature)
+
+    layer = _key(15, 0) + _varint(2) + _bytes_field(1, name.encode('utf-8')) + bytes(body)
+    for k in keys:
+        layer += _bytes_field(3, k.encode('utf-8'))
+    for _, v in values:
+        layer += _bytes_field(4, _value(v))
+    layer += _key(5, 0) + _varint(EXTENT)
+    return layer
+
+
+# ----------------------------------------------------------------------
+# Tiling
+# ----------------------------------------------------------------------
+
+def _tile_ring(ring, exterior):
+    """Round a clipped ring to integer tile coords and orient it (None if degenerate)"""
+    local = np.rint(ring).astype(int)
+    if len(local) > 1:
+        # Drop repeated points (rounding often produces them)
+        keep = np.any(local != np.roll(local, 1, axis=0), axis=1)
+        local = local[keep]
+    if len(local) < 3:
+        return None
+    out = [tuple(p) for p in local.tolist()]
+    area = ring_area(out)
+    if area == 0:
+        return None
+    # Exterior rings positive area, holes negative
+    if (area > 0) != exterior:
+        out.reverse()
+    return out
+
+
+def tile_feature(feature, zoom, tiles, layer):
+    """Clip one feature into every tile it touches at `zoom`, adding to tiles[(x, y)][layer]"""
+    geometry = feature['geometry']
+    if geometry is None:
+        return
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+
+    n = 2 ** zoom
+    pad = BUFFER / EXTENT
+    lo, hi = -BUFFER, EXTENT + BUFFER
+    found = {}
+
+    for polygon in polygons:
+        # World coords scaled so that one tile spans EXTENT units
+        rings = []
+        for ring in polygon:
+            pts = project(ring, zoom) * EXTENT
+            if len(pts) > 1 and (pts[0] == pts[-1]).all():
+                pts = pts[:-1]
+            rings.append(pts)
+
+        x0, y0 = np.floor(rings[0].min(axis=0) / EXTENT - pad).astype(int)
+        x1, y1 = np.floor(rings[0].max(axis=0) / EXTENT + pad).astype(int)
+
+        # Clip to each column strip first, then each strip into rows, so
+        # every ring is scanned once per column instead of once per tile
+        for tx in range(max(x0, 0), min(x1, n - 1) + 1):
+            column = [clip_ring(r - (tx * EXTENT, 0), lo, hi, axes=(0,)) for r in rings]
+            if not len(column[0]):
+                continue
+            for ty in range(max(y0, 0), min(y1, n - 1) + 1):
+                exterior = _tile_ring(clip_ring(column[0] - (0, ty * EXTENT), lo, hi, axes=(1,)), True)
+                if exterior is None:
+                    continue
+                parts = [exterior]
+                for hole in column[1:]:
+                    if len(hole):
+                        part = _tile_ring(clip_ring(hole - (0, ty * EXTENT), lo, hi, axes=(1,)), False)
+                        if part is not None:
+                            parts.append(part)
+                found.setdefault((tx, ty), []).extend(parts)
+
+    if found:
+        props = {k: feature['properties'].get(k) for k in TILE_PROPERTIES}
+        for key, rings in found.items():
+            tiles.setdefault(key, {}).setdefault(layer, []).append((props, rings))
+
+
+# ----------------------------------------------------------------------
+# MBTiles
+# ----------------------------------------------------------------------
+
+def open_mbtiles(path):
+    """
+    A fresh archive at `path` (a scratch file: build() renames it into place).
+    Journaling is off for speed, so the file is only valid once closed.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+        CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+    """)
+    return db
+
+
+def write_metadata(db, layers, minzoom, maxzoom, bounds):
+    vector_layers = [
+        {'id': name, 'minzoom': max(first, minzoom), 'maxzoom': maxzoom,
+         'fields': {k: ('Number' if k == 'level' else 'String') for k in TILE_PROPERTIES}}
+        for name, _, first in layers
+    ]
+    metadata = {
+        'name': 'mapped',
+        'format': 'pbf',
+        'type': 'overlay',
+        'version': str(int(time.time())),
+        'minzoom': str(minzoom),
+        'maxzoom': str(maxzoom),
+        'bounds': ','.join(f'{b:.6f}' for b in bounds),
+        'center': f'{(bounds[0] + bounds[2]) / 2:.6f},{(bounds[1] + bounds[3]) / 2:.6f},{minzoom}',
+        'json': json.dumps({'vector_layers': vector_layers}),
+    }
+    db.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)', metadata.items())
+
+
+def build(layers, output, minzoom=MIN_ZOOM, maxzoom=MAX_ZOOM):
+    loaded = []
+    bounds = [180, 90, -180, -90]
+    for name, path, first in layers:
+        print(f"📥 Reading {path}...")
+        with open(path, 'r', encoding='utf-8') as f:
+            features = json.load(f)['features']
+        for feature in features:
+            for ring in iter_rings(feature['geometry']):
+                arr = np.asarray(ring)[:, :2]
+                bounds[0], bounds[1] = min(bounds[0], arr[:, 0].min()), min(bounds[1], arr[:, 1].min())
+                bounds[2], bounds[3] = max(bounds[2], arr[:, 0].max()), max(bounds[3], arr[:, 1].max())
+        loaded.append((name, features, first))
+
+    # Built beside the live archive and renamed over it once complete: the
+    # tile server may be reading the old one, and never sees a half-built file
+    tmp = output + '.tmp'
+    db = open_mbtiles(tmp)
+    try:
+        total_tiles, total_bytes = write_tiles(db, loaded, layers, minzoom, maxzoom, bounds)
+        db.execute('VACUUM')
+        db.close()
+        os.replace(tmp, output)
+    except BaseException:
+        db.close()
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    print(f"\n📦 {output}: {total_tiles:,} tiles, {total_bytes:,} bytes of tile data")
+
+
+def write_tiles(db, loaded, layers, minzoom, maxzoom, bounds):
+    """Tile every zoom level into `db`. Returns (tiles, bytes) written"""
+    write_metadata(db, layers, minzoom, maxzoom, bounds)
+
+    print(f"\n  {'zoom':<5} {'tiles':>8} {'bytes':>12} {'seconds':>8}")
+    total_tiles = total_bytes = 0
+    for zoom in range(minzoom, maxzoom + 1):
+        start = time.perf_counter()
+        tiles = {}
+        for name, features, first in loaded:
+            if zoom < first:
+                continue
+            for feature in simplify_features(features, tolerance_for_zoom(zoom)):
+                tile_feature(feature, zoom, tiles, name)
+
+        size = 0
+        rows = []
+        for (tx, ty), tile_layers in tiles.items():
+            data = b''.join(_bytes_field(3, encode_layer(n, fs)) for n, fs in tile_layers.items())
+            blob = gzip.compress(data, mtime=0)
+            size += len(blob)
+            # MBTiles stores rows in TMS order (y flipped)
+            rows.append((zoom, tx, (2 ** zoom - 1) - ty, blob))
+        db.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', rows)
+        db.commit()
+
+        total_tiles += len(rows)
+        total_bytes += size
+        print(f"  z{zoom:<4} {len(rows):>8,} {size:>12,} {time.perf_counter() - start:>8.1f}")
+    return total_tiles, total_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an MBTiles vector tile pyramid from the normalized layers")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--minzoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--maxzoom', type=int, default=MAX_ZOOM)
+    args = parser.parse_args(argv)
+
+    layers = [(name, path, first) for name, path, first in DEFAULT_LAYERS if os.path.exists(path)]
+    if not layers:
+        print("❌ No normalized layers found - run normalize_gadm.py first (from frontend/)")
+        return 1
+
+    build(layers, args.output, args.minzoom, args.maxzoom)
+    print("✅ Done")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+#!/bin/bash
+# scripts/db/init-primary.sh
+# Run once by the postgres image when the primary's data directory is
+# created (docker-compose.db.yml): a role the replica streams WAL with.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-SQL
+    CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '$REPLICATION_PASSWORD';
+SQL
+
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,172 @@
+# scripts/loadtest.py
+# Requests/sec and latency percentiles under concurrent keep-alive clients
+#
+#   python scripts/loadtest.py --token $JWT \
+#       --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001 \
+#       --path /api/locations/my-map/ --concurrency 1,16,64,256 --duration 15
+#
+# Start the two servers from backend/ first (see gunicorn.conf.py):
+#   gunicorn core.wsgi:application -b 127.0.0.1:8000
+#   SERVER_PROFILE=asgi gunicorn core.asgi:application -b 127.0.0.1:8001
+#
+# Each concurrency level runs against each target in turn and prints one
+# comparison table. --conditional sends the ETag from a first response as
+# If-None-Match, i.e. measures the 304 path; --method POST --body '{...}'
+# exercises writes. Plain asyncio sockets, no dependencies.
+import argparse
+import asyncio
+import json
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+
+def build_request(target, path, method, token, body, etag):
+    host = urlsplit(target).netloc
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host}', 'Connection: keep-alive', 'Accept: application/json']
+    if token:
+        lines.append(f'Authorization: Bearer {token}')
+    if etag:
+        lines.append(f'If-None-Match: {etag}')
+    payload = body.encode() if body else b''
+    if payload:
+        lines += ['Content-Type: application/json', f'Content-Length: {len(payload)}']
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + payload
+
+
+async def read_response(reader):
+    """(status, keep_alive) after consuming one response"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif status not in (204, 304):
+        await reader.read()  # body runs to EOF
+        return status, False
+    keep_alive = headers.get('connection') != 'close' and not lines[0].startswith('HTTP/1.0')
+    return status, keep_alive
+
+
+async def client(address, request, deadline, stats):
+    host, port = address
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats['latencies'].append(time.perf_counter() - start)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'] += 1
+            keep_alive = False
+            await asyncio.sleep(0.01)
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run(target, request, concurrency, duration):
+    parts = urlsplit(target)
+    address = (parts.hostname, parts.port or 80)
+    stats = {'latencies': [], 'statuses': {}, 'errors': 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(address, request, deadline, stats) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(stats['latencies'])
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': stats['errors'] + sum(n for status, n in stats['statuses'].items() if status >= 500),
+        'statuses': stats['statuses'],
+    }
+
+
+def fetch_token(target, username, password):
+    request = urllib.request.Request(
+        f'{target}/api/token/', data=json.dumps({'username': username, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)['access']
+
+
+def fetch_etag(target, path, token):
+    request = urllib.request.Request(f'{target}{path}', headers={'Authorization': f'Bearer {token}'})
+    with urllib.request.urlopen(request) as response:
+        return response.headers.get('ETag')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare req/s and latency percentiles across servers")
+    parser.add_argument('--target', action='append', required=True, help="name=base URL (repeatable)")
+    parser.add_argument('--path', default='/api/locations/my-map/')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', default=None, help="JSON request body")
+    parser.add_argument('--token', default=None, help="JWT access token")
+    parser.add_argument('--username', default=None, help="Get a token with these credentials instead")
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--concurrency', default='1,16,64,256', help="Comma-separated client counts")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run")
+    parser.add_argument('--conditional', action='store_true', help="Send If-None-Match (measure the 304 path)")
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    targets = [tuple(t.split('=', 1)) if '=' in t else (t, t) for t in args.target]
+    levels = [int(n) for n in args.concurrency.split(',')]
+
+    results = []
+    print(f"{args.method} {args.path}, {args.duration:g}s per run")
+    print(f"{'target':<10}{'clients':>8}{'req/s':>10}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'errors':>8}  statuses")
+    for concurrency in levels:
+        for name, url in targets:
+            url = url.rstrip('/')
+            token = args.token or (fetch_token(url, args.username, args.password) if args.username else None)
+            etag = fetch_etag(url, args.path, token) if args.conditional else None
+            request = build_request(url, args.path, args.method, token, args.body, etag)
+            result = asyncio.run(run(url, request, concurrency, args.duration))
+            result.update(target=name, concurrency=concurrency)
+            results.append(result)
+            statuses = ' '.join(f'{status}:{n}' for status, n in sorted(result['statuses'].items()))
+            print(
+                f"{name:<10}{concurrency:>8}{result['rps']:>10.0f}{result['p50_ms']:>9.1f}"
+                f"{result['p90_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['errors']:>8}  {statuses}"
+            )
+            sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
 # scripts/normalize_gadm.py (CLEAN VERSION - minimal fields only)
+import argparse
+import hashlib
 import json
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 COUNTRY_NAME_MAP = {
     "Republic of India": "India",
@@ -15,171 +21,444 @@ def normalize_country_name(name):
     return COUNTRY_NAME_MAP.get(name.strip(), name.strip())
 
 
-def normalize_countries(input_file, output_file):
-    """Normalize world countries - KEEP ONLY ESSENTIAL FIELDS"""
-    
-    print(f"\n📥 Reading {input_file}...")
+# ----------------------------------------------------------------------
+# Streaming I/O
+# ----------------------------------------------------------------------
+# GADM level-2 dumps for the whole world run to hundreds of MB, and
+# json.load() needs several times that in RAM. The helpers below read one
+# feature at a time and write the output collection as it goes, so peak
+# memory is bounded by the largest single feature instead of the file.
+
+READ_CHUNK = 1 << 20  # 1 MB
+_SEPARATORS = ' \t\n\r,'
+FEATURES_KEY = re.compile(r'"features"\s*:\s*\[')
+
+
+def iter_features(input_file, chunk_size=READ_CHUNK):
+    """Yield the features of a FeatureCollection one by one without loading the file"""
+    decoder = json.JSONDecoder()
+
     with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"✓ Found {len(data['features'])} features")
-    
-    normalized_features = []
-    
-    for feature in data['features']:
-        props = feature['properties']
-        
-        # Get country name
-        country_name = (props.get('NAME') or 
-                       props.get('ADMIN') or 
-                       props.get('NAME_EN'))
-        
-        if not country_name:
-            continue
-        
-        country_name = normalize_country_name(country_name)
-        
-        # ✅ ONLY KEEP WHAT WE NEED
-        new_feature = {
-            'type': 'Feature',
-            'properties': {
-                # Required fields
-                'name': country_name,
-                'level': 0,
-                'country': country_name,
-                'region': None,
-                'subregion': None,
-                'country_type': 'Country',
-                'region_type': None,
-                'subregion_type': None,
-                
-                # Useful metadata (optional but recommended)
-                'iso_a3': props.get('ISO_A3'),      # "IND"
-                'iso_a2': props.get('ISO_A2'),      # "IN"
-                'country_code': props.get('ISO_A3')
-            },
-            'geometry': feature['geometry']  # Keep the boundary
-        }
-        
-        normalized_features.append(new_feature)
-    
-    normalized_data = {
-        'type': 'FeatureCollection',
-        'features': normalized_features
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill(min_size):
+            # Drop consumed text, then read until `min_size` unread chars are buffered
+            nonlocal buf, pos, eof
+            if pos:
+                buf = buf[pos:]
+                pos = 0
+            while not eof and len(buf) < min_size:
+                chunk = f.read(max(chunk_size, min_size - len(buf)))
+                if not chunk:
+                    eof = True
+                buf += chunk
+
+        # 1. Seek to the opening bracket of the "features" array
+        while True:
+            fill(len(buf) + chunk_size)
+            match = FEATURES_KEY.search(buf)
+            if match:
+                pos = match.end()
+                break
+            if eof:
+                raise ValueError(f"{input_file}: no 'features' array found")
+            # Keep a tail in case the key straddles two chunks
+            buf = buf[-64:]
+
+        # 2. Decode array elements one at a time
+        while True:
+            while pos < len(buf) and buf[pos] in _SEPARATORS:
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"{input_file}: unterminated 'features' array")
+                fill(chunk_size)
+                continue
+            if buf[pos] == ']':
+                return
+
+            try:
+                feature, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Feature runs past the buffer - at least double what we hold
+                fill(2 * (len(buf) - pos) + chunk_size)
+                continue
+
+            pos = end
+            yield feature
+
+
+class FeatureCollectionWriter:
+    """
+    Write a FeatureCollection incrementally (same bytes as json.dump).
+
+    Features go to `<output_file>.tmp`, renamed over output_file only once
+    the collection is closed cleanly: a run that dies halfway leaves the
+    previous output (or nothing), never a truncated file that still parses.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.tmp_file = output_file + '.tmp'
+        self.count = 0
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.tmp_file, 'w', encoding='utf-8')
+        self._f.write('{"type": "FeatureCollection", "features": [')
+        return self
+
+    def write(self, feature):
+        if self.count:
+            self._f.write(', ')
+        self._f.write(json.dumps(feature, ensure_ascii=False))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                self._f.write(']}')
+                self._f.close()
+                os.replace(self.tmp_file, self.output_file)
+                return False
+            except BaseException:
+                self.discard()
+                raise
+        self.discard()
+        return False
+
+    def discard(self):
+        """Drop the partial output"""
+        self._f.close()
+        if os.path.exists(self.tmp_file):
+            os.unlink(self.tmp_file)
+
+
+# ----------------------------------------------------------------------
+# Per-feature transforms
+# ----------------------------------------------------------------------
+
+def country_feature(feature):
+    """Map a Natural Earth country feature to our minimal schema (or None to skip)"""
+    props = feature['properties']
+
+    # Get country name
+    country_name = (props.get('NAME') or 
+                   props.get('ADMIN') or 
+                   props.get('NAME_EN'))
+
+    if not country_name:
+        return None
+
+    country_name = normalize_country_name(country_name)
+
+    # ✅ ONLY KEEP WHAT WE NEED
+    return {
+        'type': 'Feature',
+        'properties': {
+            # Required fields
+            'name': country_name,
+            'level': 0,
+            'country': country_name,
+            'region': None,
+            'subregion': None,
+            'country_type': 'Country',
+            'region_type': None,
+            'subregion_type': None,
+
+            # Useful metadata (optional but recommended)
+            'iso_a3': props.get('ISO_A3'),      # "IND"
+            'iso_a2': props.get('ISO_A2'),      # "IN"
+            'country_code': props.get('ISO_A3'),
+
+            # Gazetteer key (ADM0_A3 is set even where ISO_A3 is -99)
+            'gid': props.get('ADM0_A3')
+        },
+        'geometry': feature['geometry']  # Keep the boundary
     }
-    
-    print(f"📤 Writing {len(normalized_features)} features to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(normalized_data, f, ensure_ascii=False)
-    
-    print(f"✅ Normalized {len(normalized_features)} countries")
-    return True
 
 
-def normalize_states(input_file, output_file):
-    """Normalize GADM states - KEEP ONLY ESSENTIAL FIELDS"""
-    
-    print(f"\n📥 Reading {input_file}...")
+def state_feature(feature):
+    """Map a GADM level-1 feature to our minimal schema (or None to skip)"""
+    props = feature['properties']
+
+    if not props.get('NAME_1') or not props.get('COUNTRY'):
+        return None
+
+    country_name = normalize_country_name(props['COUNTRY'])
+
+    # ✅ ONLY KEEP WHAT WE NEED
+    return {
+        'type': 'Feature',
+        'properties': {
+            'name': props['NAME_1'],
+            'level': 1,
+            'country': country_name,
+            'region': props['NAME_1'],
+            'subregion': None,
+            'country_type': 'Country',
+            'region_type': props.get('TYPE_1', 'State'),
+            'subregion_type': None,
+
+            # Useful for debugging
+            'gid': props.get('GID_1')
+        },
+        'geometry': feature['geometry']
+    }
+
+
+def district_feature(feature):
+    """Map a GADM level-2 feature to our minimal schema (or None to skip)"""
+    props = feature['properties']
+
+    if not props.get('NAME_2') or not props.get('NAME_1') or not props.get('COUNTRY'):
+        return None
+
+    country_name = normalize_country_name(props['COUNTRY'])
+
+    # ✅ ONLY KEEP WHAT WE NEED
+    return {
+        'type': 'Feature',
+        'properties': {
+            'name': props['NAME_2'],
+            'level': 2,
+            'country': country_name,
+            'region': props['NAME_1'],
+            'subregion': props['NAME_2'],
+            'country_type': 'Country',
+            'region_type': props.get('TYPE_1', 'State'),
+            'subregion_type': props.get('TYPE_2', 'District'),
+
+            # Useful for debugging
+            'gid': props.get('GID_2')
+        },
+        'geometry': feature['geometry']
+    }
+
+
+# ----------------------------------------------------------------------
+# Normalizers
+# ----------------------------------------------------------------------
+
+def stream_normalize(input_file, output_file, transform):
+    """Streaming core shared by --stream and the batch pipeline. Returns the feature count"""
+    with FeatureCollectionWriter(output_file) as writer:
+        for feature in iter_features(input_file):
+            new_feature = transform(feature)
+            if new_feature is not None:
+                writer.write(new_feature)
+    return writer.count
+
+
+def _normalize(input_file, output_file, transform, label, stream=False):
+    """Run `transform` over every feature of input_file and write the result"""
+
+    print(f"\n📥 Reading {input_file}{' (streaming)' if stream else ''}...")
+
+    if stream:
+        count = stream_normalize(input_file, output_file, transform)
+        print(f"📤 Streamed {count} features to {output_file}")
+        print(f"✅ Normalized {count} {label}")
+        return True
+
     with open(input_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    
+
     print(f"✓ Found {len(data['features'])} features")
-    
+
     normalized_features = []
-    
+
     for feature in data['features']:
-        props = feature['properties']
-        
-        if not props.get('NAME_1') or not props.get('COUNTRY'):
-            continue
-        
-        country_name = normalize_country_name(props['COUNTRY'])
-        
-        # ✅ ONLY KEEP WHAT WE NEED
-        new_feature = {
-            'type': 'Feature',
-            'properties': {
-                'name': props['NAME_1'],
-                'level': 1,
-                'country': country_name,
-                'region': props['NAME_1'],
-                'subregion': None,
-                'country_type': 'Country',
-                'region_type': props.get('TYPE_1', 'State'),
-                'subregion_type': None,
-                
-                # Useful for debugging
-                'gid': props.get('GID_1')
-            },
-            'geometry': feature['geometry']
-        }
-        
-        normalized_features.append(new_feature)
-    
+        new_feature = transform(feature)
+        if new_feature is not None:
+            normalized_features.append(new_feature)
+
     normalized_data = {
         'type': 'FeatureCollection',
         'features': normalized_features
     }
-    
+
     print(f"📤 Writing {len(normalized_features)} features to {output_file}...")
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(normalized_data, f, ensure_ascii=False)
-    
-    print(f"✅ Normalized {len(normalized_features)} states")
+
+    print(f"✅ Normalized {len(normalized_features)} {label}")
     return True
 
 
-def normalize_districts(input_file, output_file):
+def normalize_countries(input_file, output_file, stream=False):
+    """Normalize world countries - KEEP ONLY ESSENTIAL FIELDS"""
+    return _normalize(input_file, output_file, country_feature, 'countries', stream)
+
+
+def normalize_states(input_file, output_file, stream=False):
+    """Normalize GADM states - KEEP ONLY ESSENTIAL FIELDS"""
+    return _normalize(input_file, output_file, state_feature, 'states', stream)
+
+
+def normalize_districts(input_file, output_file, stream=False):
     """Normalize GADM districts - KEEP ONLY ESSENTIAL FIELDS"""
-    
-    print(f"\n📥 Reading {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"✓ Found {len(data['features'])} features")
-    
-    normalized_features = []
-    
-    for feature in data['features']:
-        props = feature['properties']
-        
-        if not props.get('NAME_2') or not props.get('NAME_1') or not props.get('COUNTRY'):
+    return _normalize(input_file, output_file, district_feature, 'districts', stream)
+
+
+# ----------------------------------------------------------------------
+# Batch pipeline (every country, every level)
+# ----------------------------------------------------------------------
+# GADM ships one file per country and level: gadm41_NPL_1.json,
+# gadm41_NPL_2.json, ... The driver below fans those out over a process
+# pool, writes <iso>-states.json / <iso>-districts.json next to a
+# manifest.json, and skips any input whose SHA-256 matches the manifest.
+
+GADM_FILE = re.compile(r'^gadm\d*_([A-Z]{3})_([12])\.json$')
+LEVELS = {
+    1: ('states', state_feature),
+    2: ('districts', district_feature),
+}
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_sha256(path, chunk_size=READ_CHUNK):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def discover_jobs(raw_dir, out_dir, countries=None):
+    """List (iso, level, input, output) for every GADM file in raw_dir"""
+    wanted = {c.upper() for c in countries} if countries else None
+    jobs = []
+
+    for filename in sorted(os.listdir(raw_dir)):
+        match = GADM_FILE.match(filename)
+        if not match:
             continue
-        
-        country_name = normalize_country_name(props['COUNTRY'])
-        
-        # ✅ ONLY KEEP WHAT WE NEED
-        new_feature = {
-            'type': 'Feature',
-            'properties': {
-                'name': props['NAME_2'],
-                'level': 2,
-                'country': country_name,
-                'region': props['NAME_1'],
-                'subregion': props['NAME_2'],
-                'country_type': 'Country',
-                'region_type': props.get('TYPE_1', 'State'),
-                'subregion_type': props.get('TYPE_2', 'District'),
-                
-                # Useful for debugging
-                'gid': props.get('GID_2')
-            },
-            'geometry': feature['geometry']
-        }
-        
-        normalized_features.append(new_feature)
-    
-    normalized_data = {
-        'type': 'FeatureCollection',
-        'features': normalized_features
+        iso, level = match.group(1), int(match.group(2))
+        if wanted is not None and iso not in wanted:
+            continue
+        label = LEVELS[level][0]
+        jobs.append({
+            'country': iso,
+            'level': level,
+            'input': os.path.join(raw_dir, filename),
+            'output': os.path.join(out_dir, f'{iso.lower()}-{label}.json'),
+        })
+
+    if wanted:
+        found = {job['country'] for job in jobs}
+        for iso in sorted(wanted - found):
+            print(f"⚠️  No GADM files for {iso} in {raw_dir}")
+
+    return jobs
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, manifest):
+    # Write-then-rename so an interrupted run never leaves a torn manifest
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def run_job(job, previous_hash=None):
+    """Normalize one country/level file. Runs inside a pool worker"""
+    start = time.perf_counter()
+    input_hash = file_sha256(job['input'])
+
+    if input_hash == previous_hash and os.path.exists(job['output']):
+        return dict(job, status='skipped', input_sha256=input_hash)
+
+    transform = LEVELS[job['level']][1]
+    # Written beside the target and renamed (FeatureCollectionWriter), so readers
+    # never see half a file; make sure a failed job leaves no .tmp behind either
+    tmp = job['output'] + '.tmp'
+    try:
+        count = stream_normalize(job['input'], job['output'], transform)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+    return dict(
+        job,
+        status='normalized',
+        input_sha256=input_hash,
+        features=count,
+        bytes=os.path.getsize(job['output']),
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+def normalize_all(raw_dir, out_dir, countries=None, workers=None, force=False):
+    """Normalize every GADM state/district file in raw_dir across a process pool"""
+
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = discover_jobs(raw_dir, out_dir, countries)
+    manifest = load_manifest(out_dir)
+    previous = manifest.get('files', {})
+
+    print(f"\n📂 {len(jobs)} GADM files in {raw_dir} -> {out_dir}")
+    if not jobs:
+        return True
+
+    results, failed = {}, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for job in jobs:
+            key = os.path.basename(job['output'])
+            prev_hash = None if force else previous.get(key, {}).get('input_sha256')
+            futures[pool.submit(run_job, job, prev_hash)] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {key}: {e}")
+                continue
+
+            if result['status'] == 'skipped':
+                # Keep the stats from the run that actually produced the file
+                result = dict(previous[key], status='skipped')
+                print(f"⏭  {key}: unchanged")
+            else:
+                print(f"✓ {key}: {result['features']} features in {result['seconds']}s")
+            results[key] = result
+
+    done = sum(1 for r in results.values() if r['status'] == 'normalized')
+    skipped = len(results) - done
+
+    # Files not touched this run (filtered out, or failed) keep their previous record
+    for key, entry in previous.items():
+        results.setdefault(key, entry)
+
+    manifest = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': {
+            key: {k: v for k, v in entry.items() if k not in ('input', 'output')}
+            for key, entry in sorted(results.items())
+        },
     }
-    
-    print(f"📤 Writing {len(normalized_features)} features to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(normalized_data, f, ensure_ascii=False)
-    
-    print(f"✅ Normalized {len(normalized_features)} districts")
-    return True
+    write_manifest(out_dir, manifest)
+
+    print(f"\n📝 Manifest: {os.path.join(out_dir, MANIFEST_NAME)}")
+    print(f"✅ {done} normalized, ⏭ {skipped} unchanged, ❌ {failed} failed")
+    return failed == 0
 
 
 def verify_consistency():
@@ -228,20 +507,49 @@ def verify_consistency():
         return False
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize GADM / Natural Earth GeoJSON")
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Parse and write features one at a time (constant memory, for huge inputs)"
+    )
+
+    parser.add_argument(
+        '--simplify', action='store_true',
+        help="Also write zoom-tiered simplified variants (see simplify_gadm.py, needs NumPy)"
+    )
+
+    batch = parser.add_argument_group('batch mode (all GADM countries)')
+    batch.add_argument('--raw-dir', help="Directory of gadm41_<ISO>_<level>.json files")
+    batch.add_argument('--out-dir', default='public/geojson', help="Where outputs and manifest.json go")
+    batch.add_argument('--countries', help="Comma-separated ISO3 codes to restrict to (e.g. IND,NPL)")
+    batch.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    batch.add_argument('--force', action='store_true', help="Re-normalize even if the input hash is unchanged")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main execution"""
-    
+
+    args = parse_args(argv)
+
     print("="*70)
     print("  GeoJSON Normalization - Minimal Fields")
     print("="*70)
     print()
+
+    if args.raw_dir:
+        countries = args.countries.split(',') if args.countries else None
+        ok = normalize_all(args.raw_dir, args.out_dir, countries, args.workers, args.force)
+        return 0 if ok else 1
     
     success = 0
     
     # Normalize all files
     if normalize_countries(
         'public/geojson/world-countries-raw.json',
-        'public/geojson/world-countries.json'
+        'public/geojson/world-countries.json',
+        stream=args.stream
     ):
         success += 1
     
@@ -249,7 +557,8 @@ def main():
     
     if normalize_states(
         'public/geojson/india-states-raw.json',
-        'public/geojson/india-states.json'
+        'public/geojson/india-states.json',
+        stream=args.stream
     ):
         success += 1
     
@@ -257,13 +566,21 @@ def main():
     
     if normalize_districts(
         'public/geojson/india-districts-raw.json',
-        'public/geojson/india-districts.json'
+        'public/geojson/india-districts.json',
+        stream=args.stream
     ):
         success += 1
     
     # Check consistency
     if success == 3:
         verify_consistency()
+
+    if success == 3 and args.simplify:
+        # Imported lazily so plain normalization keeps working without NumPy
+        import simplify_gadm
+        print("\n" + "="*70)
+        if simplify_gadm.main(simplify_gadm.DEFAULT_LAYERS) != 0:
+            return 1
     
     print("\n" + "="*70)
     print(f"✅ Completed {success}/3 tasks")
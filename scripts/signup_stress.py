@@ -0,0 +1,145 @@
+# scripts/signup_stress.py
+# Concurrent signups racing for the same username / email / phone
+#
+#   python scripts/signup_stress.py --target http://127.0.0.1:8000 --groups 60 --racers 4 --clients 32
+#
+# Each group is --racers signups sent together that clash on one field: the
+# same username, the same email (in different letter cases) or the same
+# phone, everything else distinct. Exactly one of a group must get a 201
+# and every other one a 400 naming that field; anything else (two winners,
+# a wrong field, a 500) is a failure and the exit status is 1. A 503 (the
+# password hashing pool is full) is retried with jittered exponential
+# backoff from its Retry-After, and counted. Prints the status counts and latency percentiles.
+#
+# Users are created as stress_<run>_*; the run id is printed. Plain
+# threads and urllib, no dependencies.
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+FIELDS = ('username', 'email', 'phone')
+
+
+def attempts(run, groups, racers):
+    """[(group, field, body)]: each group's racers next to each other, so they go out together"""
+    out = []
+    for g in range(groups):
+        field = FIELDS[g % len(FIELDS)]
+        for r in range(racers):
+            own = f'{run}{g:04d}{r:02d}'
+            body = {
+                'username': f'stress_{own}',
+                'email': f'stress_{own}@example.com',
+                'phone': own[-15:],
+                'password': 'stress-password',
+                'confirm_password': 'stress-password',
+            }
+            shared = f'{run}{g:04d}xx'
+            if field == 'username':
+                body['username'] = f'stress_{shared}'
+            elif field == 'email':
+                # The constraint is case-insensitive: so must be the clash
+                email = f'stress_{shared}@example.com'
+                body['email'] = email.upper() if r % 2 else email
+            else:
+                body['phone'] = shared[-15:]
+            out.append((g, field, body))
+    return out
+
+
+def post(url, body, retries, stats, lock):
+    data = json.dumps(body).encode()
+    for attempt in range(retries + 1):
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, payload, retry_after = response.status, json.load(response), None
+        except urllib.error.HTTPError as exc:
+            status, retry_after = exc.code, exc.headers.get('Retry-After')
+            try:
+                payload = json.load(exc)
+            except ValueError:
+                payload = {}
+        with lock:
+            stats['latencies'].append(time.perf_counter() - start)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        if status != 503:
+            return status, payload
+        # Back off, with jitter: retries that arrive together get shed together again
+        time.sleep(min(float(retry_after or 1) * 2 ** attempt, 10) * (0.5 + random.random()))
+    return status, payload
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Race concurrent signups on shared usernames / emails / phones")
+    parser.add_argument('--target', default='http://127.0.0.1:8000', help="Base URL of a running server")
+    parser.add_argument('--path', default='/api/auth/signup/')
+    parser.add_argument('--groups', type=int, default=60, help="Groups of clashing signups")
+    parser.add_argument('--racers', type=int, default=4, help="Signups per group")
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent requests")
+    parser.add_argument('--retries', type=int, default=10, help="Retries of a 503 before giving up")
+    args = parser.parse_args()
+
+    run = uuid.uuid4().hex[:6]
+    url = args.target.rstrip('/') + args.path
+    work = attempts(run, args.groups, args.racers)
+    stats = {'latencies': [], 'statuses': {}}
+    lock = threading.Lock()
+
+    print(f"Run {run}: {len(work)} signups in {args.groups} groups of {args.racers}, {args.clients} clients")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        futures = [
+            (group, field, pool.submit(post, url, body, args.retries, stats, lock))
+            for group, field, body in work
+        ]
+        results = [(group, field, *future.result()) for group, field, future in futures]
+    elapsed = time.perf_counter() - started
+
+    failures = []
+    by_group = {}
+    for group, field, status, payload in results:
+        by_group.setdefault((group, field), []).append((status, payload))
+    for (group, field), outcomes in sorted(by_group.items()):
+        created = sum(1 for status, _ in outcomes if status == 201)
+        if created != 1:
+            failures.append(f"group {group} ({field}): {created} signups succeeded")
+        for status, payload in outcomes:
+            if status == 201:
+                continue
+            if status == 503:
+                failures.append(f"group {group} ({field}): still 503 after {args.retries} retries")
+            elif status != 400 or payload.get('error') != field:
+                failures.append(f"group {group} ({field}): {status} {payload}")
+
+    latencies = sorted(stats['latencies'])
+    statuses = ' '.join(f'{status}:{n}' for status, n in sorted(stats['statuses'].items()))
+    print(
+        f"{len(latencies)} requests in {elapsed:.1f}s ({len(latencies) / elapsed:.1f} req/s); "
+        f"p50 {percentile(latencies, 0.50) * 1000:.0f} ms, p90 {percentile(latencies, 0.90) * 1000:.0f} ms, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms; statuses {statuses}"
+    )
+    if failures:
+        for failure in failures[:20]:
+            print(f"FAIL {failure}")
+        print(f"{len(failures)} failures")
+        sys.exit(1)
+    print("OK: one account per group, every other signup refused on the clashing field")
+
+
+if __name__ == '__main__':
+    main()
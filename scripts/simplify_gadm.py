@@ -0,0 +1,397 @@
+# scripts/simplify_gadm.py
+# Zoom-tiered geometry simplification for the normalized GeoJSON
+#
+#   cd frontend && python ../scripts/simplify_gadm.py
+#
+# For every normalized layer this writes one variant per zoom tier
+# (e.g. world-countries.z2.json, world-countries.z5.json, ...), simplified
+# with Douglas-Peucker at a tolerance of about one screen pixel for the
+# lowest zoom that tier serves.
+#
+# Neighbouring regions share their borders vertex-for-vertex, so rings are
+# cut into arcs at junctions (points where borders meet or split), the way
+# TopoJSON does. Junctions are always kept and every arc is simplified in
+# one canonical direction, so both neighbours get the exact same border
+# back and no slivers or gaps can open between them.
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# Must match ZOOM_THRESHOLDS / minZoom / maxZoom in frontend/src/components/Map.tsx
+MIN_ZOOM = 2
+MAX_ZOOM = 10
+ZOOM_THRESHOLDS = {
+    'STATES': 5,
+    'DISTRICTS': 7,
+}
+
+# Lowest zoom of each tier, per level. A layer is only drawn from its
+# threshold upwards, so there is no point in building tiers below it.
+TIERS = {
+    0: [MIN_ZOOM, ZOOM_THRESHOLDS['STATES'], ZOOM_THRESHOLDS['DISTRICTS']],
+    1: [ZOOM_THRESHOLDS['STATES'], ZOOM_THRESHOLDS['DISTRICTS']],
+    2: [ZOOM_THRESHOLDS['DISTRICTS'], MAX_ZOOM - 1],
+}
+
+TILE_SIZE = 256
+PIXEL_TOLERANCE = 1.0
+
+DEFAULT_LAYERS = [
+    'public/geojson/world-countries.json',
+    'public/geojson/india-states.json',
+    'public/geojson/india-districts.json',
+]
+
+
+def tolerance_for_zoom(zoom, pixels=PIXEL_TOLERANCE):
+    """Degrees covered by `pixels` screen pixels at `zoom` (Web Mercator, at the equator)"""
+    return pixels * 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+# ----------------------------------------------------------------------
+# Douglas-Peucker
+# ----------------------------------------------------------------------
+
+def douglas_peucker(points, epsilon):
+    """
+    Simplify an (N, 2) polyline, always keeping both endpoints.
+    Returns a boolean keep-mask. Each split step measures all the points of
+    the current span against its chord in one NumPy expression.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if n < 3:
+        return keep
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a, b = points[start], points[end]
+        span = points[start + 1:end]
+        d = b - a
+        norm = np.hypot(d[0], d[1])
+        if norm == 0:
+            # Closed run (start == end): distance from the shared endpoint
+            dist = np.hypot(span[:, 0] - a[0], span[:, 1] - a[1])
+        else:
+            dist = np.abs(d[0] * (span[:, 1] - a[1]) - d[1] * (span[:, 0] - a[0])) / norm
+
+        i = int(np.argmax(dist))
+        if dist[i] > epsilon:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+
+    return keep
+
+
+# ----------------------------------------------------------------------
+# Topology-aware ring simplification
+# ----------------------------------------------------------------------
+
+def iter_rings(geometry):
+    """Yield every ring (list of [x, y]) of a Polygon or MultiPolygon"""
+    if geometry is None:
+        return
+    if geometry['type'] == 'Polygon':
+        yield from geometry['coordinates']
+    elif geometry['type'] == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            yield from polygon
+
+
+def vertex_owners(features):
+    """Map every vertex to the frozenset of feature indexes whose rings contain it"""
+    owners = {}
+    for idx, feature in enumerate(features):
+        for ring in iter_rings(feature['geometry']):
+            for x, y in (p[:2] for p in ring):
+                owners.setdefault((x, y), set()).add(idx)
+    return {v: frozenset(s) for v, s in owners.items()}
+
+
+def ring_points(ring):
+    """Ring as a list of (x, y) tuples, without the closing point"""
+    points = [tuple(p[:2]) for p in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def find_junctions(features):
+    """
+    Vertices where borders meet or split: a point is a junction when two
+    rings pass through it with different neighbours on either side. Arcs
+    between junctions are then identical in every ring that uses them.
+    """
+    neighbours = {}
+    visits = {}
+    junctions = set()
+    rings = []
+    for feature in features:
+        for ring in iter_rings(feature['geometry']):
+            points = ring_points(ring)
+            rings.append(points)
+            n = len(points)
+            for i, p in enumerate(points):
+                a, b = points[i - 1], points[(i + 1) % n]
+                pair = (a, b) if a <= b else (b, a)
+                if neighbours.setdefault(p, pair) != pair:
+                    junctions.add(p)
+                visits[p] = visits.get(p, 0) + 1
+
+    # A ring shared whole (an enclave and the hole it fills) has no junction
+    # of its own; cut it at its smallest vertex so both copies line up.
+    for points in rings:
+        if points and not junctions.intersection(points):
+            first = min(points)
+            if visits[first] > 1:
+                junctions.add(first)
+    return junctions
+
+
+class RingSimplifier:
+    """Simplifies rings arc-by-arc, caching shared arcs so neighbours agree"""
+
+    def __init__(self, junctions, epsilon):
+        self.junctions = junctions
+        self.epsilon = epsilon
+        self.pinned = set()      # canonical arcs that must stay unsimplified
+        self.collapsed = []      # shared rings that fell below a triangle
+        self._cache = {}
+
+    @staticmethod
+    def _canonical(arc):
+        # Both neighbours traverse a shared arc in opposite directions, so
+        # always work on the lexicographically smaller orientation.
+        reverse = arc[::-1] < arc
+        return (tuple(arc[::-1]) if reverse else tuple(arc)), reverse
+
+    def split_arcs(self, points):
+        """Cut a ring (without its closing point) into arcs at junctions"""
+        n = len(points)
+        # Rotate so the ring starts on a junction. A ring without any is an
+        # unshared island: one closed arc starting at its smallest vertex.
+        start = next((i for i, p in enumerate(points) if p in self.junctions), None)
+        if start is None:
+            start = points.index(min(points))
+        points = points[start:] + points[:start]
+
+        arcs = []
+        arc = [points[0]]
+        for i in range(1, n + 1):
+            p = points[i % n]
+            arc.append(p)
+            if i == n or p in self.junctions:
+                arcs.append(arc)
+                arc = [p]
+        return arcs
+
+    def simplify_arc(self, arc):
+        key, reverse = self._canonical(arc)
+
+        kept = self._cache.get(key)
+        if kept is None:
+            if key in self.pinned:
+                kept = list(key)
+            else:
+                mask = douglas_peucker(np.asarray(key, dtype=float), self.epsilon)
+                kept = [p for p, k in zip(key, mask) if k]
+            self._cache[key] = kept
+
+        return kept[::-1] if reverse else kept
+
+    def simplify_ring(self, ring):
+        points = ring_points(ring)
+        if len(points) < 3:
+            return None
+
+        arcs = self.split_arcs(points)
+        out = []
+        for arc in arcs:
+            out.extend(self.simplify_arc(arc)[:-1])
+        out.append(out[0])
+
+        if len(out) < 4:
+            if any(p in self.junctions for p in points):
+                self.collapsed.append(arcs)
+            return None
+        return [list(p) for p in out]
+
+    def pin_collapsed(self):
+        """
+        Freeze the arcs of shared rings that collapsed. Dropping such a ring
+        would leave its neighbours' border vertices without a partner, so the
+        (sub-pixel) ring is kept as-is and so are the neighbours' arcs along it.
+        Returns True if anything new was pinned.
+        """
+        new = {self._canonical(arc)[0] for arcs in self.collapsed for arc in arcs} - self.pinned
+        self.collapsed = []
+        if not new:
+            return False
+        self.pinned |= new
+        self._cache.clear()
+        return True
+
+
+def simplify_geometry(geometry, simplifier):
+    """Return a simplified copy of a (Multi)Polygon, or None if everything collapsed"""
+    if geometry is None or geometry['type'] not in ('Polygon', 'MultiPolygon'):
+        return geometry
+
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    out = []
+    for polygon in polygons:
+        exterior = simplifier.simplify_ring(polygon[0])
+        if exterior is None:
+            continue  # Islands smaller than a pixel disappear at this zoom
+        holes = [h for h in (simplifier.simplify_ring(r) for r in polygon[1:]) if h]
+        out.append([exterior] + holes)
+
+    if not out:
+        return None
+    if geometry['type'] == 'Polygon' and len(out) == 1:
+        return {'type': 'Polygon', 'coordinates': out[0]}
+    return {'type': 'MultiPolygon', 'coordinates': out}
+
+
+def largest_ring_fallback(geometry):
+    """Keep a feature clickable when every ring collapsed: its biggest exterior, unsimplified"""
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    biggest = max(polygons, key=lambda poly: len(poly[0]))
+    return {'type': 'Polygon', 'coordinates': [biggest[0]]}
+
+
+def simplify_features(features, epsilon, junctions=None):
+    """Simplify every feature at `epsilon` degrees. Returns new feature dicts"""
+    junctions = junctions if junctions is not None else find_junctions(features)
+    simplifier = RingSimplifier(junctions, epsilon)
+
+    while True:
+        out = []
+        for feature in features:
+            geometry = simplify_geometry(feature['geometry'], simplifier)
+            if geometry is None and feature['geometry'] is not None:
+                geometry = largest_ring_fallback(feature['geometry'])
+            out.append({'type': 'Feature', 'properties': feature['properties'], 'geometry': geometry})
+
+        # Shared rings that collapsed get pinned; go again until none do
+        if not simplifier.pin_collapsed():
+            return out
+
+
+# ----------------------------------------------------------------------
+# Checks & stats
+# ----------------------------------------------------------------------
+
+def count_vertices(features):
+    return sum(len(ring) for f in features for ring in iter_rings(f['geometry']))
+
+
+def check_shared_borders(features, simplified, owners=None):
+    """
+    Verify simplified neighbours still meet: every vertex that was shared by
+    several features must survive in all of them or in none. If one side
+    keeps a border vertex the other dropped, a gap or overlap has opened.
+    Returns a list of (vertex, features_keeping_it, features_missing_it).
+    """
+    owners = owners if owners is not None else vertex_owners(features)
+    kept = vertex_owners(simplified)
+
+    problems = []
+    for vertex, keepers in kept.items():
+        shared = owners.get(vertex)
+        if not shared or len(shared) < 2 or keepers == shared:
+            continue
+        problems.append((vertex, sorted(keepers), sorted(shared - keepers)))
+    return problems
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def tier_path(input_file, zoom):
+    stem, ext = os.path.splitext(input_file)
+    return f"{stem}.z{zoom}{ext}"
+
+
+def simplify_layer(input_file, zooms=None, check=True):
+    """Write every zoom tier for one normalized layer and print a size report"""
+
+    print(f"\n📥 Reading {input_file}...")
+    with open(input_file, 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    if not features:
+        print("⚠️  No features, skipping")
+        return []
+
+    level = features[0]['properties'].get('level', 0)
+    zooms = zooms or TIERS.get(level, [MIN_ZOOM])
+    owners = vertex_owners(features)
+    junctions = find_junctions(features)
+
+    source_vertices = count_vertices(features)
+    source_bytes = len(_dumps({'type': 'FeatureCollection', 'features': features}).encode('utf-8'))
+    shared = sum(1 for s in owners.values() if len(s) > 1)
+    print(f"✓ {len(features)} features, {source_vertices:,} vertices ({shared:,} shared), level {level}")
+
+    report = []
+    print(f"\n  {'tier':<6} {'tolerance°':>11} {'vertices':>11} {'kept':>7} {'bytes':>12}  gaps")
+    print(f"  {'full':<6} {'-':>11} {source_vertices:>11,} {'100%':>7} {source_bytes:>12,}")
+
+    for zoom in zooms:
+        epsilon = tolerance_for_zoom(zoom)
+        simplified = simplify_features(features, epsilon, junctions)
+        body = _dumps({'type': 'FeatureCollection', 'features': simplified})
+
+        out = tier_path(input_file, zoom)
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write(body)
+
+        vertices = count_vertices(simplified)
+        size = len(body.encode('utf-8'))
+        gaps = len(check_shared_borders(features, simplified, owners)) if check else None
+
+        report.append({
+            'zoom': zoom, 'file': out, 'tolerance': epsilon,
+            'vertices': vertices, 'bytes': size, 'gaps': gaps,
+        })
+        gap_str = '-' if gaps is None else ('✓ 0' if gaps == 0 else f'❌ {gaps}')
+        print(f"  z{zoom:<5} {epsilon:>11.5f} {vertices:>11,} {vertices / source_vertices:>7.1%} {size:>12,}  {gap_str}")
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write zoom-tiered simplified GeoJSON layers")
+    parser.add_argument('inputs', nargs='*', help="Normalized GeoJSON files (default: the three Map.tsx layers)")
+    parser.add_argument('--zooms', help="Comma-separated tier zooms, overriding the per-level defaults")
+    parser.add_argument('--no-check', action='store_true', help="Skip the shared-border gap check")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs or [p for p in DEFAULT_LAYERS if os.path.exists(p)]
+    zooms = [int(z) for z in args.zooms.split(',')] if args.zooms else None
+
+    failed = False
+    for path in inputs:
+        report = simplify_layer(path, zooms, check=not args.no_check)
+        failed |= any(r['gaps'] for r in report)
+
+    if failed:
+        print("\n❌ Simplified borders no longer line up, see gaps column above")
+        return 1
+    print("\n✅ Done")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
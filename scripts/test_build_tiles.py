@@ -0,0 +1,122 @@
+# scripts/test_build_tiles.py
+# Tests for build_tiles.py. From the repo root:
+#   python -m unittest discover -s scripts
+import contextlib
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import build_tiles
+from test_simplify_gadm import polygon
+
+
+class EncodingTests(unittest.TestCase):
+    def test_varint(self):
+        self.assertEqual(build_tiles._varint(1), b'\x01')
+        self.assertEqual(build_tiles._varint(300), b'\xac\x02')
+
+    def test_zigzag(self):
+        self.assertEqual([build_tiles._zigzag(n) for n in (0, -1, 1, -2, 2)], [0, 1, 2, 3, 4])
+
+    def test_polygon_commands(self):
+        commands = build_tiles.encode_polygon([[(0, 0), (10, 0), (10, 10)]])
+        # MoveTo(1) 0,0  LineTo(2) +10,0 0,+10  ClosePath
+        self.assertEqual(commands, [9, 0, 0, 18, 20, 0, 0, 20, 15])
+
+    def test_layer_dedupes_keys_and_values(self):
+        props = {'name': 'Goa', 'level': 1, 'country': 'India'}
+        layer = build_tiles.encode_layer('states', [(props, [[(0, 0), (1, 0), (1, 1)]])] * 2)
+        self.assertEqual(layer.count(b'country'), 1)
+        self.assertEqual(layer.count(b'India'), 1)
+
+
+class ClippingTests(unittest.TestCase):
+    def test_ring_inside_is_untouched(self):
+        ring = np.array([[1.0, 1.0], [2.0, 1.0], [2.0, 2.0]])
+        self.assertTrue(np.array_equal(build_tiles.clip_ring(ring, 0, 10), ring))
+
+    def test_ring_outside_is_dropped(self):
+        ring = np.array([[11.0, 11.0], [12.0, 11.0], [12.0, 12.0]])
+        self.assertEqual(len(build_tiles.clip_ring(ring, 0, 10)), 0)
+
+    def test_ring_is_cut_at_the_bounds(self):
+        square = np.array([[-5.0, -5.0], [5.0, -5.0], [5.0, 5.0], [-5.0, 5.0]])
+        clipped = build_tiles.clip_ring(square, 0, 10)
+        self.assertEqual(sorted(map(tuple, clipped.tolist())), [(0.0, 0.0), (0.0, 5.0), (5.0, 0.0), (5.0, 5.0)])
+
+    def test_tile_ring_orientation_and_degenerates(self):
+        clockwise = np.array([[0.0, 0.0], [0.0, 10.0], [10.0, 10.0], [10.0, 0.0]])
+        self.assertGreater(build_tiles.ring_area(build_tiles._tile_ring(clockwise, exterior=True)), 0)
+        self.assertLess(build_tiles.ring_area(build_tiles._tile_ring(clockwise, exterior=False)), 0)
+        self.assertIsNone(build_tiles._tile_ring(np.array([[0.1, 0.1], [0.2, 0.2], [0.3, 0.1]]), True))
+
+    def test_feature_spanning_tiles(self):
+        tiles = {}
+        # Straddles the prime meridian and the equator: all four z1 tiles
+        feature = polygon('Null Island', [[-10.0, -10.0], [10.0, -10.0], [10.0, 10.0], [-10.0, 10.0], [-10.0, -10.0]])
+        build_tiles.tile_feature(feature, 1, tiles, 'countries')
+        self.assertEqual(sorted(tiles), [(0, 0), (0, 1), (1, 0), (1, 1)])
+        self.assertEqual(list(tiles[(0, 0)]), ['countries'])
+
+
+class BuildTests(unittest.TestCase):
+    def source(self, tmp):
+        source = os.path.join(tmp, 'countries.json')
+        square = polygon('Square', [[70.0, 10.0], [80.0, 10.0], [80.0, 20.0], [70.0, 20.0], [70.0, 10.0]], 0)
+        with open(source, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [square]}, f)
+        return source
+
+    def test_build_writes_mbtiles(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = self.source(tmp)
+            output = os.path.join(tmp, 'out.mbtiles')
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_tiles.build([('countries', source, 2)], output, minzoom=2, maxzoom=4)
+
+            db = sqlite3.connect(output)
+            metadata = dict(db.execute('SELECT name, value FROM metadata'))
+            zooms = dict(db.execute('SELECT zoom_level, count(*) FROM tiles GROUP BY zoom_level'))
+            blob, = db.execute('SELECT tile_data FROM tiles WHERE zoom_level = 2').fetchone()
+            db.close()
+
+        self.assertEqual((metadata['minzoom'], metadata['maxzoom']), ('2', '4'))
+        self.assertEqual(json.loads(metadata['json'])['vector_layers'][0]['id'], 'countries')
+        self.assertEqual(sorted(zooms), [2, 3, 4])
+        self.assertIn(b'Square', gzip.decompress(blob))
+
+    def test_rebuild_replaces_the_archive_whole(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = self.source(tmp)
+            output = os.path.join(tmp, 'out.mbtiles')
+            with contextlib.redirect_stdout(io.StringIO()):
+                build_tiles.build([('countries', source, 2)], output, minzoom=2, maxzoom=2)
+            # A reader of the live archive, as the tile server opens it
+            reader = sqlite3.connect(f'file:{output}?mode=ro&immutable=1', uri=True)
+            before = reader.execute('SELECT count(*) FROM tiles').fetchone()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                with mock.patch.object(build_tiles, 'write_metadata', side_effect=RuntimeError('disk full')):
+                    with self.assertRaises(RuntimeError):
+                        build_tiles.build([('countries', source, 2)], output, minzoom=2, maxzoom=3)
+                self.assertEqual(sorted(os.listdir(tmp)), ['countries.json', 'out.mbtiles'])
+
+                build_tiles.build([('countries', source, 2)], output, minzoom=2, maxzoom=3)
+            self.assertEqual(reader.execute('SELECT count(*) FROM tiles').fetchone(), before)
+            reader.close()
+
+            db = sqlite3.connect(output)
+            self.assertEqual(sorted(dict(db.execute('SELECT zoom_level, 1 FROM tiles'))), [2, 3])
+            db.close()
+            self.assertFalse(os.path.exists(output + '.tmp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# scripts/test_normalize_gadm.py
+# Tests for normalize_gadm.py. From the repo root:
+#   python -m unittest discover -s scripts
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import normalize_gadm
+
+
+def state(name, country='India', gid=None):
+    return {
+        'type': 'Feature',
+        'properties': {'NAME_1': name, 'COUNTRY': country, 'TYPE_1': 'State', 'GID_1': gid or f'IND.{name}'},
+        'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 0]]]},
+    }
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write_json(self, name, data):
+        with open(self.path(name), 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        return self.path(name)
+
+
+class StreamingTests(TempDirTestCase):
+    def test_iter_features_matches_json_load(self):
+        features = [state(f'State {n}') for n in range(50)]
+        raw = self.write_json('raw.json', {'type': 'FeatureCollection', 'features': features})
+        # A tiny chunk size forces features across buffer boundaries
+        self.assertEqual(list(normalize_gadm.iter_features(raw, chunk_size=7)), features)
+
+    def test_iter_features_empty_array(self):
+        raw = self.write_json('raw.json', {'type': 'FeatureCollection', 'features': []})
+        self.assertEqual(list(normalize_gadm.iter_features(raw)), [])
+
+    def test_iter_features_without_features_array(self):
+        raw = self.write_json('raw.json', {'type': 'Feature'})
+        with self.assertRaises(ValueError):
+            list(normalize_gadm.iter_features(raw))
+
+    def test_iter_features_truncated_input(self):
+        with open(self.path('raw.json'), 'w', encoding='utf-8') as f:
+            f.write('{"type": "FeatureCollection", "features": [{"type": "Feature"}, ')
+        with self.assertRaises(ValueError):
+            list(normalize_gadm.iter_features(self.path('raw.json')))
+
+    def test_stream_output_matches_in_memory_output(self):
+        features = [state('Kerala'), state('Goa'), {'type': 'Feature', 'properties': {}, 'geometry': None}]
+        raw = self.write_json('raw.json', {'type': 'FeatureCollection', 'features': features})
+        normalize_gadm.normalize_states(raw, self.path('memory.json'))
+        normalize_gadm.normalize_states(raw, self.path('stream.json'), stream=True)
+        with open(self.path('memory.json'), 'rb') as a, open(self.path('stream.json'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        with open(self.path('stream.json'), encoding='utf-8') as f:
+            names = [feature['properties']['name'] for feature in json.load(f)['features']]
+        self.assertEqual(names, ['Kerala', 'Goa'])
+
+    def test_failed_stream_leaves_no_output(self):
+        raw = self.write_json('raw.json', {'type': 'FeatureCollection', 'features': [state('Kerala'), state('Goa')]})
+
+        def explode(feature):
+            if feature['properties']['NAME_1'] == 'Goa':
+                raise RuntimeError('boom')
+            return normalize_gadm.state_feature(feature)
+
+        with self.assertRaises(RuntimeError):
+            normalize_gadm.stream_normalize(raw, self.path('out.json'), explode)
+        self.assertEqual(os.listdir(self.dir), ['raw.json'])
+
+    def test_failed_stream_keeps_previous_output(self):
+        out = self.write_json('out.json', {'type': 'FeatureCollection', 'features': []})
+        with self.assertRaises(RuntimeError):
+            with normalize_gadm.FeatureCollectionWriter(out) as writer:
+                writer.write({'type': 'Feature'})
+                raise RuntimeError('boom')
+        with open(out, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'type': 'FeatureCollection', 'features': []})
+        self.assertFalse(os.path.exists(out + '.tmp'))
+
+
+class BatchTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.raw = self.path('raw')
+        self.out = self.path('out')
+        os.makedirs(self.raw)
+        for iso in ('IND', 'NPL'):
+            self.write_json(f'raw/gadm41_{iso}_1.json', {
+                'type': 'FeatureCollection', 'features': [state(f'{iso} a', iso), state(f'{iso} b', iso)],
+            })
+        self.write_json('raw/notes.json', {})
+
+    def manifest(self):
+        with open(os.path.join(self.out, normalize_gadm.MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_discover_jobs(self):
+        jobs = normalize_gadm.discover_jobs(self.raw, self.out)
+        self.assertEqual([(job['country'], job['level']) for job in jobs], [('IND', 1), ('NPL', 1)])
+        self.assertEqual(os.path.basename(jobs[0]['output']), 'ind-states.json')
+        only = normalize_gadm.discover_jobs(self.raw, self.out, countries=['npl'])
+        self.assertEqual([job['country'] for job in only], ['NPL'])
+
+    def test_normalize_all_then_skip_unchanged(self):
+        self.assertTrue(normalize_gadm.normalize_all(self.raw, self.out, workers=2))
+        files = self.manifest()['files']
+        self.assertEqual(sorted(files), ['ind-states.json', 'npl-states.json'])
+        self.assertEqual(files['ind-states.json']['status'], 'normalized')
+        self.assertEqual(files['ind-states.json']['features'], 2)
+
+        self.assertTrue(normalize_gadm.normalize_all(self.raw, self.out, workers=2))
+        files = self.manifest()['files']
+        self.assertEqual(files['ind-states.json']['status'], 'skipped')
+        self.assertEqual(files['ind-states.json']['features'], 2)
+
+        self.assertTrue(normalize_gadm.normalize_all(self.raw, self.out, workers=2, force=True))
+        self.assertEqual(self.manifest()['files']['ind-states.json']['status'], 'normalized')
+
+    def test_failed_job_is_reported_and_cleaned_up(self):
+        with open(self.path('raw/gadm41_NPL_1.json'), 'w', encoding='utf-8') as f:
+            f.write('{"type": "FeatureCollection", "features": [{"type": ')
+        self.assertFalse(normalize_gadm.normalize_all(self.raw, self.out, workers=2))
+        self.assertEqual(sorted(os.listdir(self.out)), ['ind-states.json', normalize_gadm.MANIFEST_NAME])
+        self.assertEqual(sorted(self.manifest()['files']), ['ind-states.json'])
+
+    def test_run_job_failure_leaves_no_tmp(self):
+        job = normalize_gadm.discover_jobs(self.raw, self.out)[0]
+        os.makedirs(self.out)
+        with open(job['input'], 'w', encoding='utf-8') as f:
+            f.write('{"features": [')
+        with self.assertRaises(ValueError):
+            normalize_gadm.run_job(job)
+        self.assertEqual(os.listdir(self.out), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# scripts/test_simplify_gadm.py
+# Tests for simplify_gadm.py. From the repo root:
+#   python -m unittest discover -s scripts
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import simplify_gadm
+
+
+def polygon(name, ring, level=1):
+    return {'type': 'Feature', 'properties': {'name': name, 'level': level},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+
+def neighbours(wiggle=0.001, steps=200):
+    """Two squares sharing a finely wiggled border along x = 1"""
+    border = [[1.0 + (wiggle if i % 2 else 0.0), i / steps] for i in range(steps + 1)]
+    west = [[0.0, 0.0]] + border + [[0.0, 1.0], [0.0, 0.0]]
+    east = [[2.0, 0.0], [2.0, 1.0]] + border[::-1] + [[2.0, 0.0]]
+    return [polygon('West', west), polygon('East', east)]
+
+
+class DouglasPeuckerTests(unittest.TestCase):
+    def test_straight_line_keeps_endpoints_only(self):
+        points = np.array([[x, 0.0] for x in range(10)])
+        self.assertEqual(simplify_gadm.douglas_peucker(points, 0.1).tolist(), [True] + [False] * 8 + [True])
+
+    def test_keeps_points_beyond_tolerance(self):
+        points = np.array([[0, 0], [1, 0.5], [2, 1.0], [3, 0.5], [4, 0]], dtype=float)
+        self.assertEqual(simplify_gadm.douglas_peucker(points, 0.1).tolist(), [True, False, True, False, True])
+
+    def test_short_input(self):
+        self.assertEqual(simplify_gadm.douglas_peucker(np.array([[0.0, 0.0], [1.0, 1.0]]), 1).tolist(), [True, True])
+
+    def test_tolerance_halves_per_zoom(self):
+        self.assertAlmostEqual(simplify_gadm.tolerance_for_zoom(0), 360 / 256)
+        self.assertAlmostEqual(simplify_gadm.tolerance_for_zoom(5), simplify_gadm.tolerance_for_zoom(4) / 2)
+
+
+class TopologyTests(unittest.TestCase):
+    def test_shared_border_stays_shared(self):
+        features = neighbours()
+        simplified = simplify_gadm.simplify_features(features, epsilon=0.01)
+        self.assertLess(simplify_gadm.count_vertices(simplified), simplify_gadm.count_vertices(features) / 10)
+        self.assertEqual(simplify_gadm.check_shared_borders(features, simplified), [])
+
+    def test_check_reports_a_torn_border(self):
+        features = neighbours()
+        torn = json.loads(json.dumps(features))
+        del torn[0]['geometry']['coordinates'][0][5]
+        problems = simplify_gadm.check_shared_borders(features, torn)
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0][1:], ([1], [0]))
+
+    def test_sub_pixel_island_falls_back_to_its_ring(self):
+        island = [[5.0, 5.0], [5.0001, 5.0], [5.0001, 5.0001], [5.0, 5.0001], [5.0, 5.0]]
+        out = simplify_gadm.simplify_features([polygon('Islet', island)], epsilon=1.0)
+        self.assertEqual(out[0]['geometry'], {'type': 'Polygon', 'coordinates': [island]})
+
+    def test_features_without_geometry_pass_through(self):
+        feature = {'type': 'Feature', 'properties': {'name': 'Nowhere'}, 'geometry': None}
+        self.assertIsNone(simplify_gadm.simplify_features([feature], epsilon=1.0)[0]['geometry'])
+
+
+class LayerTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        self.input = os.path.join(self._tmp.name, 'states.json')
+
+    def test_writes_one_file_per_tier(self):
+        with open(self.input, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': neighbours()}, f)
+        report = simplify_gadm.simplify_layer(self.input, zooms=[2, 12])
+        self.assertEqual([r['zoom'] for r in report], [2, 12])
+        self.assertTrue(all(r['gaps'] == 0 for r in report))
+        self.assertGreater(report[1]['vertices'], report[0]['vertices'])
+        for r in report:
+            with open(simplify_gadm.tier_path(self.input, r['zoom']), encoding='utf-8') as f:
+                self.assertEqual(len(json.load(f)['features']), 2)
+
+    def test_empty_layer(self):
+        with open(self.input, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'FeatureCollection', 'features': []}, f)
+        self.assertEqual(simplify_gadm.simplify_layer(self.input), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# scripts/test_topojson_gadm.py
+# Tests for topojson_gadm.py. From the repo root:
+#   python -m unittest discover -s scripts
+import unittest
+
+import topojson_gadm
+from test_simplify_gadm import neighbours, polygon
+
+
+def decode(topology, name):
+    return topojson_gadm._decoder().to_feature_collection(topology, name)['features']
+
+
+def close_to(ring, other, tolerance):
+    return len(ring) == len(other) and all(
+        abs(a[0] - b[0]) <= tolerance and abs(a[1] - b[1]) <= tolerance for a, b in zip(ring, other)
+    )
+
+
+class EncodeTests(unittest.TestCase):
+    def test_shared_border_is_stored_once(self):
+        topology = topojson_gadm.encode({'states': neighbours(steps=20)}, quantization=10_000)
+        west, east = topology['objects']['states']['geometries']
+        west_arcs = {i if i >= 0 else ~i for i in west['arcs'][0]}
+        east_arcs = {i if i >= 0 else ~i for i in east['arcs'][0]}
+        self.assertEqual(len(west_arcs & east_arcs), 1)
+        self.assertEqual(len(topology['arcs']), 3)
+
+    def test_round_trip_within_one_grid_step(self):
+        features = neighbours(steps=20)
+        q = 10_000
+        topology = topojson_gadm.encode({'states': features}, quantization=q)
+        step = max(topology['transform']['scale'])
+        decoded = decode(topology, 'states')
+        self.assertEqual([f['properties'] for f in decoded], [f['properties'] for f in features])
+        for source, result in zip(features, decoded):
+            ring = source['geometry']['coordinates'][0]
+            out = result['geometry']['coordinates'][0]
+            # Decoded rings start at a junction: compare as sets of snapped points
+            self.assertEqual(out[0], out[-1])
+            self.assertEqual(len(out), len(ring))
+            for point in out:
+                self.assertTrue(any(close_to([point], [p], step) for p in ring), point)
+
+    def test_layers_share_one_topology(self):
+        country = polygon('Country', [[0.0, 0.0], [2.0, 0.0], [2.0, 1.0], [0.0, 1.0], [0.0, 0.0]], level=0)
+        topology = topojson_gadm.encode({'countries': [country], 'states': neighbours(steps=4)}, 1000)
+        self.assertEqual(sorted(topology['objects']), ['countries', 'states'])
+        self.assertEqual(len(decode(topology, 'countries')), 1)
+
+    def test_degenerate_ring_is_dropped(self):
+        speck = polygon('Speck', [[0.0, 0.0], [1e-9, 0.0], [1e-9, 1e-9], [0.0, 0.0]])
+        square = polygon('Square', [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]])
+        topology = topojson_gadm.encode({'layer': [speck, square]}, 1000)
+        speck_out, square_out = decode(topology, 'layer')
+        self.assertIsNone(speck_out['geometry'])
+        self.assertEqual(square_out['geometry']['type'], 'Polygon')
+
+    def test_zoom_simplifies_arcs(self):
+        features = neighbours(wiggle=0.001, steps=200)
+        full = topojson_gadm.encode({'states': features}, 100_000)
+        simplified = topojson_gadm.encode({'states': features}, 100_000, zoom=2)
+        count = lambda topology: sum(len(arc) for arc in topology['arcs'])  # noqa: E731
+        self.assertLess(count(simplified), count(full) / 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
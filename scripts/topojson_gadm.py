@@ -0,0 +1,232 @@
+# scripts/topojson_gadm.py
+# Quantized, shared-arc (TopoJSON) output for the normalized layers
+#
+#   cd frontend && python ../scripts/topojson_gadm.py
+#
+# Coordinates are snapped to a fixed integer grid over the combined bbox,
+# rings are cut into arcs at junctions (see simplify_gadm.find_junctions),
+# and each arc is stored once, delta-encoded. Every layer becomes one
+# object in a single Topology, so a border shared by two districts - or by
+# a state and the districts along it - is written exactly once.
+#
+# backend/locations/topojson.py decodes the result back to GeoJSON.
+import argparse
+import json
+import os
+import sys
+import time
+
+from simplify_gadm import RingSimplifier, find_junctions, iter_rings, ring_points, tolerance_for_zoom
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUANTIZATION = 1_000_000
+DEFAULT_LAYERS = [
+    'public/geojson/world-countries.json',
+    'public/geojson/india-states.json',
+    'public/geojson/india-districts.json',
+]
+DEFAULT_OUTPUT = 'public/geojson/mapped.topo.json'
+
+
+def layer_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def bounding_box(layers):
+    xs, ys = [], []
+    for features in layers.values():
+        for feature in features:
+            for ring in iter_rings(feature['geometry']):
+                for p in ring:
+                    xs.append(p[0])
+                    ys.append(p[1])
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def quantize_features(features, bbox, q):
+    """Snap every ring onto the q x q grid, dropping repeated and degenerate points"""
+    x0, y0, x1, y1 = bbox
+    kx = (q - 1) / (x1 - x0) if x1 > x0 else 1
+    ky = (q - 1) / (y1 - y0) if y1 > y0 else 1
+
+    def ring_q(ring):
+        out = []
+        for p in ring:
+            point = (round((p[0] - x0) * kx), round((p[1] - y0) * ky))
+            if not out or out[-1] != point:
+                out.append(point)
+        # At least 3 distinct points plus the closing one
+        return out if len(out) >= 4 else None
+
+    quantized = []
+    for feature in features:
+        geometry = feature['geometry']
+        polygons = []
+        if geometry and geometry['type'] in ('Polygon', 'MultiPolygon'):
+            source = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for polygon in source:
+                rings = [ring_q(r) for r in polygon]
+                if rings[0] is None:
+                    continue
+                polygons.append([rings[0]] + [r for r in rings[1:] if r])
+
+        if not polygons:
+            quantized_geometry = None
+        elif geometry['type'] == 'Polygon' and len(polygons) == 1:
+            quantized_geometry = {'type': 'Polygon', 'coordinates': polygons[0]}
+        else:
+            quantized_geometry = {'type': 'MultiPolygon', 'coordinates': polygons}
+        quantized.append({'properties': feature['properties'], 'geometry': quantized_geometry})
+
+    transform = {
+        'scale': [1 / kx, 1 / ky],
+        'translate': [x0, y0],
+    }
+    return quantized, transform
+
+
+class ArcIndex:
+    """Assigns each distinct arc an index; reversed arcs are referenced as ~index"""
+
+    def __init__(self, splitter, zoom=None):
+        self.splitter = splitter
+        self.zoom = zoom
+        self.arcs = []
+        self._index = {}
+
+    def ring(self, ring):
+        refs = []
+        for arc in self.splitter.split_arcs(ring_points(ring)):
+            if self.zoom is not None:
+                arc = self.splitter.simplify_arc(arc)
+            reverse = arc[::-1] < arc
+            key = tuple(arc[::-1]) if reverse else tuple(arc)
+            i = self._index.get(key)
+            if i is None:
+                i = self._index[key] = len(self.arcs)
+                self.arcs.append(key)
+            refs.append(~i if reverse else i)
+        return refs
+
+    def encoded(self):
+        """Arcs as delta-encoded integer positions"""
+        out = []
+        for arc in self.arcs:
+            px = py = 0
+            deltas = []
+            for x, y in arc:
+                deltas.append([x - px, y - py])
+                px, py = x, y
+            out.append(deltas)
+        return out
+
+
+def encode(layers, quantization=DEFAULT_QUANTIZATION, zoom=None):
+    """Build a Topology from {name: [features]}. `zoom` also simplifies arcs for that tier"""
+    bbox = bounding_box(layers)
+    quantized = {}
+    for name, features in layers.items():
+        quantized[name], transform = quantize_features(features, bbox, quantization)
+
+    all_features = [f for features in quantized.values() for f in features]
+    junctions = find_junctions(all_features)
+
+    # Tolerance in grid units for the requested tier
+    epsilon = 0
+    if zoom is not None:
+        epsilon = tolerance_for_zoom(zoom) / transform['scale'][0]
+    arc_index = ArcIndex(RingSimplifier(junctions, epsilon), zoom)
+
+    objects = {}
+    for name, features in quantized.items():
+        geometries = []
+        for feature in features:
+            geometry = feature['geometry']
+            out = {'properties': feature['properties']}
+            if geometry is None:
+                out['type'] = None
+            elif geometry['type'] == 'Polygon':
+                out['type'] = 'Polygon'
+                out['arcs'] = [arc_index.ring(r) for r in geometry['coordinates']]
+            else:
+                out['type'] = 'MultiPolygon'
+                out['arcs'] = [[arc_index.ring(r) for r in polygon] for polygon in geometry['coordinates']]
+            geometries.append(out)
+        objects[name] = {'type': 'GeometryCollection', 'geometries': geometries}
+
+    return {
+        'type': 'Topology',
+        'bbox': bbox,
+        'transform': transform,
+        'objects': objects,
+        'arcs': arc_index.encoded(),
+    }
+
+
+def _decoder():
+    # The decoder lives with the backend so Django code can read these files
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    from locations import topojson
+    return topojson
+
+
+def report(inputs, output, topology_text):
+    """Compare payload size and parse+decode time against the GeoJSON inputs"""
+    topojson = _decoder()
+
+    geo_bytes = 0
+    geo_start = time.perf_counter()
+    for path in inputs:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        geo_bytes += len(raw)
+        json.loads(raw)
+    geo_seconds = time.perf_counter() - geo_start
+
+    topo_start = time.perf_counter()
+    topology = json.loads(topology_text)
+    decoded = {name: topojson.to_feature_collection(topology, name) for name in topojson.object_names(topology)}
+    topo_seconds = time.perf_counter() - topo_start
+
+    topo_bytes = len(topology_text.encode('utf-8'))
+    print(f"\n  {'format':<10} {'bytes':>12} {'parse ms':>10}")
+    print(f"  {'GeoJSON':<10} {geo_bytes:>12,} {geo_seconds * 1000:>10.1f}")
+    print(f"  {'TopoJSON':<10} {topo_bytes:>12,} {topo_seconds * 1000:>10.1f}  (incl. decode to GeoJSON)")
+    print(f"\n📦 {output}: {geo_bytes / topo_bytes:.1f}x smaller, {len(topology['arcs']):,} arcs")
+    return decoded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the normalized layers as one quantized TopoJSON file")
+    parser.add_argument('inputs', nargs='*', help="Normalized GeoJSON layers (default: the three Map.tsx layers)")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('-q', '--quantization', type=int, default=DEFAULT_QUANTIZATION,
+                        help="Grid size per axis (default 1e6: ~40 m when the world is in the bbox)")
+    parser.add_argument('--zoom', type=int, help="Also simplify arcs for this zoom tier")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs or [p for p in DEFAULT_LAYERS if os.path.exists(p)]
+    layers = {}
+    for path in inputs:
+        print(f"📥 Reading {path}...")
+        with open(path, 'r', encoding='utf-8') as f:
+            layers[layer_name(path)] = json.load(f)['features']
+
+    topology = encode(layers, args.quantization, args.zoom)
+    text = json.dumps(topology, ensure_ascii=False, separators=(',', ':'))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    decoded = report(inputs, args.output, text)
+    for name, features in layers.items():
+        if len(decoded[name]['features']) != len(features):
+            print(f"❌ {name}: decoded {len(decoded[name]['features'])} of {len(features)} features")
+            return 1
+
+    print("✅ Round-trip decode OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())